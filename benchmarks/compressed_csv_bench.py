@@ -0,0 +1,65 @@
+"""benchmark of ingesting compressed and archived csv files
+
+The repo's data/AAPL.csv and data/SPY.csv are replicated to `nfiles`
+symbols stored as plain csv files, gzip compressed files and members
+of a zip archive. The disk footprint of each layout is reported
+together with the files parsed per second by `csv_ingester`, with
+`max_workers` threads:
+
+    python benchmarks/compressed_csv_bench.py [nfiles] [max_workers]
+"""
+import os
+import sys
+import time
+import gzip
+import shutil
+import zipfile
+import tempfile
+
+from context import ingester
+
+_DATA_DIR=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+_COLUMN_MAPPER={'Open': 'open', 'High': 'high', 'Low': 'low', 'Close': 'close', 'Volume': 'volume',}
+
+def write_layouts(root, nfiles):
+    """writes `nfiles` symbols in every layout and returns their directories"""
+    sources=[open(os.path.join(_DATA_DIR, name), 'rb').read() for name in ('AAPL.csv', 'SPY.csv')]
+    layouts={name: os.path.join(root, name) for name in ('csv', 'csv.gz', 'zip')}
+    for path in layouts.values():
+        os.mkdir(path)
+    with zipfile.ZipFile(os.path.join(layouts['zip'], 'prices.zip'), 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for i in range(nfiles):
+            content=sources[i % len(sources)]
+            with open(os.path.join(layouts['csv'], 'SYM{}.csv'.format(i)), 'wb') as f:
+                f.write(content)
+            with open(os.path.join(layouts['csv.gz'], 'SYM{}.csv.gz'.format(i)), 'wb') as f:
+                f.write(gzip.compress(content))
+            archive.writestr('SYM{}.csv'.format(i), content)
+    return layouts
+
+def disk_usage(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def files_per_sec(csv_ingester, nfiles):
+    symbols=csv_ingester._assign_sids(csv_ingester._extract_symbols())
+    start=time.perf_counter()
+    for _ in csv_ingester._read_and_convert(symbols, False):
+        pass
+    return nfiles / (time.perf_counter() - start)
+
+def main(nfiles=2000, max_workers=4):
+    root=tempfile.mkdtemp()
+    try:
+        layouts=write_layouts(root, nfiles)
+        print('files: {}, workers: {}'.format(nfiles, max_workers))
+        for name, path in layouts.items():
+            for engine in ('c', 'pyarrow'):
+                csv_ingester=ingester.csv_ingester('EXX', False, path, None, 'Date', _COLUMN_MAPPER, engine=engine,
+                                                   max_workers=max_workers, date_format='%Y-%m-%d')
+                print('{:<7} {:>8.1f} MB, engine {:<8}: {:>8,.0f} files/sec'.format(
+                    name, disk_usage(path) / 1e6, engine, files_per_sec(csv_ingester, nfiles)))
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
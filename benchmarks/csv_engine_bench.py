@@ -0,0 +1,66 @@
+"""benchmark of parsing csv files by `csv_ingester`
+
+The repo's data/AAPL.csv and data/SPY.csv are replicated to `nfiles`
+files in a temporary directory, which are parsed serially with the
+former options, i.e. inferred dates and types, and with every engine
+given an explicit date format and only the columns zipline stores:
+
+    python benchmarks/csv_engine_bench.py [nfiles]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import pandas as pd
+
+from context import ingester
+
+_DATA_DIR=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+_COLUMN_MAPPER={'Open': 'open', 'High': 'high', 'Low': 'low', 'Close': 'close', 'Volume': 'volume',}
+
+def replicate(csvdir, nfiles):
+    """copies the repo's csv files into `csvdir` until it has `nfiles` files"""
+    sources=[os.path.join(_DATA_DIR, name) for name in ('AAPL.csv', 'SPY.csv')]
+    for i in range(nfiles):
+        shutil.copyfile(sources[i % len(sources)], os.path.join(csvdir, 'SYM{}.csv'.format(i)))
+
+def former_load_csv(job):
+    """the parsing done by `csv_ingester._load_csv` before engines were added"""
+    _, _, file_path, _ = job
+    df=pd.read_csv(file_path, index_col='Date', parse_dates=True).sort_index()
+    df.rename(columns=_COLUMN_MAPPER, inplace=True)
+    df['dividend']=0
+    df['split']=1
+    return df
+
+def files_per_sec(load, csvdir, nfiles, repeat=3):
+    """returns the best throughput of `load` over `repeat` runs"""
+    jobs=[(i, 'SYM{}'.format(i), os.path.join(csvdir, 'SYM{}.csv'.format(i)), None) for i in range(nfiles)]
+    best=float('inf')
+    for _ in range(repeat):
+        start=time.perf_counter()
+        for job in jobs:
+            load(job)
+        best=min(best, time.perf_counter() - start)
+    return nfiles / best
+
+def main(nfiles=2000):
+    csvdir=tempfile.mkdtemp()
+    try:
+        replicate(csvdir, nfiles)
+        print('files: {}'.format(nfiles))
+        before=files_per_sec(former_load_csv, csvdir, nfiles)
+        print('{:<22}: {:>8,.0f} files/sec'.format('former options', before))
+        for engine in ingester.CSV_ENGINES:
+            if engine == 'pyarrow' and ingester._arrow_modules() is None:
+                continue
+            csv_ingester=ingester.csv_ingester('EXX', False, csvdir, None, 'Date', _COLUMN_MAPPER, engine=engine,
+                                               usecols=ingester.CSV_DTYPES, date_format='%Y-%m-%d')
+            after=files_per_sec(csv_ingester._load_csv, csvdir, nfiles)
+            print('{:<22}: {:>8,.0f} files/sec ({:.1f}x)'.format('engine ' + engine, after, after / before))
+    finally:
+        shutil.rmtree(csvdir)
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,224 @@
+"""end to end benchmark suite of the ingesters on synthetic universes
+
+Every scenario generates a universe of synthetic symbols with daily or
+minute bars, as plain or gzip compressed csv files or as the responses
+of a fake downloader, and ingests it by `zipline.data.bundles.ingest`
+into a temporary zipline root, so that the bcolz and sqlite writers
+are measured too. Each scenario runs in its own process, which makes
+its peak memory comparable between runs.
+
+The throughput in bars per second, the peak resident memory and the
+median and 95th percentile of the per symbol latency of reading or
+downloading are reported for every scenario. They are compared with
+the baseline stored in `benchmarks/baseline.json`, and the suite exits
+with status 1 if a scenario is worse than its baseline by more than
+the tolerance:
+
+    python benchmarks/ingest_suite.py [--scale 1] [--repeat 3] [--tolerance .25] [--only csv_daily,...]
+    python benchmarks/ingest_suite.py --update-baseline
+
+Baselines depend on the machine, so they should be recorded by
+`--update-baseline` on the machine that runs the comparison. Scenarios
+without a baseline, or run with another scale than their baseline,
+fail the suite.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import warnings
+import multiprocessing
+import numpy as np
+import pandas as pd
+from zipline.data import bundles
+from zipline.utils.calendar_utils import get_calendar
+
+from context import ingester
+
+BASELINE=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# the scenarios, mapped to the source of bars, whether they are minute
+# bars, the number of symbols, the number of bars per symbol and the
+# keyword arguments of the ingester
+SCENARIOS={
+    'csv_daily': ('csv', False, 200, 2500, {}),
+    'csv_daily_pyarrow': ('csv', False, 200, 2500, {'engine': 'pyarrow', 'date_format': '%Y-%m-%d'}),
+    'csv_gz_daily': ('csv.gz', False, 200, 2500, {}),
+    'csv_minute': ('csv', True, 10, 390 * 20, {}),
+    'direct_daily': ('direct', False, 200, 2500, {'max_workers': 8}),
+    'direct_daily_batch': ('direct', False, 200, 2500, {'max_workers': 8, 'batch_size': 50}),
+}
+
+# the latency of the fake downloader in seconds
+DOWNLOAD_LATENCY=.002
+
+# the compared metrics, mapped to 1 if higher is better and -1 if lower is better
+METRICS={'bars_per_sec': 1, 'peak_rss_mb': -1, 'latency_p50_ms': -1}
+
+def synthetic_index(calendar, every_min_bar, nbars):
+    """returns the last `nbars` sessions, or session minutes, of `calendar` until 2020"""
+    if not every_min_bar:
+        return calendar.sessions_in_range(pd.Timestamp('1995-01-03'), pd.Timestamp('2020-12-31'))[-nbars:]
+    sessions=calendar.sessions_in_range(pd.Timestamp('2015-01-02'), pd.Timestamp('2020-12-31'))
+    return calendar.sessions_minutes(sessions[-(nbars // 390 + 1)], sessions[-1])[-nbars:].tz_convert(None)
+
+def synthetic_bars(index, seed):
+    """returns a random walk of OHLCV bars on `index`"""
+    rng=np.random.default_rng(seed)
+    close=100 * np.exp(rng.standard_normal(len(index)).cumsum() * .01)
+    spread=close * .005
+    return pd.DataFrame({'open': close, 'high': close + spread, 'low': close - spread, 'close': close,
+                         'volume': rng.integers(1000, 100000, len(index))},
+                        index=pd.DatetimeIndex(index, name='date'))
+
+def fake_downloader(universe, batch_size=None):
+    """returns a downloader responding with the bars of `universe` after `DOWNLOAD_LATENCY` seconds
+
+    With a `batch_size`, it is a batch downloader responding to a list
+    of symbols after the same latency.
+    """
+    def downloader(symbol, start_date=None):
+        time.sleep(DOWNLOAD_LATENCY)
+        if isinstance(symbol, str):
+            return universe[symbol]
+        return {name: universe[name] for name in symbol}
+    if batch_size is not None:
+        downloader.batch_size=batch_size
+    return downloader
+
+def run_scenario(name, scale):
+    """generates the universe of scenario `name` and ingests it
+
+    :return: the metrics of the ingestion
+    :rtype: dict
+    """
+    # zipline warns about deprecated pandas usage on every ingestion
+    warnings.simplefilter('ignore', FutureWarning)
+    source, every_min_bar, nsymbols, nbars, options=SCENARIOS[name]
+    nsymbols=max(1, int(nsymbols * scale))
+    index=synthetic_index(get_calendar('NYSE'), every_min_bar, nbars)
+    symbols=['S{:05d}'.format(i) for i in range(nsymbols)]
+    root=tempfile.mkdtemp()
+    profiler=ingester.ingest_profiler()
+    options=dict(options)
+    try:
+        if source == 'direct':
+            universe={symbol: synthetic_bars(index, seed).assign(dividend=0., split=1.)
+                      for seed, symbol in enumerate(symbols)}
+            downloader=fake_downloader(universe, options.pop('batch_size', None))
+            bundle=ingester.direct_ingester('EXX', every_min_bar, None, downloader, symbol_list=symbols,
+                                            profiler=profiler, **options)
+        else:
+            csvdir=os.path.join(root, 'csv')
+            os.mkdir(csvdir)
+            for seed, symbol in enumerate(symbols):
+                synthetic_bars(index, seed).to_csv(os.path.join(csvdir, '{}.{}'.format(symbol, source)))
+            bundle=ingester.csv_ingester('EXX', every_min_bar, csvdir, None, profiler=profiler, **options)
+        sessions=index.normalize()
+        bundles.register('ingest_suite', bundle, calendar_name='NYSE', start_session=sessions[0],
+                         end_session=sessions[-1], minutes_per_day=390)
+        start=time.perf_counter()
+        bundles.ingest('ingest_suite', dict(os.environ, ZIPLINE_ROOT=root), show_progress=False)
+        wall=time.perf_counter() - start
+    finally:
+        bundles.unregister('ingest_suite')
+        shutil.rmtree(root)
+    report=profiler.report()
+    stage='download' if source == 'direct' else 'read'
+    latencies=[stages[stage]['wall'] * 1000 for stages in report['symbols'].values() if stage in stages]
+    return {'scale': scale, 'bars': nsymbols * len(index), 'wall': wall,
+            'bars_per_sec': nsymbols * len(index) / wall,
+            'peak_rss_mb': None if report['peak_rss'] is None else report['peak_rss'] / 2**20,
+            'latency_p50_ms': float(np.percentile(latencies, 50)),
+            'latency_p95_ms': float(np.percentile(latencies, 95))}
+
+def best_of(name, scale, repeat):
+    """runs scenario `name` `repeat` times, each in a new process, and keeps the best value of every metric"""
+    context=multiprocessing.get_context('spawn')
+    runs=[]
+    for _ in range(repeat):
+        with context.Pool(1) as pool:
+            runs.append(pool.apply(run_scenario, (name, scale)))
+    best=dict(runs[0])
+    for metric, direction in list(METRICS.items()) + [('wall', -1), ('latency_p95_ms', -1)]:
+        values=[run[metric] for run in runs if run[metric] is not None]
+        if values:
+            best[metric]=max(values) if direction > 0 else min(values)
+    return best
+
+def regressions(results, baseline, tolerance):
+    """returns the description of every metric worse than its baseline by more than `tolerance`
+
+    A scenario without a baseline, or with a baseline recorded at another
+    scale, cannot be compared and is reported as a failure too.
+    """
+    failures=[]
+    for name, result in results.items():
+        expected=baseline.get(name)
+        if expected is None:
+            failures.append('{}: no baseline, record one with --update-baseline'.format(name))
+            continue
+        if expected.get('scale') != result['scale']:
+            failures.append('{}: the baseline is at scale {}, not {}'.format(name, expected.get('scale'), result['scale']))
+            continue
+        for metric, direction in METRICS.items():
+            value, reference=result.get(metric), expected.get(metric)
+            if value is None or reference is None:
+                continue
+            if (direction > 0 and value < reference * (1 - tolerance)) or \
+               (direction < 0 and value > reference * (1 + tolerance)):
+                failures.append('{}: {} is {:,.1f}, the baseline is {:,.1f}'.format(name, metric, value, reference))
+    return failures
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='end to end benchmark suite of the ingesters')
+    parser.add_argument('--scale', type=float, default=1., help='the factor applied to the number of symbols')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of runs of every scenario')
+    parser.add_argument('--tolerance', type=float, default=.25, help='the relative regression that fails the suite')
+    parser.add_argument('--only', help='the comma separated scenarios to run')
+    parser.add_argument('--baseline', default=BASELINE, help='the baseline file')
+    parser.add_argument('--update-baseline', action='store_true', help='stores the results as the baseline')
+    args=parser.parse_args(argv)
+    names=args.only.split(',') if args.only else list(SCENARIOS)
+    unknown=set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: {}'.format(', '.join(sorted(unknown))))
+
+    results={}
+    print('{:<18} {:>10} {:>8} {:>13} {:>10} {:>9} {:>9}'.format('scenario', 'bars', 'wall s', 'bars/sec', 'rss MB',
+                                                                 'p50 ms', 'p95 ms'))
+    for name in names:
+        result=results[name]=best_of(name, args.scale, args.repeat)
+        print('{:<18} {:>10,} {:>8.2f} {:>13,.0f} {:>10.0f} {:>9.2f} {:>9.2f}'.format(
+            name, result['bars'], result['wall'], result['bars_per_sec'], result['peak_rss_mb'] or 0,
+            result['latency_p50_ms'], result['latency_p95_ms']))
+
+    baseline={}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline=json.load(f)
+    if args.update_baseline:
+        baseline.setdefault('scenarios', {}).update(results)
+        baseline['machine']={'platform': platform.platform(), 'python': platform.python_version(),
+                             'cpus': os.cpu_count()}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('baseline written to {}'.format(args.baseline))
+        return 0
+    if not baseline:
+        print('no baseline in {}, run with --update-baseline to record one'.format(args.baseline))
+        return 0
+    failures=regressions(results, baseline.get('scenarios', {}), args.tolerance)
+    for failure in failures:
+        print('REGRESSION ' + failure)
+    if failures:
+        return 1
+    print('no regression beyond {:.0%} of the baseline'.format(args.tolerance))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
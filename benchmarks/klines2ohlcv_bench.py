@@ -0,0 +1,51 @@
+"""micro-benchmark of converting binance klines into OHLCV dataframes
+
+It compares the per-kline conversion, which was used by
+`binance.klines2ohlcv` before, with the vectorized one on synthetic
+1-minute klines, and reports rows per second:
+
+    python benchmarks/klines2ohlcv_bench.py [nklines]
+"""
+import sys
+import time
+import pandas as pd
+
+from context import ingester # noqa: F401, makes lib importable
+import lib.binance as binance
+
+def klines2ohlcv_per_kline(klines):
+    """the former conversion building one Timestamp and five floats per kline"""
+    ohlcv=[(pd.Timestamp(l[0], unit='ms'), float(l[1]), float(l[2]), float(l[3]), float(l[4]), float(l[5]))
+           for l in klines]
+    df=pd.DataFrame(ohlcv, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
+    df.set_index('date', inplace=True)
+    return df
+
+def synthetic_klines(nklines, start=1577836800000):
+    """returns `nklines` synthetic 1-minute klines as returned by python-binance"""
+    return [[t, '{:.2f}'.format(t / 1e8), '{:.2f}'.format(t / 1e8 + 2), '{:.2f}'.format(t / 1e8 - 2),
+             '{:.2f}'.format(t / 1e8 + 1), '{:.4f}'.format(t % 977), t + 59999, '123.4', 10, '1.5', '2.5', '0']
+            for t in range(start, start + nklines * 60000, 60000)]
+
+def rows_per_sec(convert, klines, repeat=3):
+    """returns the best throughput of `convert` over `repeat` runs"""
+    best=min(timeit(convert, klines) for _ in range(repeat))
+    return len(klines) / best
+
+def timeit(convert, klines):
+    start=time.perf_counter()
+    convert(klines)
+    return time.perf_counter() - start
+
+def main(nklines=500000):
+    klines=synthetic_klines(nklines)
+    before=rows_per_sec(klines2ohlcv_per_kline, klines)
+    after=rows_per_sec(binance.klines2ohlcv, klines)
+    extra=rows_per_sec(lambda k: binance.klines2ohlcv(k, extra_fields=True), klines)
+    print('klines: {}'.format(nklines))
+    print('per-kline conversion : {:>12,.0f} rows/sec'.format(before))
+    print('vectorized conversion: {:>12,.0f} rows/sec ({:.1f}x)'.format(after, after / before))
+    print('  with extra fields  : {:>12,.0f} rows/sec'.format(extra))
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
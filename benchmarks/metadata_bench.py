@@ -0,0 +1,53 @@
+"""benchmark of building asset metadata for a large universe
+
+It compares assigning one row per symbol into a preallocated
+dataframe, as the ingesters did before with the removed
+`create_metadata`, copied below, with `metadata_accumulator`:
+
+    python benchmarks/metadata_bench.py [nsymbols]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from context import ingester
+
+def create_metadata(nsymbols):
+    """the metadata dataframe of `nsymbols` rows the ingesters filled row by row"""
+    return pd.DataFrame(np.empty(nsymbols, dtype=[
+        ('start_date', 'datetime64[ns]'),
+        ('end_date', 'datetime64[ns]'),
+        ('auto_close_date', 'datetime64[ns]'),
+        ('symbol', 'object'),
+        ('exchange', 'object'),]))
+
+def per_row(symbols, dates):
+    df=create_metadata(len(symbols))
+    for symbol_index, (symbol, (start, end)) in enumerate(zip(symbols, dates)):
+        df.iloc[symbol_index]=start, end, end + pd.Timedelta(days=1), symbol, 'EXX'
+    return df
+
+def accumulated(symbols, dates):
+    metadata=ingester.metadata_accumulator(symbols, 'EXX')
+    for symbol_index, (start, end) in enumerate(dates):
+        metadata.update(symbol_index, start, end)
+    return metadata.to_frame()
+
+def timeit(build, *args):
+    start=time.perf_counter()
+    build(*args)
+    return time.perf_counter() - start
+
+def main(nsymbols=50000):
+    symbols=['SYM{}'.format(i) for i in range(nsymbols)]
+    first=pd.Timestamp('2010-01-04')
+    dates=[(first + pd.Timedelta(days=i % 100), first + pd.Timedelta(days=3000 + i % 100)) for i in range(nsymbols)]
+    before=timeit(per_row, symbols, dates)
+    after=timeit(accumulated, symbols, dates)
+    print('symbols: {}'.format(nsymbols))
+    print('per-row iloc assignment: {:8.3f} s ({:>12,.0f} symbols/sec)'.format(before, nsymbols / before))
+    print('metadata_accumulator   : {:8.3f} s ({:>12,.0f} symbols/sec, {:.0f}x)'.format(after, nsymbols / after, before / after))
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
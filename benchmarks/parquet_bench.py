@@ -0,0 +1,62 @@
+"""benchmark of reading minute bars from csv and columnar files
+
+Synthetic 1-minute bars of `nyears` years are written as csv, parquet
+and feather files of a single symbol, which are then read the way
+`csv_ingester` and `parquet_ingester` do:
+
+    python benchmarks/parquet_bench.py [nyears]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from context import ingester, columnar
+
+def synthetic_minute_bars(nyears):
+    """returns 390 bars per business day over `nyears` years"""
+    days=pd.bdate_range('2010-01-04', periods=252 * nyears)
+    index=(days.repeat(390) + pd.to_timedelta(np.tile(np.arange(390), len(days)) + 870, unit='min'))
+    rng=np.random.default_rng(0)
+    close=100 + rng.standard_normal(len(index)).cumsum() * .01
+    return pd.DataFrame({'open': close, 'high': close + .05, 'low': close - .05, 'close': close,
+                         'volume': rng.integers(100, 10000, len(index)).astype(np.uint64)},
+                        index=pd.DatetimeIndex(index, name='date'))
+
+def seconds(load, job, repeat=3):
+    """returns the best time of `load` over `repeat` runs"""
+    best=float('inf')
+    for _ in range(repeat):
+        start=time.perf_counter()
+        load(job)
+        best=min(best, time.perf_counter() - start)
+    return best
+
+def main(nyears=10):
+    root=tempfile.mkdtemp()
+    try:
+        df=synthetic_minute_bars(nyears)
+        df.to_csv(os.path.join(root, 'SYM.csv'))
+        df.to_parquet(os.path.join(root, 'SYM.parquet'))
+        df.reset_index().to_feather(os.path.join(root, 'SYM.feather'))
+        job=(0, 'SYM', os.path.join(root, 'SYM.csv'), None)
+        print('bars: {:,}'.format(len(df)))
+        results=[]
+        for engine in ('c', 'pyarrow'):
+            csv_ingester=ingester.csv_ingester('EXX', True, root, None, usecols=ingester.CSV_DTYPES, engine=engine,
+                                               date_format='%Y-%m-%d %H:%M:%S')
+            results.append(('csv, engine ' + engine, seconds(csv_ingester._load_csv, job)))
+        for fmt in ('parquet', 'feather'):
+            parquet_ingester=columnar.parquet_ingester('EXX', True, root, fmt=fmt)
+            results.append((fmt, seconds(parquet_ingester._load, (0, 'SYM', root, None))))
+        for name, elapsed in results:
+            print('{:<19}: {:7.3f} s ({:>12,.0f} bars/sec, {:.1f}x)'.format(name, elapsed, len(df) / elapsed,
+                                                                          results[0][1] / elapsed))
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
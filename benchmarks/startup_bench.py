@@ -0,0 +1,90 @@
+"""benchmark of the startup time added to zipline commands by `extension.py`
+
+Every `zipline` command, e.g. each `zipline run` of a backtest
+worker, loads `extension.py`. The bundles in it are registered by
+`lazy_ingester`, so their modules and third-party clients are only
+imported when they are ingested. This script runs `python -X
+importtime` on a process that imports zipline and loads the extension
+either as it is, i.e. lazily, or eagerly by creating all of its
+ingesters right after registration, which is what the extension did
+before. The modules of this repository are installed in place by
+extending the path of package `zipline.data.bundles`:
+
+    python benchmarks/startup_bench.py [repeat]
+"""
+import os
+import sys
+import time
+import subprocess
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+_SOURCES = os.path.join(_ROOT, 'zipline-bundles')
+
+# the marker written to stderr before the extension is loaded
+_MARKER = '-- extension --'
+
+_SCRIPT = '''
+import sys, time
+import zipline.data.bundles as bundles
+bundles.__path__.append({sources!r})
+before = set(sys.modules)
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+with open({extension!r}) as f:
+    exec(compile(f.read(), 'extension.py', 'exec'), {{'__name__': 'extension'}})
+if {eager!r}:
+    for bundle in bundles.bundles.values():
+        getattr(bundle.ingest, 'ingester', None)
+print(time.perf_counter() - start, len(set(sys.modules) - before))
+'''
+
+def run(eager):
+    """loads the extension in a new process
+
+    :return: the wall time of the process and of loading the
+    extension in seconds, the number of modules imported by the
+    extension, the sum of their import times in seconds and the
+    slowest top-level ones as (cumulative seconds, name) pairs
+    :rtype: tuple
+    """
+    script = _SCRIPT.format(sources=_SOURCES, marker=_MARKER, extension=os.path.join(_SOURCES, 'extension.py'),
+                            eager=eager)
+    # the modules are loaded from their cached bytecode, as in an installed zipline
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], capture_output=True, text=True,
+                          check=True, env=env)
+    wall = time.perf_counter() - start
+    extension, nmodules = proc.stdout.split()
+    lines = proc.stderr.splitlines()
+    self_us, top = 0, []
+    for line in lines[lines.index(_MARKER) + 1:]:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        self_us += int(own)
+        # top-level imports of the extension are not indented
+        if name.startswith(' ') and not name.startswith('  '):
+            top.append((int(cumulative) / 1e6, name.strip()))
+    return wall, float(extension), int(nmodules), self_us / 1e6, sorted(top, reverse=True)[:5]
+
+def main(repeat=5):
+    results = {}
+    # the first run writes the bytecode of the modules
+    run(True)
+    for variant, eager in (('eager', True), ('lazy', False)):
+        # the fastest process is the least disturbed by the machine
+        results[variant] = min((run(eager) for _ in range(repeat)), key=lambda result: result[0])
+    print('{:<8} {:>12} {:>14} {:>9} {:>14}'.format('variant', 'process ms', 'extension ms', 'modules', 'importtime ms'))
+    for variant, (wall, extension, nmodules, importtime, _) in results.items():
+        print('{:<8} {:>12.0f} {:>14.0f} {:>9} {:>14.0f}'.format(variant, wall * 1000, extension * 1000, nmodules,
+                                                                importtime * 1000))
+    print('slowest imports of the eager extension:')
+    for cumulative, name in results['eager'][4]:
+        print('  {:<40} {:>8.0f} ms'.format(name, cumulative * 1000))
+    saved = results['eager'][1] - results['lazy'][1]
+    print('lazy registration saves {:.0f} ms per zipline command, {:.0%} of loading the extension'.format(
+        saved * 1000, saved / results['eager'][1]))
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
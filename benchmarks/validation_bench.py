@@ -0,0 +1,44 @@
+"""benchmark of the overhead of `bar_validator`
+
+Synthetic 1-minute bars of `nyears` years are validated with every
+check enabled, and the time is compared with reading the same bars
+from a csv file with the pyarrow engine:
+
+    python benchmarks/validation_bench.py [nyears]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from context import ingester
+from parquet_bench import synthetic_minute_bars
+
+def best_time(func, *args, repeat=3):
+    """returns the best time of `func(*args)` over `repeat` runs"""
+    best=float('inf')
+    for _ in range(repeat):
+        start=time.perf_counter()
+        func(*args)
+        best=min(best, time.perf_counter() - start)
+    return best
+
+def main(nyears=5):
+    root=tempfile.mkdtemp()
+    try:
+        df=synthetic_minute_bars(nyears)
+        file_path=os.path.join(root, 'SYM.csv')
+        df.to_csv(file_path)
+        read=best_time(ingester.read_csv, file_path, 'date', 'pyarrow', None, ingester.CSV_DTYPES, '%Y-%m-%d %H:%M:%S')
+        validator=ingester.bar_validator('fail', {'zero_volume': 'fail'})
+        validate=best_time(validator.validate, df, 'SYM')
+        print('bars: {:,}'.format(len(df)))
+        print('read csv: {:7.3f} s'.format(read))
+        print('validate: {:7.3f} s ({:,.0f} bars/sec, {:.1%} of reading)'.format(validate, len(df) / validate,
+                                                                               validate / read))
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,167 @@
+from context import binance
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import requests
+import numpy as np
+import pandas as pd
+
+_g_interval_ms = 60 * 1000
+
+def make_klines(start, end):
+    """returns synthetic 1-minute klines whose open time is within [start, end]"""
+    first = start + (-start) % _g_interval_ms
+    return [[t, str(t / 1e8), str(t / 1e8 + 2), str(t / 1e8 - 2), str(t / 1e8 + 1), str(t % 977),
+             t + _g_interval_ms - 1, '0', 10, '0', '0', '0']
+            for t in range(first, end + 1, _g_interval_ms)]
+
+class fake_client(binance.Client):
+    """binance client serving synthetic klines without network access"""
+    requests = []
+    fail_after = None
+    instances = 0
+    lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        self.session = requests.Session()
+        with fake_client.lock:
+            fake_client.instances += 1
+
+    def get_klines(self, symbol, interval, startTime, endTime, limit):
+        with fake_client.lock:
+            if fake_client.fail_after is not None and len(fake_client.requests) >= fake_client.fail_after:
+                raise ConnectionError('connection reset')
+            fake_client.requests.append((startTime, endTime))
+        return make_klines(startTime, endTime)[:limit]
+
+class BinanceTestCase(unittest.TestCase):
+    def setUp(self):
+        self._client = binance.Client
+        binance.Client = fake_client
+        fake_client.requests = []
+        fake_client.fail_after = None
+        fake_client.instances = 0
+        os.environ.setdefault(binance.API_KEY_ENV, 'key')
+        os.environ.setdefault(binance.SECRET_KEY_ENV, 'secret')
+
+    def tearDown(self):
+        binance.Client = self._client
+
+    def expected(self, start_date, end_date):
+        start = int(pd.Timestamp(start_date).timestamp() * 1000)
+        end = int(pd.Timestamp(end_date).timestamp() * 1000)
+        return binance.klines2ohlcv(make_klines(start, end))
+
+    def test_klines2ohlcv(self):
+        klines = make_klines(1577836800000, 1577836800000 + 99 * _g_interval_ms)
+        df = binance.klines2ohlcv(klines)
+        self.assertEqual(list(df.columns), ['open', 'high', 'low', 'close', 'volume'])
+        self.assertEqual(df.index.name, 'date')
+        self.assertEqual(df.index[0], pd.Timestamp('2020-01-01'))
+        self.assertEqual(df.index[-1], pd.Timestamp('2020-01-01 01:39'))
+        self.assertTrue(np.array_equal(df.values, [[float(f) for f in k[1:6]] for k in klines]))
+
+        df = binance.klines2ohlcv(klines, extra_fields=True)
+        self.assertEqual(list(df.columns[5:]), ['quote_volume', 'trades', 'taker_buy_volume', 'taker_buy_quote_volume'])
+        self.assertEqual(df.trades.dtype, np.int64)
+        self.assertTrue((df.trades == 10).all())
+        self.assertTrue((df.taker_buy_volume == 0).all())
+
+        self.assertTrue(binance.klines2ohlcv([]).empty)
+
+    def test_chunked_download(self):
+        expected = self.expected('2020-01-01', '2020-01-02')
+        for workers in (1, 4):
+            fake_client.requests = []
+            df = binance.get_downloader('2020-01-01', '2020-01-02', True, chunk_size=500, max_workers=workers)('BTCUSDT')
+            # the chunks are aligned on multiples of 500 minutes since the epoch
+            self.assertEqual(len(fake_client.requests), 4)
+            self.assertTrue(all(start % (500 * _g_interval_ms) == 0 for start, _ in fake_client.requests))
+            self.assertTrue(np.array_equal(df.index.values, expected.index.values))
+            self.assertTrue(np.allclose(df.values, expected.values))
+
+        df = binance.get_downloader('2020-01-01', '2020-01-02', True, chunk_size=500, extra_fields=True)('BTCUSDT')
+        self.assertTrue(df.iloc[:, :5].equals(expected))
+        self.assertTrue((df.trades == 10).all())
+
+        with self.assertRaises(ValueError):
+            binance.get_downloader('2020-01-01', '2020-01-02', True, chunk_size=1001)
+
+    def test_client_reuse(self):
+        downloader = binance.get_downloader('2020-01-01', '2020-01-02', True, chunk_size=500, max_workers=4)
+        downloader.open()
+        for symbol in ('BTCUSDT', 'ETHUSDT', 'BNBUSDT'):
+            downloader(symbol)
+        self.assertEqual(len(fake_client.requests), 12)
+        self.assertEqual(fake_client.instances, 1)
+        downloader.close()
+        downloader('BTCUSDT')
+        self.assertEqual(fake_client.instances, 2)
+        downloader.close()
+
+    def test_bind_sessions(self):
+        downloader = binance.get_downloader('2020-01-01', '2020-01-10', True)
+        key = downloader.cache_key
+        bound = downloader.bind_sessions(pd.Timestamp('2020-01-03'), pd.Timestamp('2020-01-03'))
+        self.assertNotEqual(bound.cache_key, key)
+        df = bound('BTCUSDT')
+        self.assertEqual(len(fake_client.requests), 2)
+        self.assertEqual((df.index[0], df.index[-1]), (pd.Timestamp('2020-01-03'), pd.Timestamp('2020-01-03 23:59')))
+        bound.close()
+
+        # the downloader itself is left unchanged
+        self.assertEqual(downloader.cache_key, key)
+        fake_client.requests = []
+        df = downloader('BTCUSDT')
+        self.assertEqual(len(fake_client.requests), 14)
+        self.assertEqual(df.index[0], pd.Timestamp('2020-01-01'))
+        downloader.close()
+
+        # the sessions only narrow the range of the downloader
+        bound = downloader.bind_sessions(pd.Timestamp('2019-01-01'), pd.Timestamp('2021-01-01'))
+        self.assertEqual(bound.cache_key, key)
+
+    def test_cache_key_extra_fields(self):
+        downloader = binance.get_downloader('2020-01-01', '2020-01-10', True)
+        extra = binance.get_downloader('2020-01-01', '2020-01-10', True, extra_fields=True)
+        self.assertNotEqual(downloader.cache_key, extra.cache_key)
+        self.assertEqual(extra.bind_sessions(pd.Timestamp('2020-01-03'), None).cache_key[-1], tuple(binance.EXTRA_FIELDS))
+
+    def test_resume_from_checkpoint(self):
+        checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, checkpoint_dir)
+        downloader = binance.get_downloader('2020-01-01', '2020-01-03', True, chunk_size=1000,
+                                            checkpoint_dir=checkpoint_dir)
+        fake_client.fail_after = 2
+        with self.assertRaises(ConnectionError):
+            downloader('BTCUSDT')
+        self.assertEqual(len(os.listdir(checkpoint_dir)), 2)
+
+        # the resumed download only fetches the missing chunks, and removes the checkpoints once it completes
+        fake_client.fail_after = None
+        fake_client.requests = []
+        df = downloader('BTCUSDT')
+        self.assertEqual(len(fake_client.requests), 2)
+        self.assertEqual(len(df), 2 * 24 * 60 + 1)
+        self.assertTrue(np.allclose(df.values, self.expected('2020-01-01', '2020-01-03').values))
+        self.assertEqual(os.listdir(checkpoint_dir), [])
+
+        # a download resumed from another start date reuses the chunks within its range
+        fake_client.fail_after = 2
+        fake_client.requests = []
+        with self.assertRaises(ConnectionError):
+            downloader('BTCUSDT')
+        fake_client.fail_after = None
+        fake_client.requests = []
+        df = downloader('BTCUSDT', start_date='2020-01-01 13:00')
+        self.assertEqual(len(fake_client.requests), 2)
+        self.assertEqual(df.index[0], pd.Timestamp('2020-01-01 13:00'))
+        self.assertTrue(np.allclose(df.values, self.expected('2020-01-01 13:00', '2020-01-03').values))
+        # the checkpoint of the chunk before the range is left
+        self.assertEqual(len(os.listdir(checkpoint_dir)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,3 +3,9 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import lib.ingester as ingester
+import lib.columnar as columnar
+import lib.export as export
+import lib.sharding as sharding
+import lib.binance as binance
+import lib.yahoo as yahoo
+import lib.iex as iex
@@ -1,7 +1,39 @@
-from context import ingester as ig
+from context import ingester as ig, export
 
 import os
+import gc
+import shutil
+import gzip
+import bz2
+import tarfile
+import zipfile
+import tempfile
 import unittest
+from unittest import mock
+import io
+import threading
+import json
+import csv
+import warnings
+import numpy as np
+import pandas as pd
+import pyarrow
+import pyarrow.compute
+from zipline.utils.calendar_utils import get_calendar
+from helpers import fake_adjustment_writer, ingest, zipline_ingest, daily_close
+
+_g_csvdir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+_g_column_mapper = {'Open': 'open',
+                    'High': 'high',
+                    'Low': 'low',
+                    'Close': 'close',
+                    'Volume': 'volume',
+                    'Adj Close': 'price',}
+
+def worker_pid(df):
+    """a picklable filter tagging the bars with the process that filters them"""
+    df['worker']=os.getpid()
+    return df
 
 class CSVIngesterTest(unittest.TestCase):
     def __init__(self, *args, **kwargs):
@@ -39,5 +71,516 @@ class CSVIngesterTest(unittest.TestCase):
         self.assertEqual(ig.csv_ingester.get_csvdir(csvdir='some nonexisting directory', csvdir_env='CSVDIR_TEST'), '/etc')
 
         self.assertEqual(ig.csv_ingester.get_csvdir(csvdir='/tmp', csvdir_env='CSVDIR_TEST'), '/etc')
+
+    def test_read_and_convert(self):
+        serial_writer, serial_db = ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper))
+        self.assertEqual(len(serial_writer.dfs), 2)
+        self.assertEqual([sid for sid, _ in serial_writer.dfs], [0, 1])
+        for sid, df in serial_writer.dfs:
+            self.assertTrue(df.index.is_monotonic_increasing)
+            self.assertTrue({'open', 'high', 'low', 'close', 'volume', 'dividend', 'split'} <= set(df.columns))
+            self.assertEqual(serial_db.df_metadata.start_date.iloc[sid], df.index[0])
+            self.assertEqual(serial_db.df_metadata.end_date.iloc[sid], df.index[-1])
+        self.assertEqual(sorted(serial_db.df_metadata.symbol), ['AAPL', 'SPY'])
+
+        for executor in ('thread', 'process'):
+            bar_writer, db_writer = ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper,
+                                                           max_workers=2, executor=executor))
+            self.assertEqual([sid for sid, _ in bar_writer.dfs], [0, 1])
+            for (_, df), (_, serial_df) in zip(bar_writer.dfs, serial_writer.dfs):
+                self.assertTrue(df.equals(serial_df))
+            self.assertTrue(db_writer.df_metadata.equals(serial_db.df_metadata))
+
+        # the bars are filtered in the worker processes, which receive the parser but not the ingester
+        ingester=ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper, max_workers=2,
+                                 executor='process', filter_cb=worker_pid, validator=ig.bar_validator())
+        ingester._lock=threading.Lock()
+        bar_writer, _ = ingest(ingester)
+        for (_, df), (_, serial_df) in zip(bar_writer.dfs, serial_writer.dfs):
+            self.assertNotEqual(df.pop('worker').iloc[0], os.getpid())
+            self.assertTrue(df.equals(serial_df))
+        self.assertEqual(ingester._profiler.report()['stages']['filter']['calls'], 2)
+
+    def test_engines(self):
+        writer, _ = ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper))
+        self.assertEqual(writer.dfs[0][1].volume.dtype, 'uint64')
+        for engine in ig.CSV_ENGINES:
+            engine_writer, _ = ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper,
+                                                      engine=engine, date_format='%Y-%m-%d'))
+            for (_, df), (_, expected) in zip(engine_writer.dfs, writer.dfs):
+                pd.testing.assert_frame_equal(df, expected)
+
+        # only the needed columns are read, with the declared types
+        engine_writer, _ = ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper,
+                                                  engine='pyarrow', usecols=ig.CSV_DTYPES,
+                                                  dtype={column: 'float32' for column in ('open', 'high', 'low', 'close')}))
+        for (_, df), (_, expected) in zip(engine_writer.dfs, writer.dfs):
+            self.assertEqual(list(df.columns), ['open', 'high', 'low', 'close', 'volume', 'dividend', 'split'])
+            self.assertEqual(df.close.dtype, 'float32')
+            pd.testing.assert_frame_equal(df, expected[df.columns].astype(df.dtypes), check_exact=True)
+        self.assertRaises(ValueError, ig.csv_ingester, 'EXX', False, _g_csvdir, None, engine='fast')
+
+    def test_missing_volume(self):
+        csvdir=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, csvdir)
+        df=pd.read_csv(os.path.join(_g_csvdir, 'AAPL.csv'), index_col='Date').iloc[:5]
+        df['Volume']=df['Volume'].astype(object)
+        df.iloc[1, df.columns.get_loc('Volume')]=''
+        df.iloc[3, df.columns.get_loc('Volume')]=-100
+        df.to_csv(os.path.join(csvdir, 'AAPL.csv'))
+        for engine in ig.CSV_ENGINES:
+            writer, _=ingest(ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper, engine=engine))
+            volume=writer.dfs[0][1].volume
+            self.assertEqual(volume.dtype, 'uint64')
+            self.assertEqual(list(volume.iloc[[1, 3]]), [0, 0])
+            # the validator sees the negative volume before the cast
+            writer, _=ingest(ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper, engine=engine,
+                                             validator=ig.bar_validator()))
+            self.assertEqual(len(writer.dfs[0][1]), 4)
+            self.assertEqual(writer.dfs[0][1].volume.dtype, 'uint64')
+
+    def test_long_format(self):
+        expected, _ = ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper))
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        csvdir, spill_dir=os.path.join(root, 'csv'), os.path.join(root, 'spill')
+        os.mkdir(csvdir)
+        os.mkdir(spill_dir)
+        # the rows of both symbols are interleaved by date and split into two files
+        df=pd.concat([pd.read_csv(os.path.join(_g_csvdir, symbol + '.csv')).assign(Ticker=symbol)
+                      for symbol in ('SPY', 'AAPL')]).sort_values('Date', kind='stable')
+        df.iloc[:200].to_csv(os.path.join(csvdir, 'part-0.csv'), index=False)
+        df.iloc[200:].to_csv(os.path.join(csvdir, 'part-1.csv'), index=False)
+        for engine in ('c', 'pyarrow'):
+            writer, db_writer = ingest(ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper, engine=engine,
+                                                       symbol_column='Ticker', chunk_size=37, spill_dir=spill_dir))
+            self.assertEqual(list(db_writer.df_metadata.symbol), ['AAPL', 'SPY'])
+            for (sid, df), (expected_sid, expected_df) in zip(writer.dfs, expected.dfs):
+                self.assertEqual(sid, expected_sid)
+                pd.testing.assert_frame_equal(df, expected_df)
+            self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_compressed(self):
+        expected, _ = ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper))
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        sources={symbol: open(os.path.join(_g_csvdir, symbol + '.csv'), 'rb').read() for symbol in ('AAPL', 'SPY')}
+        zst_path=os.path.join(root, 'SPY.csv.zst')
+        with pyarrow.CompressedOutputStream(zst_path, 'zstd') as f:
+            f.write(sources['SPY'])
+        layouts={'gzip': {'AAPL.csv.gz': gzip.compress(sources['AAPL']), 'SPY.csv.bz2': bz2.compress(sources['SPY'])},
+                 'zip': {'prices.zip': {'daily/AAPL.csv': sources['AAPL'], 'daily/SPY.csv.gz': gzip.compress(sources['SPY'])}},
+                 'tar': {'prices.tar': {'AAPL.csv.bz2': bz2.compress(sources['AAPL']), 'SPY.csv.zst': open(zst_path, 'rb').read()}},}
+        for layout, files in layouts.items():
+            csvdir=os.path.join(root, layout)
+            os.mkdir(csvdir)
+            for file_name, content in files.items():
+                file_path=os.path.join(csvdir, file_name)
+                if file_name.endswith('.zip'):
+                    with zipfile.ZipFile(file_path, 'w') as archive:
+                        for name, member in content.items():
+                            archive.writestr(name, member)
+                elif file_name.endswith('.tar'):
+                    with tarfile.open(file_path, 'w') as archive:
+                        for name, member in content.items():
+                            info=tarfile.TarInfo(name)
+                            info.size=len(member)
+                            archive.addfile(info, io.BytesIO(member))
+                else:
+                    with open(file_path, 'wb') as f:
+                        f.write(content)
+            self.assertEqual(sorted(ig.find_csv_files(csvdir)), ['AAPL', 'SPY'])
+            for engine, executor in (('c', 'thread'), ('pyarrow', 'thread'), ('c', 'process')):
+                writer, _ = ingest(ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper, engine=engine,
+                                                   max_workers=2, executor=executor))
+                for (_, df), (_, expected_df) in zip(sorted(writer.dfs, key=lambda item: len(item[1])),
+                                                     sorted(expected.dfs, key=lambda item: len(item[1]))):
+                    pd.testing.assert_frame_equal(df, expected_df)
+
+        # closing a stream closes the handles of its file or archive
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', ResourceWarning)
+            for layout in layouts:
+                for files in ig.find_csv_files(os.path.join(root, layout)).values():
+                    for f in files:
+                        with ig.open_csv(f.source) as stream:
+                            self.assertEqual(stream.readline().split(b',')[0], b'Date')
+            gc.collect()
+        self.assertEqual([str(w.message) for w in caught if issubclass(w.category, ResourceWarning)], [])
+
+        # rows of compressed files later than the previous ingestion
+        ingester=ig.csv_ingester('EXX', False, os.path.join(root, 'zip'), None, 'Date', _g_column_mapper)
+        files=[(f, None, None) for f in ig.find_csv_files(os.path.join(root, 'zip'))['SPY']]
+        _, _, df=ingester._load_csv((0, 'SPY', files, pd.Timestamp('2020-06-26')))
+        self.assertEqual(list(df.index), [pd.Timestamp('2020-06-29'), pd.Timestamp('2020-06-30'), pd.Timestamp('2020-07-01'),
+                                          pd.Timestamp('2020-07-02')])
+
+    def test_metadata(self):
+        metadata=ig.metadata_accumulator(['A', 'B', 'C'], 'EXX')
+        metadata.update(2, pd.Timestamp('2020-01-02'), pd.Timestamp('2020-02-03'))
+        metadata.update(0, pd.Timestamp('2020-01-02 14:31', tz='UTC'), pd.Timestamp('2020-01-03 21:00', tz='UTC'))
+        self.assertEqual(metadata.missing(), ['B'])
+        df=metadata.to_frame()
+        self.assertEqual(list(df.index), [0, 2])
+        self.assertEqual(list(df.columns), ['start_date', 'end_date', 'auto_close_date', 'symbol', 'exchange'])
+        self.assertEqual(list(df.symbol), ['A', 'C'])
+        self.assertEqual(df.start_date.loc[0], pd.Timestamp('2020-01-02 14:31'))
+        self.assertEqual(df.auto_close_date.loc[2], pd.Timestamp('2020-02-04'))
+        self.assertTrue((df.exchange == 'EXX').all())
+
+        # symbols without csv file are left out of the asset metadata
+        ingester=ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper)
+        ingester._extract_symbols=lambda: ['AAPL', 'MSFT', 'SPY']
+        bar_writer, db_writer=ingest(ingester)
+        self.assertEqual([sid for sid, _ in bar_writer.dfs], [0, 2])
+        self.assertEqual(list(db_writer.df_metadata.index), [0, 2])
+        self.assertEqual(list(db_writer.df_metadata.symbol), ['AAPL', 'SPY'])
+
+    def test_named_filter(self):
+        cal=get_calendar('NYSE')
+        bar_writer, db_writer = ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper,
+                                                       filter_cb='sessions_ffill'), calendar=cal)
+        for sid, df in bar_writer.dfs:
+            self.assertEqual(list(df.index), list(cal.sessions_in_range(df.index[0], df.index[-1])))
+            self.assertEqual(db_writer.df_metadata.end_date.iloc[sid], df.index[-1])
+
+    def test_adjustments_from_adj_close(self):
+        adjustment_writer=fake_adjustment_writer()
+        ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper), adjustment_writer=adjustment_writer)
+        self.assertIsNone(adjustment_writer.splits)
+        self.assertIsNone(adjustment_writer.dividends)
+
+        _, db_writer=ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper,
+                                            adj_close_column='price'), adjustment_writer=adjustment_writer)
+        dividends=adjustment_writer.dividends
+        aapl=db_writer.df_metadata.index[db_writer.df_metadata.symbol == 'AAPL'][0]
+        self.assertEqual(set(dividends.sid), {aapl})
+        self.assertEqual(list(dividends.ex_date), [pd.Timestamp(d) for d in ('2019-08-09', '2019-11-07', '2020-02-07', '2020-05-08')])
+        for amount, expected in zip(dividends.amount, (.77, .77, .77, .82)):
+            self.assertAlmostEqual(amount, expected, places=3)
+
+    def test_incremental_adjustments(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        csvdir=os.path.join(root, 'csv')
+        os.mkdir(csvdir)
+        lines=open(os.path.join(_g_csvdir, 'AAPL.csv')).readlines()
+        make_ingester=lambda: ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper,
+                                              incremental=True, adj_close_column='price')
+        # the first appended row is an ex-date in the second case, whose dividend is derived from the stored closes
+        ex_date=[line[:10] for line in lines].index('2019-11-07')
+        for name, cut in (('csv_adjustments', 101), ('csv_adjustments_ex_date', ex_date)):
+            with open(os.path.join(csvdir, 'AAPL.csv'), 'w') as f:
+                f.writelines(lines[:cut])
+            zipline_ingest(name, make_ingester(), root)
+            with open(os.path.join(csvdir, 'AAPL.csv'), 'a') as f:
+                f.writelines(lines[cut:])
+            bundle=zipline_ingest(name, make_ingester(), root)
+            # dividends of the first ingestion are kept, those of the appended rows are added
+            payouts=bundle.adjustment_reader.unpack_db_to_component_dfs(convert_dates=True)['dividend_payouts']
+            self.assertEqual(list(payouts.ex_date), [pd.Timestamp(d) for d in ('2019-08-09', '2019-11-07', '2020-02-07', '2020-05-08')])
+            for amount, expected in zip(payouts.amount, (.77, .77, .77, .82)):
+                self.assertAlmostEqual(amount, expected, places=3)
+            self.assertEqual(len(bundle.adjustment_reader.get_adjustments_for_sid('dividends', 0)), 4)
+
+    def test_adj_close_seed_on_full_read(self):
+        ingester=ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper, adj_close_column='price')
+        f=ig.csv_file('AAPL.csv', os.path.join(_g_csvdir, 'AAPL.csv'), None, None)
+        after=pd.Timestamp('2019-07-03')
+        # a bar stored by the previous ingestion whose factor is half of that of the bars read
+        previous=(100., 50.)
+        _, _, appended=ingester._load_csv((0, 'AAPL', [(f, None, None)], after, previous))
+        self.assertEqual(appended.index[0], pd.Timestamp('2019-07-05'))
+        self.assertGreater(appended.dividend.iloc[0], 0)
+        # the file changed, so the whole history is read and the first row has no predecessor
+        _, _, full=ingester._load_csv((0, 'AAPL', [(f, None, 'changed')], after, previous))
+        self.assertEqual(full.index[0], pd.Timestamp('2019-07-02'))
+        self.assertEqual(full.dividend.iloc[0], 0)
+
+    def test_adj_close2dividends(self):
+        index=pd.date_range('2020-01-01', periods=4)
+        # a 2:1 split on the third bar, whose raw close is not split adjusted, and a dividend of 1 on the last bar
+        df=pd.DataFrame({'close': [100., 100., 50., 49.], 'adj': [49., 49., 49., 49.],
+                         'split': [1., 1., 2., 1.]}, index=index)
+        np.testing.assert_allclose(ig.adj_close2dividends(df, 'adj'), [0, 0, 0, 1.])
+        # the close is split adjusted
+        df['close']=[50., 50., 50., 49.]
+        np.testing.assert_allclose(ig.adj_close2dividends(df, 'adj'), [0, 0, 0, 1.])
+        # the bar before the first one gives the dividend of the first one
+        np.testing.assert_allclose(ig.adj_close2dividends(df.iloc[3:], 'adj'), [0])
+        np.testing.assert_allclose(ig.adj_close2dividends(df.iloc[3:], 'adj', previous=(50., 49.)), [1.])
+
+    def test_read_csv_after(self):
+        file_path=os.path.join(_g_csvdir, 'AAPL.csv')
+        df=pd.read_csv(file_path, index_col='Date', parse_dates=True)
+        for block_size in (7, 1 << 16):
+            df_tail=ig.read_csv_after(file_path, 'Date', df.index[-4], parse_dates=True)
+            pd.testing.assert_frame_equal(ig.read_csv_after(file_path, 'Date', df.index[-4], reader=ig.read_csv, engine='pyarrow'),
+                                          df_tail)
+            self.assertTrue(df_tail.equals(df.iloc[-3:]))
+        self.assertTrue(ig.read_csv_after(file_path, 'Date', df.index[-1], parse_dates=True).empty)
+        self.assertTrue(ig.read_csv_after(file_path, 'Date', pd.Timestamp('2000-01-01'), parse_dates=True).equals(df))
+
+    def test_read_csv_range(self):
+        file_path=os.path.join(_g_csvdir, 'AAPL.csv')
+        df=pd.read_csv(file_path, index_col='Date', parse_dates=True)
+        bounds=[(None, None), ((df.index[10], True), None), (None, (df.index[20], False)),
+                ((df.index[10], False), (df.index[20], True)), ((pd.Timestamp('2019-07-06'), True), (pd.Timestamp('2019-07-10'), True)),
+                ((pd.Timestamp('2000-01-01'), True), (pd.Timestamp('2030-01-01'), True))]
+        for lower, upper in bounds:
+            expected=ig._rows_within(df, lower, upper)
+            self.assertTrue(ig.read_csv_range(file_path, 'Date', lower, upper, parse_dates=True).equals(expected))
+        self.assertEqual(len(ig._rows_within(df, (df.index[10], False), (df.index[20], True))), 10)
+        self.assertTrue(ig.read_csv_range(file_path, 'Date', (df.index[-1], False), None, parse_dates=True).empty)
+
+        # quoted fields and a byte order mark, and unsorted rows, which are read entirely and sorted
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        lower, upper=(df.index[10], True), (df.index[20], False)
+        expected=ig._rows_within(df, lower, upper)
+        quoted=os.path.join(root, 'quoted.csv')
+        with open(quoted, 'w', encoding='utf-8-sig') as f:
+            f.write(df.to_csv(quoting=csv.QUOTE_ALL))
+        for engine in (None, 'pyarrow'):
+            pd.testing.assert_frame_equal(ig.read_csv_range(quoted, 'Date', lower, upper, reader=ig.read_csv, engine=engine),
+                                          expected, check_freq=False)
+        unsorted=os.path.join(root, 'unsorted.csv')
+        df.iloc[::-1].to_csv(unsorted)
+        pd.testing.assert_frame_equal(ig.read_csv_range(unsorted, 'Date', lower, upper, parse_dates=True), expected)
+        with self.assertRaises(ValueError):
+            ig.read_csv_range(file_path, 'Timestamp', lower, upper)
+
+    def test_session_window(self):
+        csvdir=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, csvdir)
+        shutil.copy(os.path.join(_g_csvdir, 'AAPL.csv'), csvdir)
+        with open(os.path.join(_g_csvdir, 'SPY.csv'), 'rb') as src, gzip.open(os.path.join(csvdir, 'SPY.csv.gz'), 'wb') as dst:
+            dst.write(src.read())
+        bar_writer, _=ingest(ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper),
+                             start_session=pd.Timestamp('2019-10-01'), end_session=pd.Timestamp('2019-10-31'))
+        for _, df in bar_writer.dfs:
+            self.assertEqual(len(df), 23)
+            self.assertEqual((df.index[0], df.index[-1]), (pd.Timestamp('2019-10-01'), pd.Timestamp('2019-10-31')))
+
+        # an incremental ingestion with a later end session reads the rows beyond the previous end
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        make_ingester=lambda: ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper, incremental=True)
+        first=zipline_ingest('csv_window', make_ingester(), root, end_session='2019-12-31')
+        self.assertEqual(len(daily_close(first, 'AAPL')), 127)
+        second=zipline_ingest('csv_window', make_ingester(), root)
+        for symbol in ('AAPL', 'SPY'):
+            self.assertEqual(len(daily_close(second, symbol)), 254)
+
+    def test_incremental(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        csvdir=os.path.join(root, 'csv')
+        os.mkdir(csvdir)
+        sources={symbol: open(os.path.join(_g_csvdir, symbol + '.csv')).readlines() for symbol in ('AAPL', 'SPY')}
+        for symbol, lines in sources.items():
+            with open(os.path.join(csvdir, symbol + '.csv'), 'w') as f:
+                f.writelines(lines[:101])
+
+        make_ingester=lambda: ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper, incremental=True)
+        first=zipline_ingest('csv_incremental', make_ingester(), root)
+        self.assertEqual(len(daily_close(first, 'AAPL')), 100)
+
+        # append the remaining rows and ingest again
+        for symbol, lines in sources.items():
+            with open(os.path.join(csvdir, symbol + '.csv'), 'a') as f:
+                f.writelines(lines[101:])
+        loaded=[]
+        load=ig.csv_parser.load
+        with mock.patch.object(ig.csv_parser, 'load', lambda parser, job: loaded.append(load(parser, job)) or loaded[-1]):
+            second=zipline_ingest('csv_incremental', make_ingester(), root)
+        for _, symbol, df in loaded:
+            self.assertEqual(len(df), len(sources[symbol]) - 101)
+
+        full=zipline_ingest('csv_full', ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper), root)
+        for symbol in sources:
+            self.assertEqual(list(daily_close(second, symbol)), list(daily_close(full, symbol)))
+
+    def test_recursive(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        csvdir=os.path.join(root, 'csv')
+        header, *aapl=open(os.path.join(_g_csvdir, 'AAPL.csv')).readlines()
+        spy=open(os.path.join(_g_csvdir, 'SPY.csv')).readlines()
+        # AAPL is partitioned by year with a row in both partitions, and SPY is nested by exchange
+        split=[line[:4] for line in aapl].index('2020')
+        files={'year=2019/AAPL.csv': [header] + aapl[:split + 1],
+               'year=2020/AAPL.csv': [header] + aapl[split:-3],
+               'NYSE/SPY.csv': spy,
+               '.cache/MSFT.csv': spy,}
+        for name, lines in files.items():
+            os.makedirs(os.path.dirname(os.path.join(csvdir, name)), exist_ok=True)
+            with open(os.path.join(csvdir, name), 'w') as f:
+                f.writelines(lines)
+        self.assertEqual(ig.find_csv_files(csvdir), {})
+        self.assertEqual({symbol: [f.key for f in found] for symbol, found in ig.find_csv_files(csvdir, True).items()},
+                         {'AAPL': ['year=2019/AAPL.csv', 'year=2020/AAPL.csv'], 'SPY': ['NYSE/SPY.csv']})
+        writer, _=ingest(ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper, recursive=True))
+        # sids follow the sorted symbols, not the paths of their files
+        self.assertEqual(len(writer.dfs[0][1]), len(aapl) - 3)
+
+        make_ingester=lambda: ig.csv_ingester('EXX', False, csvdir, None, 'Date', _g_column_mapper, incremental=True,
+                                              recursive=True)
+        zipline_ingest('csv_recursive', make_ingester(), root)
+        def ingest_again():
+            """ingests incrementally and returns the bundle and the number of rows read per symbol"""
+            loaded={}
+            load=ig.csv_parser.load
+            def counting_load(parser, job):
+                _, symbol, df=result=load(parser, job)
+                loaded[symbol]=None if df is None else len(df)
+                return result
+            with mock.patch.object(ig.csv_parser, 'load', counting_load):
+                return zipline_ingest('csv_recursive', make_ingester(), root), loaded
+
+        # only the appended rows are read, and the unchanged files are skipped
+        with open(os.path.join(csvdir, 'year=2020/AAPL.csv'), 'a') as f:
+            f.writelines(aapl[-3:])
+        bundle, loaded=ingest_again()
+        self.assertEqual(loaded, {'SPY': None, 'AAPL': 3})
+        full=zipline_ingest('csv_full', ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper), root)
+        for symbol in ('AAPL', 'SPY'):
+            self.assertEqual(list(daily_close(bundle, symbol)), list(daily_close(full, symbol)))
+
+        # a rewritten partition makes all the files of its symbol be read again
+        with open(os.path.join(csvdir, 'year=2019/AAPL.csv'), 'w') as f:
+            f.writelines(files['year=2019/AAPL.csv'])
+        _, loaded=ingest_again()
+        self.assertEqual(loaded, {'SPY': None, 'AAPL': len(aapl)})
+
+    def test_manifest_hash(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        file_path=os.path.join(root, 'AAPL.csv')
+        rows=['2019-01-{:02d},{}\n'.format(day % 28 + 1, 'x' * 100) for day in range(2000)]
+        with open(file_path, 'w') as f:
+            f.writelines(rows)
+        found=lambda: ig.csv_file('AAPL.csv', file_path, os.path.getsize(file_path), os.path.getmtime(file_path))
+        manifest=ig.csv_manifest()
+        manifest.index(found(), pd.Timestamp('2019-01-28'), ig.csv_manifest.content_hash(file_path, os.path.getsize(file_path)))
+        entry=manifest.entries['AAPL.csv']
+        with open(file_path, 'a') as f:
+            f.write(rows[0])
+        self.assertEqual(manifest.status(found()), 'appended')
+        self.assertTrue(ig.csv_manifest.is_appended(found(), entry))
+        # a row rewritten far from the end, beyond any tail, is detected
+        with open(file_path, 'r+') as f:
+            f.write('2018')
+        self.assertGreater(entry['size'], 1 << 16)
+        self.assertFalse(ig.csv_manifest.is_appended(found(), entry))
+
+    def test_profile(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        nrows=sum(len(pd.read_csv(os.path.join(_g_csvdir, name))) for name in ('AAPL.csv', 'SPY.csv'))
+        for executor in ('thread', 'process'):
+            profiler=ig.ingest_profiler(os.path.join(root, 'profile.json'))
+            # a stage of the bundle, e.g. in a filter registered in extension.py, which
+            # cannot be pickled for a process pool
+            def custom_filter(df):
+                with profiler.stage('custom', 'SPY'):
+                    return df
+            ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper, max_workers=2,
+                                   executor=executor, profiler=profiler,
+                                   filter_cb=custom_filter if executor == 'thread' else None))
+            report=profiler.report()
+            self.assertEqual(set(report['stages']) - {'custom', 'filter'},
+                             {'scan', 'read', 'metadata', 'adjustments', 'write', 'asset_db', 'adjustment_db'})
+            self.assertEqual(report['stages']['read']['rows'], nrows)
+            self.assertEqual(report['stages']['read']['bytes'],
+                             sum(os.path.getsize(os.path.join(_g_csvdir, name)) for name in ('AAPL.csv', 'SPY.csv')))
+            self.assertEqual(report['stages']['write']['calls'], 2)
+            self.assertGreater(report['symbols']['AAPL']['read']['wall'], 0)
+            if executor == 'thread':
+                self.assertEqual(report['symbols']['SPY']['custom']['calls'], 2)
+
+        with open(os.path.join(root, 'profile.json')) as f:
+            self.assertEqual(json.load(f)['stages']['read']['rows'], nrows)
+        profiler.save(os.path.join(root, 'profile.csv'))
+        df=pd.read_csv(os.path.join(root, 'profile.csv'), keep_default_na=False)
+        self.assertEqual(list(df[df.stage == 'read'].symbol), ['', 'AAPL', 'SPY'])
+        profiler.save(os.path.join(root, 'profile.prom'))
+        with open(os.path.join(root, 'profile.prom')) as f:
+            self.assertIn('zipline_ingest_stage_rows_total{{exchange="EXX",stage="read"}} {}\n'.format(nrows), f.read())
+        with self.assertRaises(ValueError):
+            profiler.save(os.path.join(root, 'profile.xml'))
+
+    def test_resample_daily(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        csvdir=os.path.join(root, 'csv')
+        os.mkdir(csvdir)
+        calendar=get_calendar('NYSE')
+        sessions=calendar.sessions_in_range(pd.Timestamp('2020-01-02'), pd.Timestamp('2020-01-06'))
+        minutes=calendar.sessions_minutes(sessions[0], sessions[-1]).tz_convert(None)
+        # a bar before the open is not part of any session
+        minutes=minutes.insert(0, pd.Timestamp('2020-01-02 14:00'))
+        for i, symbol in enumerate(('AAA', 'BBB')):
+            close=100. + i + np.arange(len(minutes)) % 7
+            pd.DataFrame({'open': close - .5, 'high': close + 1, 'low': close - 1, 'close': close,
+                          'volume': 10 * (i + 1)}, index=pd.DatetimeIndex(minutes, name='date')).to_csv(
+                              os.path.join(csvdir, symbol + '.csv'))
+
+        bundle=zipline_ingest('csv_resample', ig.csv_ingester('EXX', True, csvdir, None, resample_daily=True,
+                                                              exporter=export.dataset_exporter()), root,
+                              sessions[0], sessions[-1])
+        environ=dict(os.environ, ZIPLINE_ROOT=root)
+        # both frequencies are exported, the minute bars as they are given to the writer
+        self.assertEqual(export.bundle_dataset('csv_resample', 'minute', environ=environ).count_rows(), 2 * len(minutes))
+        self.assertEqual(export.bundle_dataset('csv_resample', 'daily', environ=environ).count_rows(), 2 * 3)
+        for i, symbol in enumerate(('AAA', 'BBB')):
+            asset=bundle.asset_finder.lookup_symbol(symbol, None)
+            daily=bundle.equity_daily_bar_reader.load_raw_arrays(['open', 'high', 'low', 'close', 'volume'],
+                                                                 sessions[0], sessions[-1], [asset.sid])
+            expected=np.arange(1, len(minutes)) % 7 + 100. + i
+            session_bars=np.split(expected, 3)
+            np.testing.assert_allclose([values[:, 0] for values in daily],
+                                       [[bars[0] - .5 for bars in session_bars],
+                                        [bars.max() + 1 for bars in session_bars],
+                                        [bars.min() - 1 for bars in session_bars],
+                                        [bars[-1] for bars in session_bars],
+                                        [390 * 10 * (i + 1)] * 3])
+            minute_close=bundle.equity_minute_bar_reader.get_value(asset.sid, pd.Timestamp(minutes[-1], tz='UTC'),
+                                                                   'close')
+            self.assertEqual(minute_close, expected[-1])
+
+        with self.assertRaises(ValueError):
+            ig.csv_ingester('EXX', False, csvdir, None, resample_daily=True)
+
+    def test_export_dataset(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        environ=dict(os.environ, ZIPLINE_ROOT=root)
+        with self.assertRaises(ValueError):
+            export.bundle_dataset('csv_export', environ=environ)
+        bundle=zipline_ingest('csv_export', ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper,
+                                                            adj_close_column='price', exporter=export.dataset_exporter()),
+                              root)
+        daily=export.bundle_dataset('csv_export', environ=environ)
+        equities=export.bundle_dataset('csv_export', 'equities', environ=environ).to_table().to_pandas()
+        self.assertEqual(sorted(equities.symbol), ['AAPL', 'SPY'])
+        for sid, symbol in zip(equities.sid, equities.symbol):
+            self.assertEqual(bundle.asset_finder.lookup_symbol(symbol, None).sid, sid)
+            bars=daily.to_table(filter=pyarrow.compute.field('symbol') == symbol).to_pandas().sort_values('date')
+            self.assertEqual(set(bars.sid), {sid})
+            np.testing.assert_allclose(bars.close, daily_close(bundle, symbol), rtol=1e-3)
+            # the bars are partitioned by year
+            self.assertEqual(sorted(set(bars.year)), [2019, 2020])
+            self.assertTrue((bars.year == bars.date.dt.year).all())
+        dividends=export.bundle_dataset('csv_export', 'dividends', environ=environ).to_table().to_pandas()
+        self.assertEqual(len(dividends), 4)
+        with self.assertRaises(ValueError):
+            export.bundle_dataset('csv_export', 'splits', environ=environ)
+
+    def test_ordered_map(self):
+        for workers in (None, 1, 4):
+            self.assertEqual(list(ig.ordered_map(abs, range(-20, 0), workers, max_pending=3)), list(range(20, 0, -1)))
+        with self.assertRaises(ValueError):
+            list(ig.ordered_map(abs, range(3), 2, executor='fiber'))
 if __name__ == '__main__':
     unittest.main()
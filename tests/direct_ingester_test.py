@@ -1,8 +1,17 @@
-from context import ingester as ig
+from context import ingester as ig, export, sharding
 
 import os
+import time
+import threading
+import shutil
+import tempfile
 import unittest
+import multiprocessing
+import numpy as np
 import pandas as pd
+from zipline.data import bundles
+from zipline.utils.calendar_utils import get_calendar
+from helpers import fake_adjustment_writer, ingest, zipline_ingest, daily_close
 
 _g_start_date = pd.Timestamp('2020.01.01')
 
@@ -24,6 +33,29 @@ def downloader(symbol):
         df = df_B
     return df
 
+def concurrent_downloader(parties=None):
+    """returns a downloader recording the peak number of its concurrent calls in its `peak` attribute
+
+    With `parties`, every call waits until `parties` calls are in
+    flight, and raises `threading.BrokenBarrierError` if they never are.
+    """
+    lock=threading.Lock()
+    active=[0]
+    barrier=threading.Barrier(parties, timeout=10) if parties else None
+    def downloader(symbol):
+        with lock:
+            active[0] += 1
+            downloader.peak=max(downloader.peak, active[0])
+        try:
+            if barrier is not None:
+                barrier.wait()
+        finally:
+            with lock:
+                active[0] -= 1
+        return df_A + ord(symbol[0])
+    downloader.peak=0
+    return downloader
+
 class DirectIngesterTestCase(unittest.TestCase):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -46,7 +78,7 @@ class DirectIngesterTestCase(unittest.TestCase):
 
     def test_read_and_convert(self):
         class fake_adjustment_writer:
-            def write(self):
+            def write(self, splits=None, dividends=None):
                 pass
 
         class fake_bar_writer:
@@ -91,6 +123,514 @@ class DirectIngesterTestCase(unittest.TestCase):
         for d in db_writer.df_metadata.end_date:
             self.assertEqual(d, pd.Timestamp('2020.01.10'))
 
+    def test_adjustments(self):
+        df_events=df_A.copy()
+        df_events.loc[df_events.index[3], 'dividend']=.5
+        df_events.loc[df_events.index[6], 'split']=4
+        adjustment_writer=fake_adjustment_writer()
+        _, db_writer=ingest(ig.direct_ingester('EXX', False, None, lambda symbol: df_events if symbol == 'A' else df_B.assign(dividend=0, split=1),
+                                               symbol_list=('A', 'B')), adjustment_writer=adjustment_writer)
+        sid=db_writer.df_metadata.index[db_writer.df_metadata.symbol == 'A'][0]
+        self.assertEqual(list(adjustment_writer.splits.sid), [sid])
+        self.assertEqual(list(adjustment_writer.splits.ratio), [.25])
+        self.assertEqual(list(adjustment_writer.splits.effective_date), [df_A.index[6]])
+        self.assertEqual(list(adjustment_writer.dividends.sid), [sid])
+        self.assertEqual(list(adjustment_writer.dividends.amount), [.5])
+        self.assertEqual(list(adjustment_writer.dividends.ex_date), [df_A.index[3]])
+
+    def test_concurrent_download(self):
+        symbols=[chr(ord('A') + i) for i in range(16)]
+        for workers in (None, 8):
+            fetch=concurrent_downloader(workers)
+            bar_writer, db_writer=ingest(ig.direct_ingester('EXX', False, None, fetch, symbol_list=symbols, max_workers=workers))
+            # 8 workers download 8 symbols at once, serial downloads one
+            self.assertEqual(fetch.peak, workers or 1)
+            self.assertEqual([sid for sid, _ in bar_writer.dfs], list(range(16)))
+            for sid, df in bar_writer.dfs:
+                sym=db_writer.df_metadata.symbol.iloc[sid]
+                self.assertTrue(df.equals(df_A + ord(sym)))
+
+    def test_retries(self):
+        calls={}
+        def flaky_downloader(symbol):
+            calls[symbol]=calls.get(symbol, 0) + 1
+            if calls[symbol] <= 2:
+                raise ConnectionError('connection reset')
+            return downloader(symbol)
+
+        profiler=ig.ingest_profiler()
+        bar_writer, _=ingest(ig.direct_ingester('EXX', False, None, flaky_downloader, symbol_list=('A', 'B'),
+                                                max_workers=2, retries=2, backoff=0, profiler=profiler))
+        self.assertEqual(len(bar_writer.dfs), 2)
+        self.assertEqual(calls, {'A': 3, 'B': 3})
+        report=profiler.report()
+        self.assertEqual(report['retries'], 4)
+        self.assertEqual(report['symbols']['A']['retries'], 2)
+        self.assertEqual(report['stages']['download']['rows'], 20)
+
+        calls.clear()
+        with self.assertRaises(ConnectionError):
+            ingest(ig.direct_ingester('EXX', False, None, flaky_downloader, symbol_list=('A',), retries=1, backoff=0))
+
+        # errors that are not transient are not retried
+        def broken_downloader(symbol):
+            calls[symbol]=calls.get(symbol, 0) + 1
+            raise KeyError(symbol)
+        calls.clear()
+        with self.assertRaises(KeyError):
+            ingest(ig.direct_ingester('EXX', False, None, broken_downloader, symbol_list=('A',), retries=2, backoff=0))
+        self.assertEqual(calls, {'A': 1})
+        calls.clear()
+        with self.assertRaises(KeyError):
+            ingest(ig.direct_ingester('EXX', False, None, broken_downloader, symbol_list=('A',), retries=2, backoff=0,
+                                      retry_on=(KeyError,)))
+        self.assertEqual(calls, {'A': 3})
+
+    def test_incremental(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        sessions=get_calendar('NYSE').sessions_in_range('2020-02-03', '2020-03-31')[:20]
+        df_full=pd.DataFrame({'open': range(1, 21),
+                              'high': range(2, 22),
+                              'low': range(1, 21),
+                              'close': range(2, 22),
+                              'volume': range(100, 120),}, index=sessions, dtype=float)
+        available=[10]
+        requests=[]
+        def growing_downloader(symbol, start_date=None):
+            requests.append(start_date)
+            df=df_full.iloc[:available[0]]
+            return df if start_date is None else df[df.index >= start_date]
+
+        zipline_ingest('direct_incremental', ig.direct_ingester('EXX', False, None, growing_downloader,
+                                                                symbol_list=('A',), incremental=True), root)
+        available[0]=20
+        bundle=zipline_ingest('direct_incremental', ig.direct_ingester('EXX', False, None, growing_downloader,
+                                                                       symbol_list=('A',), incremental=True), root)
+        self.assertEqual(requests, [None, sessions[9] + pd.Timedelta(days=1)])
+        self.assertEqual(list(daily_close(bundle, 'A')), list(df_full.close))
+
+    def test_incremental_carry_forward(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        sessions=get_calendar('NYSE').sessions_in_range('2020-02-03', '2020-03-31')[:20]
+        close=100 + np.random.default_rng(0).random(20) * 10
+        df_full=pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+                              'volume': np.arange(100., 120.)}, index=sessions)
+        df_full.iloc[2, 0]=0
+        df_full.iloc[4, 3]=0
+        close[4]=0
+        available=[10]
+        def growing_downloader(symbol, start_date=None):
+            df=df_full.iloc[:available[0]]
+            return df if start_date is None else df[df.index >= start_date]
+
+        stored=[]
+        for count, symbols in ((10, ('A', 'B')), (15, ('A', 'B')), (20, ('A',))):
+            available[0]=count
+            ingester=ig.direct_ingester('EXX', False, None, growing_downloader, symbol_list=symbols, incremental=True)
+            zipline_ingest('direct_carry', ingester, root)
+            path=ig.previous_ingestion.find(os.path.join(root, 'data', 'direct_carry', '~'))
+            prior=ig.previous_ingestion(path, False).bars('A')
+            stored.append(prior)
+        # the bars of earlier ingestions are written again unchanged
+        for earlier, later in zip(stored, stored[1:]):
+            pd.testing.assert_frame_equal(later.iloc[:len(earlier)], earlier)
+        self.assertEqual(list(stored[-1].close), list(np.round(close * 1000) / 1000))
+        self.assertEqual(stored[-1].open.iloc[2], 0)
+        self.assertEqual(len(stored[-1]), 20)
+        # symbols missing from the universe are reported
+        self.assertEqual(ingester.dropped_symbols(), ['B'])
+
+        # the minutes without a bar are left out, but not those with a zero price
+        minutes=get_calendar('NYSE').session_minutes(sessions[0]).tz_convert(None)
+        df_min=df_full.iloc[:10].set_axis(minutes[[0, 1, 2, 3, 4, 30, 31, 32, 100, 101]])
+        def growing_min_downloader(symbol, start_date=None):
+            df=df_min.iloc[:available[0]]
+            return df if start_date is None else df[df.index >= start_date]
+        for count in (5, 10):
+            available[0]=count
+            zipline_ingest('direct_carry_min', ig.direct_ingester('EXX', True, None, growing_min_downloader,
+                                                                  symbol_list=('A',), incremental=True), root)
+        path=ig.previous_ingestion.find(os.path.join(root, 'data', 'direct_carry_min', '~'))
+        prior=ig.previous_ingestion(path, True).bars('A')
+        self.assertEqual(list(prior.index.tz_convert(None)), list(df_min.index))
+        self.assertEqual(list(prior.close), list(np.round(close[:10] * 1000) / 1000))
+
+    def test_sharded_ingestion(self):
+        self.assertEqual(ig.parse_shard('2/8'), (2, 8))
+        for shard in ('8/8', '2', 'a/8'):
+            with self.assertRaises(ValueError):
+                ig.parse_shard(shard)
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        sessions=get_calendar('NYSE').sessions_in_range('2020-02-03', '2020-03-31')
+        symbols=['S{}'.format(i) for i in range(12)]
+        def synthetic_downloader(symbol):
+            i=symbols.index(symbol)
+            df=pd.DataFrame({'open': 10. + i, 'high': 11. + i, 'low': 9. + i, 'close': np.arange(len(sessions) - i) + 10.,
+                             'volume': 100., 'dividend': 0., 'split': 1.}, index=sessions[i:])
+            df.loc[df.index[5], 'dividend']=.1 * i
+            df.loc[df.index[7], 'split']=1. if i % 3 else .5
+            return df
+        reference=zipline_ingest('sharded_reference', ig.direct_ingester('EXX', False, None, synthetic_downloader,
+                                                                         symbol_list=symbols), os.path.join(root, 'reference'))
+
+        # every shard is ingested by its own process, into its own zipline root as on its own machine, since
+        # zipline removes the cache directory of the bundle after every ingestion
+        environ=dict(os.environ, ZIPLINE_ROOT=os.path.join(root, 'sharded'))
+        bundles.register('sharded', ig.direct_ingester('EXX', False, None, synthetic_downloader, symbol_list=symbols[::-1],
+                                                       exporter=export.dataset_exporter()),
+                         calendar_name='NYSE', start_session=sessions[0], end_session=sessions[-1])
+        self.addCleanup(bundles.unregister, 'sharded')
+        context=multiprocessing.get_context('fork')
+        workers=[context.Process(target=bundles.ingest, args=('sharded', dict(environ, **{
+            'ZIPLINE_ROOT': os.path.join(root, 'shard{}'.format(i)), ig.SHARD_ENV: '{}/3'.format(i)})),
+                                 kwargs={'show_progress': False}) for i in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual([worker.exitcode for worker in workers], [0, 0, 0])
+        shard_paths=[]
+        for i in range(3):
+            path=sharding.pth.data_path(['sharded'], dict(environ, ZIPLINE_ROOT=os.path.join(root, 'shard{}'.format(i))))
+            shard_paths.extend(os.path.join(path, name) for name in os.listdir(path) if not name.startswith('.'))
+        self.assertEqual(sorted(ig.ingestion_shard.load(path).index for path in shard_paths), [0, 1, 2])
+        with self.assertRaises(ValueError):
+            sharding.merge_shards(shard_paths[:2], os.path.join(root, 'incomplete'))
+
+        # the shards are given explicitly, by their ingestion directories or their zipline roots
+        with self.assertRaises(ValueError):
+            sharding.merge_bundle_shards('sharded', environ=environ)
+        with self.assertRaises(ValueError):
+            sharding.merge_bundle_shards('sharded', environ=environ, shard_roots=[os.path.join(root, 'reference')])
+        sharding.merge_bundle_shards('sharded', environ=environ,
+                                     shard_roots=[os.path.join(root, 'shard{}'.format(i)) for i in range(3)])
+        bundle=bundles.load('sharded', environ)
+        self.assertEqual(sorted(bundle.asset_finder.sids), list(range(len(symbols))))
+        for symbol in symbols:
+            asset=bundle.asset_finder.lookup_symbol(symbol, None)
+            self.assertEqual(asset, reference.asset_finder.lookup_symbol(symbol, None))
+            self.assertEqual(list(daily_close(bundle, symbol)), list(daily_close(reference, symbol)))
+        merged=bundle.adjustment_reader.unpack_db_to_component_dfs()
+        for table, df in reference.adjustment_reader.unpack_db_to_component_dfs().items():
+            sort=lambda df: df.sort_values(list(df.columns)).reset_index(drop=True)
+            pd.testing.assert_frame_equal(sort(merged[table]), sort(df), check_dtype=False)
+        # the datasets exported by the shards are merged too
+        equities=export.bundle_dataset('sharded', 'equities', environ=environ).to_table().to_pandas()
+        self.assertEqual(list(equities.sid), list(range(len(symbols))))
+        daily=export.bundle_dataset('sharded', environ=environ).to_table().to_pandas().sort_values(['sid', 'date'])
+        self.assertEqual(sorted(set(daily.symbol)), sorted(symbols))
+        for sid, bars in daily.groupby('sid'):
+            self.assertEqual(list(bars.close), list(daily_close(reference, equities.symbol[sid])))
+        self.assertEqual(len(export.bundle_dataset('sharded', 'splits', environ=environ).to_table()), 4)
+
+    def test_resample_daily_24_7(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        # klines are labelled by their open time, from 00:00 on, and the session of 2020-01-02 has no bar
+        minutes=pd.date_range('2020-01-01 00:00', '2020-01-04 23:59', freq='min')
+        minutes=minutes[(minutes <= pd.Timestamp('2020-01-02 00:00')) | (minutes > pd.Timestamp('2020-01-03 00:00'))]
+        close=np.arange(len(minutes)) + 100.
+        df=pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close, 'volume': 1.},
+                        index=minutes)
+        exporter=export.dataset_exporter()
+        # a numeric symbol stays a string in the partitions of the dataset
+        ingester=ig.direct_ingester('EXX', True, None, lambda symbol: df, symbol_list=('BTCUSDT', '0700'),
+                                    resample_daily=True, exporter=exporter)
+        bundle=zipline_ingest('resample_24_7', ingester, root, '2020-01-01', '2020-01-05', calendar_name='24/7',
+                              minutes_per_day=1440)
+        sessions=pd.date_range('2020-01-01', '2020-01-04')
+        close_at=lambda ts: close[minutes.get_loc(pd.Timestamp(ts))]
+        asset=bundle.asset_finder.lookup_symbol('BTCUSDT', None)
+        # the bar at 00:00 closes the previous session, so the one of 2020-01-01 is out of the bundle sessions
+        daily_close, volume=bundle.equity_daily_bar_reader.load_raw_arrays(['close', 'volume'], sessions[0],
+                                                                           sessions[-1], [asset.sid])
+        np.testing.assert_allclose(daily_close[:, 0], [close_at('2020-01-02 00:00'), np.nan,
+                                                       close_at('2020-01-04 00:00'), close_at('2020-01-04 23:59')])
+        np.testing.assert_allclose(volume[:, 0], [1440, 0, 1440, 1439])
+
+        # the exported daily bars are those written, the session without bar included
+        environ=dict(os.environ, ZIPLINE_ROOT=root)
+        self.assertIsNone(exporter.path)
+        daily=export.bundle_dataset('resample_24_7', 'daily', environ=environ).to_table().to_pandas()
+        self.assertEqual(sorted(set(daily.symbol)), ['0700', 'BTCUSDT'])
+        bars=daily[daily.symbol == '0700'].sort_values('date')
+        self.assertEqual(list(bars.date), list(sessions))
+        np.testing.assert_allclose(bars.close, daily_close[:, 0])
+        self.assertEqual(list(bars.year), [2020] * len(sessions))
+        minute=export.bundle_dataset('resample_24_7', 'minute', environ=environ)
+        self.assertEqual(minute.count_rows(), 2 * len(minutes))
+
+        # a failed ingestion closes the dataset too
+        def failing_downloader(symbol):
+            raise RuntimeError('download failed')
+        with self.assertRaises(RuntimeError):
+            zipline_ingest('resample_24_7_failed', ig.direct_ingester('EXX', True, None, failing_downloader,
+                                                                      symbol_list=('BTCUSDT',), resample_daily=True,
+                                                                      exporter=exporter),
+                           root, '2020-01-01', '2020-01-05', calendar_name='24/7', minutes_per_day=1440)
+        self.assertIsNone(exporter.path)
+
+    def test_export_partitioned_by_symbol(self):
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        zipline_ingest('export_symbol', ig.direct_ingester('EXX', False, None, downloader, symbol_list=('A', 'B'),
+                                                           exporter=export.dataset_exporter(partition_by_year=False)),
+                       root, '2020-01-01', '2020-01-14', calendar_name='24/7')
+        daily=export.bundle_dataset('export_symbol', environ=dict(os.environ, ZIPLINE_ROOT=root))
+        self.assertEqual(daily.partitioning.schema.names, ['symbol'])
+        self.assertNotIn('year', daily.schema.names)
+        self.assertEqual(daily.count_rows(), len(df_A) + len(df_B))
+
+    def test_cached_downloader(self):
+        calls=[]
+        def counting_downloader(symbol, start_date=None):
+            calls.append(symbol)
+            return downloader(symbol)
+        counting_downloader.cache_key=('fake', '2020-01-01', '2020-01-10', 'daily')
+
+        with self.assertRaises(ValueError):
+            ig.cached_downloader(downloader)
+
+        path=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for fmt in ('pickle', 'parquet'):
+            calls.clear()
+            cached=ig.cached_downloader(counting_downloader, os.path.join(path, fmt), fmt=fmt)
+            self.assertTrue(cached('A').equals(df_A))
+            self.assertTrue(cached('A').equals(df_A))
+            self.assertEqual(calls, ['A'])
+            # a new wrapper over the same directory, e.g. a restarted ingestion, hits the cache
+            self.assertTrue(ig.cached_downloader(counting_downloader, os.path.join(path, fmt), fmt=fmt)('A').equals(df_A))
+            self.assertEqual(calls, ['A'])
+            # a different date range is a different entry
+            cached('A', start_date=pd.Timestamp('2020-01-05'))
+            self.assertEqual(calls, ['A', 'A'])
+
+        calls.clear()
+        expired=ig.cached_downloader(counting_downloader, os.path.join(path, 'pickle'), ttl='0s', fmt='pickle')
+        time.sleep(.01)
+        expired('A')
+        self.assertEqual(calls, ['A'])
+
+        calls.clear()
+        small=ig.cached_downloader(counting_downloader, os.path.join(path, 'small'), max_bytes=1, fmt='pickle')
+        small('A')
+        small('B')
+        # the entry just stored is kept, the older ones are evicted
+        self.assertEqual(os.listdir(os.path.join(path, 'small')), [small.entry_name('B') + '.pickle'])
+        self.assertTrue(small('B').equals(df_B))
+        self.assertEqual(calls, ['A', 'B'])
+
+        # without a path, zipline's ingestion cache is used
+        calls.clear()
+        zipline_cache={}
+        cached=ig.cached_downloader(counting_downloader)
+        ingest(ig.direct_ingester('EXX', False, None, cached, symbol_list=('A', 'B')), cache=zipline_cache)
+        ingest(ig.direct_ingester('EXX', False, None, cached, symbol_list=('A', 'B')), cache=zipline_cache)
+        self.assertEqual(sorted(calls), ['A', 'B'])
+        self.assertEqual(len(zipline_cache), 2)
+
+        # writes into the ingestion cache are serialized
+        class recording_cache(dict):
+            active, peak=0, 0
+            def __setitem__(self, key, value):
+                recording_cache.active += 1
+                recording_cache.peak=max(recording_cache.peak, recording_cache.active)
+                time.sleep(.01)
+                super().__setitem__(key, value)
+                recording_cache.active -= 1
+        symbols=[chr(ord('A') + i) for i in range(8)]
+        ingest(ig.direct_ingester('EXX', False, None, cached, symbol_list=symbols, max_workers=4), cache=recording_cache())
+        self.assertEqual(recording_cache.peak, 1)
+
+    def test_batch_downloader(self):
+        calls=[]
+        def batch_downloader(symbols, start_date=None):
+            calls.append(list(symbols))
+            # symbol 'E' has no data
+            return {symbol: df_A + ord(symbol) for symbol in symbols if symbol != 'E'}
+        batch_downloader.batch_size=3
+        batch_downloader.cache_key=('fake', '2020-01-01', '2020-01-10', 'daily')
+
+        symbols=[chr(ord('A') + i) for i in range(7)]
+        ingester=ig.direct_ingester('EXX', False, None, batch_downloader, symbol_list=symbols, max_workers=2)
+        bar_writer, db_writer=ingest(ingester)
+        self.assertEqual([len(batch) for batch in calls], [3, 3, 1])
+        self.assertEqual([sid for sid, _ in bar_writer.dfs], [0, 1, 2, 3, 5, 6])
+        for sid, df in bar_writer.dfs:
+            self.assertTrue(df.equals(df_A + ord(db_writer.df_metadata.symbol.loc[sid])))
+        self.assertEqual(ingester._metadata.missing(), ['E'])
+
+        # the cache wrapper only downloads the symbols of a batch missing from the cache
+        calls.clear()
+        zipline_cache={}
+        cached=ig.cached_downloader(batch_downloader)
+        self.assertEqual(cached.batch_size, 3)
+        ingest(ig.direct_ingester('EXX', False, None, cached, symbol_list=symbols[:2]), cache=zipline_cache)
+        ingest(ig.direct_ingester('EXX', False, None, cached, symbol_list=symbols[:3]), cache=zipline_cache)
+        self.assertEqual(calls, [['A', 'B'], ['C']])
+
+    def test_downloader_lifecycle(self):
+        events=[]
+        def session_downloader(symbol, start_date=None):
+            events.append(symbol)
+            if symbol == 'C':
+                raise ConnectionError('connection reset')
+            return downloader(symbol)
+        session_downloader.open=lambda: events.append('open')
+        session_downloader.close=lambda: events.append('close')
+        session_downloader.cache_key=('fake', '2020-01-01', '2020-01-10', 'daily')
+
+        ingest(ig.direct_ingester('EXX', False, None, session_downloader, symbol_list=('A', 'B')))
+        # symbols are downloaded in the order of the symbol set
+        self.assertEqual((events[0], sorted(events[1:-1]), events[-1]), ('open', ['A', 'B'], 'close'))
+        # the lifecycle is forwarded by the cache wrapper and closes failed ingestions too
+        events.clear()
+        with self.assertRaises(ConnectionError):
+            ingest(ig.direct_ingester('EXX', False, None, ig.cached_downloader(session_downloader),
+                                      symbol_list=('C',)), cache={})
+        self.assertEqual(events, ['open', 'C', 'close'])
+
+    def test_lazy_ingester(self):
+        self.assertEqual(ig.deferred('os.path:join', 'a', 'b').resolve(), os.path.join('a', 'b'))
+        with self.assertRaises(ValueError):
+            ig.deferred('os.path.join')
+
+        created=[]
+        def get_downloader(prefix):
+            created.append(prefix)
+            return downloader
+        bundle=ig.lazy_ingester(ig.direct_ingester, 'EXX', False, None, ig.deferred(get_downloader, 'fake'),
+                                symbol_list=('A', 'B'))
+        # nothing is created at registration
+        self.assertEqual(created, [])
+        bar_writer, db_writer=ingest(bundle)
+        self.assertEqual(created, ['fake'])
+        self.assertEqual(sorted(db_writer.df_metadata.symbol), ['A', 'B'])
+        # the ingester is created once
+        self.assertIs(bundle.ingester, bundle.ingester)
+        ingest(bundle)
+        self.assertEqual(created, ['fake'])
+
+    def test_align_to_sessions(self):
+        cal=get_calendar('NYSE')
+        # df_A spans 2020-01-01 to 2020-01-10, with a holiday and a weekend
+        aligned=ig.align_to_sessions(df_A, cal)
+        self.assertEqual(list(aligned.index), list(cal.sessions_in_range('2020-01-02', '2020-01-10')))
+        self.assertTrue(aligned.equals(df_A[[cal.is_session(dt) for dt in df_A.index]]))
+
+        gappy=aligned.drop(pd.Timestamp('2020-01-07'))
+        self.assertTrue(ig.align_to_sessions(gappy, cal).equals(gappy))
+        filled=ig.align_to_sessions(gappy, cal, fill='ffill', report=True)
+        self.assertEqual(list(filled.index), list(aligned.index))
+        gap=filled.loc['2020-01-07']
+        self.assertEqual(list(gap[['open', 'high', 'low', 'close']]), [aligned.close.loc['2020-01-06']] * 4)
+        self.assertEqual(gap.volume, 0)
+        self.assertEqual(gap.split, 1)
+
+        minutes=pd.date_range('2020-01-02 14:00', periods=120, freq='min')
+        df_min=pd.DataFrame({'open': 1., 'high': 1., 'low': 1., 'close': 1., 'volume': 1.}, index=minutes)
+        aligned=ig.align_to_sessions(df_min, cal, every_min_bar=True)
+        self.assertEqual(aligned.index[0], pd.Timestamp('2020-01-02 14:31'))
+        self.assertEqual(len(aligned), 89)
+        self.assertIsNone(aligned.index.tz)
+
+        with self.assertRaises(ValueError):
+            ig.align_to_sessions(df_A, cal, fill='bfill')
+
+    def test_named_filter(self):
+        cal=get_calendar('NYSE')
+        bar_writer, _=ingest(ig.direct_ingester('EXX', False, None, downloader, symbol_list=('A', 'B'),
+                                                filter_cb='sessions'), calendar=cal)
+        for _, df in bar_writer.dfs:
+            self.assertEqual(len(df), 7)
+        with self.assertRaises(ValueError):
+            ingest(ig.direct_ingester('EXX', False, None, downloader, symbol_list=('A',), filter_cb='weekdays'),
+                   calendar=cal)
+
+    def test_validation(self):
+        dates=[_g_start_date + pd.Timedelta(days=i) for i in range(8)]
+        good=pd.DataFrame({'open': 10., 'high': 12., 'low': 9., 'close': 11., 'volume': 100,
+                           'dividend': 0., 'split': 1.}, index=pd.DatetimeIndex(dates))
+        bad=good.copy()
+        bad.loc[dates[1], 'close']=-1.
+        bad.loc[dates[2], 'high']=8.
+        bad.loc[dates[3], 'open']=np.nan
+        bad.loc[dates[4], 'volume']=0
+        # a bar out of order, and a later bar with the timestamp of dates[5]
+        bad=pd.concat([bad.iloc[[0, 6, 1, 2, 3, 4, 5]], bad.iloc[[5]].assign(close=11.5), bad.iloc[[7]]])
+
+        def ingest_bad(validator):
+            bar_writer, _=ingest(ig.direct_ingester('EXX', False, None, lambda symbol: bad.copy(), symbol_list=('A',),
+                                                    validator=validator))
+            return bar_writer.dfs[0][1]
+
+        root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        validator=ig.bar_validator('repair', {'negative_price': 'quarantine'}, quarantine_dir=root)
+        df=ingest_bad(validator)
+        self.assertEqual(list(df.index), [date for date in dates if date != dates[1]])
+        self.assertEqual(df.loc[dates[5], 'close'], 11.5)
+        self.assertEqual(df.loc[dates[3], 'open'], 11.)
+        self.assertEqual((df.loc[dates[2], 'high'], df.loc[dates[2], 'low']), (11., 8.))
+        self.assertEqual(df.loc[dates[4], 'volume'], 0)
+        quarantined=pd.read_csv(os.path.join(root, 'A.csv'), index_col=0, parse_dates=True)
+        self.assertEqual(list(quarantined.index), [dates[1]])
+        self.assertEqual(list(quarantined.check), ['negative_price'])
+        summary=validator.summary()
+        self.assertEqual(summary['bars'], 9)
+        self.assertEqual({check: counts['bars'] for check, counts in summary['checks'].items() if counts['bars']},
+                         {'unsorted': 1, 'duplicate': 1, 'missing_price': 1, 'negative_price': 1, 'high_low': 1,
+                          'zero_volume': 1})
+
+        # unsorted bars are dropped rather than sorted, only the bar out of order is flagged
+        self.assertEqual(list(ingest_bad(ig.bar_validator('drop')).index), [dates[0], dates[4], dates[5], dates[7]])
+        future=pd.concat([good.iloc[:2], good.iloc[[0]].set_axis([pd.Timestamp('2030-01-01')]), good.iloc[2:]])
+        pd.testing.assert_frame_equal(ig.bar_validator('drop').validate(future), good)
+        past=pd.concat([good.iloc[:5], good.iloc[[0]].set_axis([pd.Timestamp('2000-01-01')]), good.iloc[5:]])
+        pd.testing.assert_frame_equal(ig.bar_validator('drop').validate(past), good)
+        # the bars kept are sorted whatever the order
+        shuffled=pd.DataFrame({'close': 1.}, index=pd.DatetimeIndex(np.random.default_rng(0).permutation(
+            pd.date_range('2020-01-01', periods=1000, freq='min'))))
+        self.assertTrue(ig.bar_validator('drop').validate(shuffled).index.is_monotonic_increasing)
+        # missing prices without close column are dropped by 'repair'
+        no_close=good.drop(columns='close')
+        no_close.loc[dates[3], 'open']=np.nan
+        pd.testing.assert_frame_equal(ig.bar_validator('repair').validate(no_close), no_close.drop(dates[3]))
+        df=ingest_bad(ig.bar_validator('repair', {'zero_volume': 'drop'}))
+        self.assertNotIn(dates[4], df.index)
+        pd.testing.assert_frame_equal(ig.bar_validator('fail').validate(good), good)
+        with self.assertRaisesRegex(ValueError, "'unsorted'"):
+            ingest_bad(ig.bar_validator('fail'))
+        with self.assertRaises(ValueError):
+            ig.bar_validator('quarantine')
+        with self.assertRaises(ValueError):
+            ig.bar_validator(policies={'spread': 'drop'})
+
+    def test_token_bucket(self):
+        now=[0.]
+        def sleep(seconds):
+            now[0] += seconds
+        bucket=ig.token_bucket(rate=10, capacity=5, clock=lambda: now[0], sleep=sleep)
+        for _ in range(5):
+            bucket.acquire()
+        self.assertEqual(now[0], 0.)
+        bucket.acquire()
+        self.assertAlmostEqual(now[0], .1)
+        bucket.acquire(5)
+        self.assertAlmostEqual(now[0], .6)
+        with self.assertRaises(ValueError):
+            bucket.acquire(6)
+
+        # the ingester takes a token per download, the second one waits for it
+        now[0]=0.
+        bucket=ig.token_bucket(rate=20, capacity=1, clock=lambda: now[0], sleep=sleep)
+        ingest(ig.direct_ingester('EXX', False, None, downloader, symbol_list=('A', 'B', 'C'), rate_limit=bucket))
+        self.assertAlmostEqual(now[0], .1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,57 @@
+"""fake writers and ingestion helpers shared by the ingester tests"""
+import os
+import pandas as pd
+from zipline.data import bundles
+
+class fake_adjustment_writer:
+    def write(self, splits=None, dividends=None):
+        self.splits = splits
+        self.dividends = dividends
+
+class fake_bar_writer:
+    def write(self, gen, show_progress):
+        self.dfs = list(gen)
+
+class fake_db_writer:
+    def write(self,equities): # asset_db_writer
+        self.df_metadata = equities
+
+def ingest(ingester, cache=None, calendar=None, adjustment_writer=None, start_session=None, end_session=None):
+    """runs `ingester` with fake writers and returns the bar and the asset db writers"""
+    bar_writer=fake_bar_writer()
+    db_writer=fake_db_writer()
+    adjustment_writer=adjustment_writer or fake_adjustment_writer()
+    ingester(environ=None,
+             asset_db_writer=db_writer,
+             minute_bar_writer=None,
+             daily_bar_writer=bar_writer,
+             adjustment_writer=adjustment_writer,
+             calendar=calendar,
+             start_session=start_session,
+             end_session=end_session,
+             cache=cache,
+             show_progress=False,
+             output_dir=None)
+    return bar_writer, db_writer
+
+def zipline_ingest(name, ingester, root, start_session='2019-01-02', end_session='2020-12-31', calendar_name='NYSE',
+                   **kwargs):
+    """registers `ingester` as bundle `name` and ingests it into zipline root `root`
+
+    :return: the loaded bundle data
+    """
+    environ=dict(os.environ, ZIPLINE_ROOT=root)
+    bundles.register(name, ingester, calendar_name=calendar_name,
+                     start_session=pd.Timestamp(start_session), end_session=pd.Timestamp(end_session), **kwargs)
+    try:
+        # ingestion directories are named after the ingestion time
+        bundles.ingest(name, environ, timestamp=pd.Timestamp.utcnow())
+        return bundles.load(name, environ)
+    finally:
+        bundles.unregister(name)
+
+def daily_close(bundle, symbol):
+    """returns the daily close prices of `symbol` in `bundle`"""
+    asset=bundle.asset_finder.lookup_symbol(symbol, None)
+    close,=bundle.equity_daily_bar_reader.load_raw_arrays(['close'], asset.start_date, asset.end_date, [asset.sid])
+    return close[:, 0]
@@ -0,0 +1,52 @@
+from context import iex
+
+import unittest
+import pandas as pd
+
+def historical_data(symbols, dates):
+    """returns price data indexed by symbol and date as returned by a batch request"""
+    index=pd.MultiIndex.from_product([symbols, dates], names=['symbol', 'date'])
+    return pd.DataFrame({'close': range(len(index)), 'volume': 100}, index=index)
+
+class IexTestCase(unittest.TestCase):
+    def setUp(self):
+        self._get_historical_data=iex.get_historical_data
+        self.requests=[]
+
+    def tearDown(self):
+        iex.get_historical_data=self._get_historical_data
+
+    def test_split_batch(self):
+        dates=pd.date_range('2020-01-02', periods=3)
+        df=historical_data(['AAPL', 'MSFT'], dates)
+        frames=iex.split_batch(df, ['aapl', 'MSFT', 'NODATA'])
+        # symbols without data are left out, the others keyed by the requested symbol
+        self.assertEqual(sorted(frames), ['MSFT', 'aapl'])
+        for symbol, key in (('aapl', 'AAPL'), ('MSFT', 'MSFT')):
+            self.assertEqual(list(frames[symbol].index), list(dates))
+            self.assertTrue(frames[symbol].equals(df.loc[key]))
+
+        # a single symbol is returned indexed by date only
+        single=df.loc['AAPL']
+        self.assertIs(iex.split_batch(single, ['AAPL'])['AAPL'], single)
+        self.assertEqual(iex.split_batch(pd.DataFrame(), ['AAPL', 'MSFT']), {})
+
+    def test_batch_downloader(self):
+        dates=pd.date_range('2020-01-02', periods=3)
+        def get_historical_data(symbols, start, end, output_format, session):
+            self.requests.append(symbols)
+            return historical_data([s for s in symbols if s != 'NODATA'], dates)
+        iex.get_historical_data=get_historical_data
+
+        downloader=iex.get_downloader('2020-01-01', '2020-01-31', batch_size=3)
+        self.assertEqual(downloader.batch_size, 3)
+        try:
+            frames=downloader(('AAPL', 'NODATA', 'MSFT'))
+        finally:
+            downloader.close()
+        self.assertEqual(self.requests, [['AAPL', 'NODATA', 'MSFT']])
+        self.assertEqual(sorted(frames), ['AAPL', 'MSFT'])
+        self.assertEqual(len(frames['MSFT']), 3)
+
+if __name__ == '__main__':
+    unittest.main()
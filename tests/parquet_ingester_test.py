@@ -0,0 +1,138 @@
+from context import ingester as ig, columnar
+
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import pyarrow
+import pyarrow.parquet
+
+from csv_ingester_test import _g_csvdir, _g_column_mapper
+from helpers import ingest, zipline_ingest, daily_close
+
+class scan_counter:
+    """counts the scans of the whole dataset opened by a parquet ingester"""
+    def __init__(self, ingester):
+        self.scans=0
+        open_dataset=ingester._open_dataset
+        ingester._open_dataset=lambda path: dataset_proxy(open_dataset(path), self)
+
+class dataset_proxy:
+    def __init__(self, dataset, counter):
+        self._dataset=dataset
+        self._counter=counter
+
+    def to_table(self, columns=None, **kwargs):
+        if columns != ['ticker']: # listing the symbols reads a single column
+            self._counter.scans+=1
+        return self._dataset.to_table(columns=columns, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._dataset, name)
+
+class parquet_ingester_test(unittest.TestCase):
+    def setUp(self):
+        self.root=tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.expected, _ = ingest(ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper))
+        self.sources={symbol: pd.read_csv(os.path.join(_g_csvdir, symbol + '.csv'), index_col='Date', parse_dates=True)
+                      for symbol in ('AAPL', 'SPY')}
+
+    def write_files(self, fmt, **kwargs):
+        """writes the csv files of the repo as one `fmt` file per symbol and returns their directory"""
+        path=os.path.join(self.root, fmt + ''.join(kwargs.values()))
+        os.mkdir(path)
+        for symbol, df in self.sources.items():
+            file_path=os.path.join(path, symbol + columnar.COLUMNAR_FORMATS[fmt])
+            if fmt == 'parquet':
+                df.to_parquet(file_path)
+            elif fmt == 'feather':
+                df.reset_index().to_feather(file_path)
+            else:
+                df.to_hdf(file_path, key='prices', **kwargs)
+        return path
+
+    def assert_expected(self, writer, db_writer):
+        self.assertEqual([sid for sid, _ in writer.dfs], [0, 1])
+        for (_, df), (_, expected) in zip(writer.dfs, self.expected.dfs):
+            pd.testing.assert_frame_equal(df, expected, check_index_type=False, check_dtype=False, check_freq=False)
+        self.assertEqual(list(db_writer.df_metadata.symbol), ['AAPL', 'SPY'])
+
+    def test_file_per_symbol(self):
+        for fmt, kwargs in (('parquet', {}), ('feather', {}), ('hdf', {'format': 'table'}), ('hdf', {'format': 'fixed'})):
+            path=self.write_files(fmt, **kwargs)
+            self.assert_expected(*ingest(columnar.parquet_ingester('EXX', False, path, index_column='Date',
+                                                                   column_mapper=_g_column_mapper, fmt=fmt)))
+
+            # the session range is pushed down to the reader
+            writer, db_writer=ingest(columnar.parquet_ingester('EXX', False, path, index_column='Date',
+                                                               column_mapper=_g_column_mapper, fmt=fmt,
+                                                               usecols=('open', 'close')),
+                                     start_session=pd.Timestamp('2020-01-02'), end_session=pd.Timestamp('2020-01-31'))
+            for _, df in writer.dfs:
+                self.assertEqual(list(df.columns), ['open', 'close', 'dividend', 'split'])
+                self.assertEqual((df.index[0], df.index[-1]), (pd.Timestamp('2020-01-02'), pd.Timestamp('2020-01-31')))
+                self.assertEqual(len(df), 21)
+        self.assertRaises(ValueError, columnar.parquet_ingester, 'EXX', False, path, fmt='csv')
+
+    def test_without_pyarrow(self):
+        self.addCleanup(setattr, columnar, 'pyarrow', columnar.pyarrow)
+        columnar.pyarrow=None
+        with self.assertRaises(ImportError):
+            columnar.parquet_ingester('EXX', False, self.root)
+        # hdf files are read by pandas
+        columnar.parquet_ingester('EXX', False, self.root, fmt='hdf')
+
+    def test_dataset(self):
+        # a dataset partitioned by symbol and a single file holding all symbols
+        table=pyarrow.Table.from_pandas(pd.concat([df.assign(ticker=symbol) for symbol, df in self.sources.items()]))
+        pyarrow.parquet.write_to_dataset(table, os.path.join(self.root, 'partitioned'), partition_cols=['ticker'])
+        pyarrow.parquet.write_table(table, os.path.join(self.root, 'all.parquet'), row_group_size=64)
+        for path, scans in (('partitioned', 0), ('all.parquet', 1)):
+            ingester=columnar.parquet_ingester('EXX', False, os.path.join(self.root, path), index_column='Date',
+                                               column_mapper=_g_column_mapper, symbol_column='ticker')
+            counter=scan_counter(ingester)
+            self.assert_expected(*ingest(ingester))
+            # the partitions are read directly, and a dataset not partitioned by symbol is scanned once
+            self.assertEqual(counter.scans, scans)
+
+        # the bars of every symbol after its last bar are sliced from the single scan
+        path=os.path.join(self.root, 'incremental.parquet')
+        pyarrow.parquet.write_table(pyarrow.Table.from_pandas(pd.concat([df.iloc[:100].assign(ticker=symbol)
+                                                                         for symbol, df in self.sources.items()])), path)
+        make_ingester=lambda: columnar.parquet_ingester('EXX', False, path, index_column='Date',
+                                                        column_mapper=_g_column_mapper, symbol_column='ticker',
+                                                        incremental=True)
+        zipline_ingest('parquet_dataset', make_ingester(), self.root)
+        pyarrow.parquet.write_table(table, path, row_group_size=64)
+        second=zipline_ingest('parquet_dataset', make_ingester(), self.root)
+        full=zipline_ingest('csv_full', ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper), self.root)
+        for symbol in self.sources:
+            self.assertEqual(list(daily_close(second, symbol)), list(daily_close(full, symbol)))
+
+    def test_incremental(self):
+        path=os.path.join(self.root, 'parquet')
+        os.mkdir(path)
+        for symbol, df in self.sources.items():
+            df.iloc[:100].to_parquet(os.path.join(path, symbol + '.parquet'))
+        make_ingester=lambda: columnar.parquet_ingester('EXX', False, path, index_column='Date', column_mapper=_g_column_mapper,
+                                                        incremental=True)
+        first=zipline_ingest('parquet_incremental', make_ingester(), self.root)
+        self.assertEqual(len(daily_close(first, 'AAPL')), 100)
+
+        for symbol, df in self.sources.items():
+            df.to_parquet(os.path.join(path, symbol + '.parquet'))
+        loaded=[]
+        ingester=make_ingester()
+        load=ingester._load
+        ingester._load=lambda job: loaded.append(load(job)) or loaded[-1]
+        second=zipline_ingest('parquet_incremental', ingester, self.root)
+        for _, symbol, df in loaded:
+            self.assertEqual(len(df), len(self.sources[symbol]) - 100)
+        full=zipline_ingest('csv_full', ig.csv_ingester('EXX', False, _g_csvdir, None, 'Date', _g_column_mapper), self.root)
+        for symbol in self.sources:
+            self.assertEqual(list(daily_close(second, symbol)), list(daily_close(full, symbol)))
+
+if __name__ == '__main__':
+    unittest.main()
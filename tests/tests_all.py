@@ -2,12 +2,20 @@ import unittest
 
 import csv_ingester_test
 import direct_ingester_test
+import parquet_ingester_test
+import binance_test
+import yahoo_test
+import iex_test
 
 loader=unittest.TestLoader()
 suite=unittest.TestSuite()
 
 suite.addTest(loader.loadTestsFromModule(csv_ingester_test))
 suite.addTest(loader.loadTestsFromModule(direct_ingester_test))
+suite.addTest(loader.loadTestsFromModule(parquet_ingester_test))
+suite.addTest(loader.loadTestsFromModule(binance_test))
+suite.addTest(loader.loadTestsFromModule(yahoo_test))
+suite.addTest(loader.loadTestsFromModule(iex_test))
 
 runner=unittest.TextTestRunner(verbosity=3)
 result=runner.run(suite)
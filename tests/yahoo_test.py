@@ -0,0 +1,154 @@
+from context import ingester as ig, yahoo
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+import http.server
+import numpy as np
+import pandas as pd
+from zipline.data.data_portal import DataPortal
+from zipline.utils.calendar_utils import get_calendar
+from helpers import zipline_ingest, daily_close
+
+_g_fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def load_fixture(symbol):
+    """returns the recorded response of `get_historical_price_data` for `symbol`"""
+    with open(os.path.join(_g_fixtures, 'yahoo_{}.json'.format(symbol))) as f:
+        return json.load(f)
+
+class fake_yahoo_financials:
+    """replays recorded responses instead of calling yahoo REST API"""
+    sessions = []
+
+    def __init__(self, symbol, session=None):
+        self._symbol = symbol
+        fake_yahoo_financials.sessions.append(session)
+
+    def get_historical_price_data(self, start_date, end_date, time_interval):
+        try:
+            return load_fixture(self._symbol)
+        except FileNotFoundError: # as yahoofinancials does for unknown symbols
+            return {self._symbol: {'eventsData': []}}
+
+class stub_handler(http.server.BaseHTTPRequestHandler):
+    """responds to every request with an empty json object, keeping the connection alive"""
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+
+    def do_GET(self):
+        stub_handler.connections.add(self.client_address)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+class YahooTestCase(unittest.TestCase):
+    def setUp(self):
+        self._yahoo_financials = yahoo.YahooFinancials
+        yahoo.YahooFinancials = fake_yahoo_financials
+        fake_yahoo_financials.sessions = []
+
+    def tearDown(self):
+        yahoo.YahooFinancials = self._yahoo_financials
+
+    def test_prices2ohlcv(self):
+        data = load_fixture('AAPL')['AAPL']
+        df = yahoo.prices2ohlcv(data)
+        self.assertEqual(list(df.columns), ['open', 'close', 'low', 'high', 'volume', 'dividend', 'split'])
+        self.assertEqual(len(df), len(data['prices']))
+        # epoch dates are converted to the trading day in the exchange time zone
+        self.assertEqual(list(df.index), [pd.Timestamp(p['formatted_date']) for p in data['prices']])
+        # the prices and the volumes before the 2:1 split are unadjusted
+        before = df.index < '2019-09-16'
+        for column in ('open', 'close', 'low', 'high'):
+            expected = [p[column] for p in data['prices']]
+            self.assertEqual(list(df[column][before]), [2 * price for price in expected[:before.sum()]])
+            self.assertEqual(list(df[column][~before]), expected[before.sum():])
+        volume = [p['volume'] for p in data['prices']]
+        self.assertEqual(list(df.volume[before]), [round(v / 2) for v in volume[:before.sum()]])
+        self.assertEqual(list(df.volume[~before]), volume[before.sum():])
+
+        self.assertEqual(df.dividend.loc['2019-08-09'], 2 * .77)
+        self.assertEqual(df.dividend.drop(pd.Timestamp('2019-08-09')).abs().sum(), 0)
+        self.assertEqual(df.split.loc['2019-09-16'], 2)
+        self.assertTrue((df.split.drop(pd.Timestamp('2019-09-16')) == 1).all())
+
+    def test_prices2ohlcv_without_events(self):
+        data = load_fixture('SPY')['SPY']
+        df = yahoo.prices2ohlcv(data)
+        self.assertEqual(len(df), 5)
+        self.assertEqual(list(df.close), [p['close'] for p in data['prices']])
+        self.assertTrue((df.dividend == 0).all())
+        self.assertTrue((df.split == 1).all())
+
+    def test_downloader(self):
+        downloader = yahoo.get_downloader('2019-07-01', '2019-10-01')
+        df = downloader('AAPL')
+        self.assertTrue(df.equals(yahoo.prices2ohlcv(load_fixture('AAPL')['AAPL'])))
+        self.assertTrue(downloader('AAPL', start_date='2019-10-02').empty)
+        with self.assertRaises(ValueError):
+            downloader('MSFT')
+
+    def test_split_adjusted_once(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        ingester = ig.direct_ingester('YAHOO', False, None, yahoo.get_downloader('2019-07-01', '2019-10-01'),
+                                      symbol_list=['AAPL'])
+        bundle = zipline_ingest('yahoo_split', ingester, root, '2019-07-02', '2019-09-30')
+        calendar = get_calendar('NYSE')
+        portal = DataPortal(bundle.asset_finder, calendar, calendar.first_session,
+                            equity_daily_reader=bundle.equity_daily_bar_reader,
+                            adjustment_reader=bundle.adjustment_reader)
+        asset = bundle.asset_finder.lookup_symbol('AAPL', None)
+        prices = load_fixture('AAPL')['AAPL']['prices']
+        sessions = calendar.sessions_in_range('2019-07-02', '2019-09-30')
+        self.assertEqual(len(sessions), len(prices))
+        # the history adjusted by the bundle is the split adjusted history given by yahoo, adjusted by the dividend
+        expected = np.array([p['close'] for p in prices])
+        ex_date = [p['formatted_date'] for p in prices].index('2019-08-09')
+        expected[:ex_date] *= 1 - .77 / expected[ex_date - 1]
+        history = portal.get_history_window([asset], sessions[-1], len(sessions), '1d', 'close', 'daily')
+        np.testing.assert_allclose(history[asset].values, expected, rtol=1e-4)
+        # the raw prices before the split are twice as high
+        close = daily_close(bundle, 'AAPL')
+        np.testing.assert_allclose(close[:-11], [2 * p['close'] for p in prices[:-11]], rtol=1e-3)
+
+    def test_session_reuse(self):
+        downloader = yahoo.get_downloader('2019-07-01', '2019-10-01')
+        downloader.open()
+        downloader('AAPL')
+        downloader('SPY')
+        session = fake_yahoo_financials.sessions[0]
+        self.assertIsNotNone(session)
+        self.assertEqual(fake_yahoo_financials.sessions, [session, session])
+        downloader.close()
+        downloader('AAPL')
+        self.assertIsNot(fake_yahoo_financials.sessions[-1], session)
+        downloader.close()
+
+    def test_pooled_session(self):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), stub_handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stub_handler.connections = set()
+        url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+        try:
+            session = yahoo.pooled_session(4)
+            for _ in range(10):
+                self.assertEqual(session.get(url).json(), {})
+            session.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+        # sequential requests are sent over a single kept-alive connection
+        self.assertEqual(len(stub_handler.connections), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,33 +1,92 @@
 import os
-from pandas import Timestamp, DataFrame
+import copy
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pandas import Timestamp, Timedelta, DataFrame, to_datetime
 from binance.client import Client
+from .downloads import pooled_session, shared_resource
 
 API_KEY_ENV='BINANCE_API_KEY'
 SECRET_KEY_ENV='BINANCE_SECRET_KEY'
 
+# the maximum number of klines returned by a single request
+MAX_KLINES_PER_REQUEST=1000
 
-def klines2ohlcv(klines):
+_INTERVAL_MS={Client.KLINE_INTERVAL_1MINUTE: 60 * 1000,
+              Client.KLINE_INTERVAL_1DAY: 24 * 60 * 60 * 1000,}
+
+# kline fields stored by zipline, and their position in a kline
+OHLCV_FIELDS={'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5,}
+# optional kline fields, and their position in a kline
+EXTRA_FIELDS={'quote_volume': 7, 'trades': 8, 'taker_buy_volume': 9, 'taker_buy_quote_volume': 10,}
+
+def klines2array(klines, extra_fields=False):
+    """converts klines into a 2-dimensional float array
+
+    The conversion is done column-wise by numpy instead of one python
+    call per field of each kline.
+
+    :param klines: The list of klines
+    :type klines: list of price data
+    :param extra_fields: if `True`, the fields in `EXTRA_FIELDS` are
+    included after the OHLCV fields
+    :type extra_fields: bool
+    :return: an array with one row per kline, whose columns are open
+    time in milliseconds, the fields in `OHLCV_FIELDS` and optionally
+    those in `EXTRA_FIELDS`
+    :rtype: numpy.ndarray
+    """
+    positions=[0] + list(OHLCV_FIELDS.values()) + (list(EXTRA_FIELDS.values()) if extra_fields else [])
+    if not klines:
+        return np.empty((0, len(positions)))
+    return np.array(klines, dtype=object)[:, positions].astype(np.float64)
+
+def array2ohlcv(arr, extra_fields=False):
+    """converts an array returned by `klines2array` into pandas dataframe complaint with OHLCV
+    """
+    columns=list(OHLCV_FIELDS) + (list(EXTRA_FIELDS) if extra_fields else [])
+    index=to_datetime(arr[:, 0].astype(np.int64), unit='ms')
+    index.name='date'
+    df=DataFrame(arr[:, 1:], columns=columns, index=index)
+    if extra_fields:
+        df['trades']=df['trades'].astype(np.int64)
+    return df
+
+def klines2ohlcv(klines, extra_fields=False):
     """converts klines downloaded from binace via python binance module
     into pandas dataframe complaint with OHLCV
     :param klines: The list of klines
     :type klines: list of price data, see https://sammchardy
+    :param extra_fields: if `True`, the quote asset volume, the number
+    of trades and the taker buy volumes are added as columns
+    `quote_volume`, `trades`, `taker_buy_volume` and
+    `taker_buy_quote_volume`
+    :type extra_fields: bool
     """
-    ohlcv=[(Timestamp(l[0], unit='ms'),  # timestamp
-            float(l[1]),                   # open
-            float(l[2]),                   # high
-            float(l[3]),                   # low
-            float(l[4]),                   # close
-            float(l[5])                    # volume
-            )
-        for l in klines]
-
-    df=DataFrame(ohlcv, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
-    df.set_index('date', inplace=True)
+    return array2ohlcv(klines2array(klines, extra_fields), extra_fields)
 
-    return df
+def _epoch_ms(ts):
+    """returns timestamp `ts` in milliseconds since the epoch, naive timestamps being in UTC"""
+    return int(Timestamp(ts).timestamp()*1000)
+
+def get_downloader(start_date, end_date, every_min_bar, chunk_size=MAX_KLINES_PER_REQUEST, max_workers=1, checkpoint_dir=None,
+                   extra_fields=False, pool_size=10):
+    """returns a downloader closure for binance
+
+    The downloader has `open` and `close` methods, called by
+    `direct_ingester` at the beginning and the end of an ingestion.
+    Between them, a single client is created, which pings the server
+    once, and its HTTP session, whose connections are kept alive, is
+    shared by all symbols and threads. Every thread works on its own
+    shallow copy of the client, because the client stores the last
+    response in an attribute. A downloader called before `open`
+    opens the client itself. Its `bind_sessions` method, called by
+    `direct_ingester` too, returns a new downloader whose range is
+    narrowed to the sessions of an ingestion, and leaves this one
+    unchanged.
 
-def get_downloader(start_date, end_date, every_min_bar):
-    """returns a downloader closure for iex cloud
     :param start_date: the first day on which dat are downloaded
     :param end_date: the last day on which data are downloaded
     :type start_date: str in format YYYY-MM-DD
@@ -35,24 +94,152 @@ def get_downloader(start_date, end_date, every_min_bar):
     :param every_min_bar: True if the the price time series must be
     downloaded for every minute. Otherwise the daily price is fetched.
     :type every_min_bar: bool
+    :param chunk_size: the number of klines fetched by a single
+    request. It cannot exceed `MAX_KLINES_PER_REQUEST`.
+    :type chunk_size: int
+    :param max_workers: the number of chunks fetched concurrently
+    :type max_workers: int
+    :param checkpoint_dir: the directory where every completed chunk
+    is stored. A download interrupted by a failure resumes from the
+    stored chunks, which are removed once the symbol is downloaded.
+    The chunks are aligned on multiples of `chunk_size` klines since
+    the epoch, so a download resumed from another start date reuses
+    them too. The default value `None` disables checkpoints.
+    :type checkpoint_dir: str
+    :param extra_fields: if `True`, the downloaded dataframe
+    additionally contains the columns in `EXTRA_FIELDS`
+    :type extra_fields: bool
+    :param pool_size: the maximum number of connections kept alive,
+    which should not be less than the number of concurrent requests
+    :type pool_size: int
     """
-    dt_start=int(Timestamp(start_date).timestamp()*1000)
-    dt_end=int(Timestamp(end_date).timestamp()*1000)
+    if not 0 < chunk_size <= MAX_KLINES_PER_REQUEST:
+        raise ValueError('chunk_size must be in (0, {}], got {}'.format(MAX_KLINES_PER_REQUEST, chunk_size))
+    dt_start=_epoch_ms(start_date)
+    dt_end=_epoch_ms(end_date)
+    freq=Client.KLINE_INTERVAL_1MINUTE if every_min_bar else Client.KLINE_INTERVAL_1DAY
+    interval_ms=_INTERVAL_MS[freq]
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    local=threading.local()
 
-    def downloader(symbol):
-        """downloads symbol price data using iex cloud API
-        :param symbol: the symbol name
-        :type symbol: str
+    def bind_sessions(start_session, end_session):
+        """returns a downloader of the klines opening from
+        `start_session` to the end of `end_session` within the range
+        of this one
         """
+        start, end = dt_start, dt_end
+        if start_session is not None:
+            start=max(start, _epoch_ms(start_session))
+        if end_session is not None:
+            end=min(end, _epoch_ms(Timestamp(end_session) + Timedelta(days=1)) - 1)
+        return get_downloader(Timestamp(start, unit='ms'), Timestamp(end, unit='ms'), every_min_bar, chunk_size,
+                              max_workers, checkpoint_dir, extra_fields, pool_size)
+
+    def create_client():
+        """creates the client shared by the downloads, whose HTTP session is pooled"""
         api_key=os.environ.get(API_KEY_ENV)
         secret_key=os.environ.get(SECRET_KEY_ENV)
         if api_key is None or secret_key is None:
             raise Exception('Both {} and {} environment variables must be defined'.format(API_KEY_ENV, SECRET_KEY_ENV))
         cl=Client(api_key, secret_key)
-        freq=Client.KLINE_INTERVAL_1MINUTE if every_min_bar else Client.KLINE_INTERVAL_1DAY
-        klines=cl.get_historical_klines(symbol, freq, dt_start, dt_end)
+        pooled_session(pool_size, cl.session)
+        return cl
+
+    client=shared_resource(create_client, lambda cl: cl.close_connection())
+
+    def thread_client():
+        """returns the copy of the shared client used by the calling thread"""
+        cl=client.open()
+        if getattr(local, 'shared', None) is not cl:
+            local.shared, local.client=cl, copy.copy(cl)
+        return local.client
+
+    def checkpoint_path(symbol, chunk_start, chunk_end):
+        """returns the path to the checkpoint of a chunk, or `None` without checkpoints"""
+        if not checkpoint_dir:
+            return None
+        return os.path.join(checkpoint_dir, '{}-{}-{}-{}{}.npy'.format(symbol, freq, chunk_start, chunk_end,
+                                                                       '-extra' if extra_fields else ''))
+
+    def fetch_chunk(cl, symbol, chunk_start, chunk_end):
+        """returns the klines of a single chunk as an array, reading
+        it from the checkpoint if the chunk was already fetched
+        """
+        checkpoint=checkpoint_path(symbol, chunk_start, chunk_end)
+        if checkpoint and os.path.exists(checkpoint):
+            return np.load(checkpoint)
+        chunk=klines2array(cl.get_klines(symbol=symbol, interval=freq, startTime=chunk_start,
+                                         endTime=chunk_end, limit=chunk_size), extra_fields)
+        # chunks reaching into the future are not complete yet
+        if checkpoint and chunk_end < time.time() * 1000:
+            with open(checkpoint + '.tmp', 'wb') as f:
+                np.save(f, chunk)
+            os.replace(checkpoint + '.tmp', checkpoint)
+        return chunk
+
+    def downloader(symbol, start_date=None):
+        """downloads symbol price data using binance API
+
+        The range is split into chunks of `chunk_size` klines aligned
+        on multiples of `chunk_size` klines since the epoch, which are
+        fetched by `max_workers` threads. Every chunk is copied into
+        the columns of the dataframe as soon as it arrives, so besides
+        the dataframe only the chunks in flight are held in memory.
+
+        :param symbol: the symbol name
+        :param start_date: the first timestamp from which data are
+        downloaded, it overrides the one given to `get_downloader`
+        :type symbol: str
+        :type start_date: str in format YYYY-MM-DD or pandas.Timestamp
+        """
+        start, end = dt_start, dt_end
+        if start_date is not None:
+            start=max(start, _epoch_ms(start_date))
+        # the open time of the first kline within the range
+        first=start + (-start) % interval_ms
+        nbars=max((end - first) // interval_ms + 1, 0)
+        columns=list(OHLCV_FIELDS) + (list(EXTRA_FIELDS) if extra_fields else [])
+        # one row per column, i.e. the column-major layout of the dataframe
+        buf=np.full((len(columns), nbars), np.nan)
+        filled=np.zeros(nbars, dtype=bool)
+        span=chunk_size * interval_ms
+        chunks=[(chunk_start, chunk_start + span - 1) for chunk_start in range(first - first % span, end + 1, span)]
+
+        client.open()
+        def fill(chunk_range):
+            chunk=fetch_chunk(thread_client(), symbol, *chunk_range)
+            rows=(chunk[:, 0].astype(np.int64) - first) // interval_ms
+            valid=(chunk[:, 0] >= first) & (rows < nbars)
+            buf[:, rows[valid]]=chunk[valid, 1:].T
+            filled[rows[valid]]=True
+
+        if max_workers and max_workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                # consuming the results propagates exceptions raised by the workers
+                for _ in pool.map(fill, chunks):
+                    pass
+        else:
+            for chunk_range in chunks:
+                fill(chunk_range)
 
-        df=klines2ohlcv(klines)
+        for chunk_range in chunks:
+            checkpoint=checkpoint_path(symbol, *chunk_range)
+            if checkpoint and os.path.exists(checkpoint):
+                os.remove(checkpoint)
+        if not filled.all():
+            buf=buf[:, filled]
+        index=to_datetime(first + np.flatnonzero(filled) * interval_ms, unit='ms')
+        index.name='date'
+        df=DataFrame(buf.T, columns=columns, index=index, copy=False)
+        if extra_fields:
+            df['trades']=df['trades'].astype(np.int64)
         return df
 
+    # the columns are part of the key, so a cache never mixes frames with and without the extra fields
+    downloader.cache_key=('binance', dt_start, dt_end, '1m' if every_min_bar else '1d',
+                          tuple(EXTRA_FIELDS) if extra_fields else ())
+    downloader.open=client.open
+    downloader.bind_sessions=bind_sessions
+    downloader.close=client.close
     return downloader
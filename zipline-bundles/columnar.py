@@ -0,0 +1,409 @@
+import os
+import sys
+import functools
+import numpy as np
+import pandas as pd
+#
+from logbook import Logger
+#
+from zipline.utils.cli import maybe_show_progress
+try:
+    import pyarrow
+except ImportError: # parquet support is optional
+    pyarrow = None
+from .ingester import ingester_base, ordered_map, adj_close2dividends
+from .csvio import _arrow_modules, _table2frame, _rows_within
+from .profiling import timed_call
+
+log = Logger(__name__)
+
+# the file extension of the formats read by `parquet_ingester`
+COLUMNAR_FORMATS = {'parquet': '.parquet', 'feather': '.feather', 'hdf': '.h5',}
+
+def _arrow_bound(ts, arrow_type):
+    """returns timestamp `ts` as an arrow scalar comparable with a column of type `arrow_type`
+    """
+    if pyarrow.types.is_date(arrow_type):
+        return pyarrow.scalar(ts.date(), type=arrow_type)
+    if arrow_type.tz is None:
+        ts = ts if ts.tz is None else ts.tz_convert(None)
+    else:
+        ts = ts.tz_localize('UTC') if ts.tz is None else ts
+    return pyarrow.scalar(ts, type=arrow_type)
+
+class parquet_ingester(ingester_base):
+    """ingester from columnar files, e.g. parquet
+
+    Bars are read by pyarrow from memory-mapped files, so no text is
+    parsed. The date range of the bars is pushed down to the reader,
+    which skips the row groups out of it. A dataset partitioned by
+    symbol is read partition by partition, and any other dataset of
+    many symbols is scanned once for all of them.
+    """
+
+    def __init__(self, exchange, every_min_bar, path, path_env=None, index_column='date', column_mapper=None,
+                 fmt='parquet', symbol_column=None, usecols=None, max_workers=None, incremental=False,
+                 filter_cb=None, adj_close_column=None, profiler=None, validator=None,
+                 resample_daily=False, shard=None, exporter=None):
+        """creates an instance of columnar file ingester
+
+        :param exchange: an arbitrary name for the exchange providing
+        price data
+
+        :param every_min_bar: `True` if the bars have 1-minute
+        frequency, otherwise they are daily
+
+        :param path: If `symbol_column` is `None`, the path to the
+        directory containing a single file of name
+        '<symbolname><extension>' per symbol, e.g. 'AAPL.parquet',
+        where the extension is given by `COLUMNAR_FORMATS`. Otherwise,
+        the path to a file or a directory of files holding the bars of
+        all symbols, which may be partitioned, e.g. by the hive
+        layout 'symbol=AAPL/part-0.parquet'.
+
+        :param path_env: the environment variable that overrides
+        `path` when it is set
+
+        :param index_column: the label of the timestamp column
+
+        :param column_mapper: a dictionary that maps column labels to
+        the ones expected from zipline, as for `csv_ingester`
+
+        :param fmt: the file format, one of `COLUMNAR_FORMATS`. hdf
+        files are read by pandas, and the date range is pushed down
+        only for those written in table format, e.g. by
+        `df.to_hdf(path, key='prices', format='table')`.
+
+        :param symbol_column: the label of the column, or the
+        partition key, holding the symbol names in a dataset of many
+        symbols
+
+        :param usecols: the labels, after column mapping, of the
+        columns read beside the index column. All columns are read if
+        it is `None`.
+
+        :param max_workers: the number of symbols read concurrently by
+        a thread pool, arrow releases the GIL while reading
+
+        :param incremental: if `True`, only the bars later than the
+        last bar of the previous ingestion are read, and they are
+        merged with the bars of the previous ingestion
+
+        :param filter_cb: the callback or the name of a filter in
+        `FILTERS` applied on every price dataframe
+
+        :param adj_close_column: the label, after column mapping, of
+        the close price adjusted for splits and dividends, as for
+        `csv_ingester`
+
+        :param profiler: the profiler recording the stages of every
+        ingestion, see `ingest_profiler`. Besides the stages of
+        `ingester_base`, it records 'read', 'filter' and, for a
+        dataset not partitioned by symbol, 'scan'.
+
+        :param validator: the validator of the new bars of every
+        symbol, see `bar_validator`. It runs after `filter_cb`.
+
+        :param resample_daily: if `True`, the minute bars are also
+        written as daily bars aggregated over the sessions of the
+        bundle calendar, so that a single minute bundle serves both
+        frequencies, see `ingester_base`.
+
+        :param shard: the shard of the symbols ingested, see `ingester_base`
+
+        :param exporter: the exporter of every ingestion to a parquet
+        dataset, see `ingester_base`
+
+        :type exchange: str
+        :type every_min_bar: bool
+        :type path: str
+        :type path_env: str
+        :type index_column: str
+        :type column_mapper: dict mapping str to str
+        :type fmt: str
+        :type symbol_column: str
+        :type usecols: iterable of str
+        :type max_workers: int
+        :type incremental: bool
+        :type filter_cb: a callable that takes a data frame and return a data frame, or str
+        :type adj_close_column: str
+        :type profiler: ingest_profiler
+        :type validator: bar_validator
+        :type resample_daily: bool
+        :type shard: tuple of (int, int) or str
+        :type exporter: dataset_exporter
+
+        :raise: ValueError when `fmt` is unknown, hdf files are given
+        with `symbol_column`, `resample_daily` is given for daily
+        bars, or `shard` is malformed
+        :raise: ImportError when pyarrow is not installed and `fmt` is not 'hdf'
+        """
+        if fmt not in COLUMNAR_FORMATS:
+            raise ValueError("unknown format '{}', it must be one of {}".format(fmt, tuple(COLUMNAR_FORMATS)))
+        if fmt == 'hdf' and symbol_column:
+            raise ValueError('hdf files must contain a single symbol, symbol_column cannot be given')
+        if fmt != 'hdf' and pyarrow is None:
+            raise ImportError("reading {} files requires pyarrow to be installed".format(fmt))
+        super().__init__(exchange, every_min_bar, incremental, profiler, validator, resample_daily, shard, exporter)
+        if fmt != 'hdf':
+            _arrow_modules('compute', 'dataset', 'fs')
+        self._path=path
+        self._path_env=path_env
+        self._index_column=index_column
+        self._column_mapper=column_mapper
+        self._fmt=fmt
+        self._symbol_column=symbol_column
+        self._max_workers=max_workers
+        self._filter_cb=filter_cb
+        self._filter_fn=None
+        self._adj_close_column=adj_close_column
+        self._dataset=None
+        self._partitions=None
+        self._tables=None
+        labels={column: label for label, column in (column_mapper or {}).items()}
+        self._usecols=None
+        if usecols is not None:
+            self._usecols={labels.get(column, column) for column in
+                           list(usecols) + ([adj_close_column] if adj_close_column else [])}
+
+    def _get_path(self, show_progress=False):
+        """returns the path to the files and exit the program in case of failure
+        """
+        path = (os.environ.get(self._path_env) if self._path_env else None) or self._path
+        if not path or not os.path.exists(path):
+            error_msg = "'{}' is not a valid path".format(path)
+            if self._path_env:
+                error_msg = "{}. It can be set via environment variable '{}'".format(error_msg, self._path_env)
+            log.error(error_msg)
+            sys.exit(1)
+        if show_progress:
+            log.info('reading {} files from \'{}\''.format(self._fmt, path))
+        return os.path.abspath(path)
+
+    def _open_dataset(self, path):
+        """returns the arrow dataset at `path` read from memory-mapped files
+        """
+        partitioning = 'hive'
+        if self._symbol_column is not None:
+            # symbols like '1301' must not be inferred as integers
+            partitioning = pyarrow.dataset.partitioning(pyarrow.schema([(self._symbol_column, pyarrow.string())]),
+                                                        flavor='hive')
+        return pyarrow.dataset.dataset(path, format=self._fmt, partitioning=partitioning,
+                                       filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+
+    def _partition(self, dataset):
+        """returns the dataset of every symbol partition of `dataset`,
+        keyed by symbol, or `None` if it is not partitioned by
+        `self._symbol_column`
+        """
+        fragments = {}
+        for fragment in dataset.get_fragments():
+            keys = pyarrow.dataset.get_partition_keys(fragment.partition_expression)
+            if self._symbol_column not in keys:
+                return None
+            fragments.setdefault(str(keys[self._symbol_column]), []).append(fragment)
+        return {symbol: pyarrow.dataset.FileSystemDataset(parts, dataset.schema, dataset.format, dataset.filesystem)
+                for symbol, parts in fragments.items()}
+
+    def _extract_symbols(self, path):
+        """returns the list of symbols, sorted by name
+
+        The symbols are given by the file names, the symbol partitions
+        of the dataset, or the distinct values of
+        `self._symbol_column` in the dataset.
+        """
+        if self._symbol_column is None:
+            extension = COLUMNAR_FORMATS[self._fmt]
+            return sorted(file_name[:-len(extension)] for file_name in os.listdir(path) if file_name.endswith(extension))
+        if self._partitions is not None:
+            return sorted(self._partitions)
+        symbols = self._dataset.to_table(columns=[self._symbol_column]).column(self._symbol_column)
+        return sorted(pyarrow.compute.unique(symbols).to_pylist())
+
+    def _scan(self, symbols):
+        """reads the bars of all `symbols` from a dataset not partitioned by symbol in a single scan
+
+        The scan reads the bars after the earliest last bar of the
+        symbols in the previous ingestion, and the bars of every
+        symbol are then sliced from the table sorted by symbol, so the
+        dataset is not scanned once per symbol.
+
+        :param symbols: the sid and the name of the symbols to read
+        :type symbols: list of tuple of (int, str)
+        :return: the table of the bars of every symbol, keyed by symbol
+        :rtype: dict mapping str to pyarrow.Table
+        """
+        with self._profiler.stage('scan') as stage:
+            lasts = [self._last_bar(symbol) for _, symbol in symbols]
+            after = None if not lasts or any(last is None for last in lasts) else min(lasts)
+            table = self._dataset.to_table(columns=self._columns(self._dataset.schema) + [self._symbol_column],
+                                           filter=self._date_filter(self._dataset.schema, after))
+            table = table.sort_by(self._symbol_column)
+            stage['rows'] = len(table)
+            # the rows of a symbol are contiguous in the sorted table, in the order of their first appearance
+            counted = pyarrow.compute.value_counts(table.column(self._symbol_column))
+            counts = counted.field('counts').to_numpy()
+            starts = np.cumsum(counts) - counts
+            return {name: table.slice(start, count).drop_columns([self._symbol_column])
+                    for name, start, count in zip(counted.field('values').to_pylist(), starts, counts)}
+
+    def _date_filter(self, schema, after):
+        """returns the arrow expression selecting the bars within `self._date_range`, or `None`
+        """
+        field = pyarrow.dataset.field(self._index_column)
+        arrow_type = schema.field(self._index_column).type
+        expression = None
+        lower, upper = self._date_range(after)
+        if lower is not None:
+            bound = _arrow_bound(lower[0], arrow_type)
+            expression = field >= bound if lower[1] else field > bound
+        if upper is not None:
+            bound = field < _arrow_bound(upper[0], arrow_type)
+            expression = bound if expression is None else expression & bound
+        return expression
+
+    def _read_hdf(self, file_path, after):
+        """reads the bars within `self._date_range` from a hdf file
+        """
+        lower, upper = self._date_range(after)
+        with pd.HDFStore(file_path, mode='r') as store:
+            key = store.keys()[0]
+            if store.get_storer(key).is_table:
+                where = ([] if lower is None else ['index {} {!r}'.format('>=' if lower[1] else '>', str(lower[0]))]) + \
+                        ([] if upper is None else ['index < {!r}'.format(str(upper[0]))])
+                df = store.select(key, where=where or None)
+            else:
+                # fixed format stores can only be read in their entirety
+                df = store[key]
+                if lower is not None:
+                    df = df[df.index >= lower[0]] if lower[1] else df[df.index > lower[0]]
+                if upper is not None:
+                    df = df[df.index < upper[0]]
+        if self._index_column in df.columns:
+            df = df.set_index(self._index_column)
+        if self._usecols is not None:
+            df = df[[column for column in df.columns if column in self._usecols]]
+        return df
+
+    def _load(self, job):
+        """reads the bars of a single symbol
+
+        :param job: the symbol index, the symbol name, the path to the
+        files and the timestamp after which bars are read, which is
+        `None` to read from the start session. It may end with the raw
+        and the adjusted close of the bar before the bars read, see
+        `adj_close2dividends`.
+        :type job: tuple of (int, str, str, pandas.Timestamp[, tuple])
+
+        :return: the symbol index, the symbol name and its price
+        dataframe, which is `None` if no bar is found
+        :rtype: tuple of (int, str, pandas.DataFrame)
+        """
+        symbol_index, symbol, path, after = job[:4]
+        previous = job[4] if len(job) > 4 else None
+        if self._symbol_column is None:
+            file_path = os.path.join(path, symbol + COLUMNAR_FORMATS[self._fmt])
+            if not os.path.exists(file_path):
+                return symbol_index, symbol, None
+            if self._fmt == 'hdf':
+                df_data = self._read_hdf(file_path, after)
+            else:
+                df_data = self._read_table(self._open_dataset(file_path), None, after)
+        elif self._partitions is not None:
+            if symbol not in self._partitions:
+                return symbol_index, symbol, None
+            df_data = self._read_table(self._partitions[symbol], None, after)
+        else:
+            if symbol not in self._tables:
+                return symbol_index, symbol, None
+            df_data = _rows_within(_table2frame(self._tables[symbol], self._index_column), *self._date_range(after))
+        if df_data.empty:
+            return symbol_index, symbol, None
+        df_data = df_data.sort_index()
+        if self._column_mapper:
+            df_data.columns = [self._column_mapper.get(column, column) for column in df_data.columns]
+        self._filter(df_data)
+        if self._adj_close_column:
+            df_data['dividend'] += adj_close2dividends(df_data, self._adj_close_column, previous=previous)
+        return symbol_index, symbol, df_data
+
+    def _columns(self, schema):
+        """returns the labels of the columns read from a dataset of `schema`, except the symbol column
+        """
+        return [column for column in schema.names if column != self._symbol_column and
+                (self._usecols is None or column in self._usecols or column == self._index_column)]
+
+    def _read_table(self, dataset, expression, after):
+        """reads the bars selected by `expression` and `self._date_filter` from an arrow dataset
+        """
+        date_filter = self._date_filter(dataset.schema, after)
+        if date_filter is not None:
+            expression = date_filter if expression is None else expression & date_filter
+        return _table2frame(dataset.to_table(columns=self._columns(dataset.schema), filter=expression),
+                            self._index_column)
+
+    def _read_and_convert(self, symbols, path, show_progress):
+        """returns the generator of symbol index and the dataframe storing its price data
+
+        Symbols are read by `self._load` in a pool of
+        `self._max_workers` threads, while the dataframes are yielded
+        in the symbol order. In incremental mode, the new bars are
+        merged with the previous ingestion.
+
+        :param symbols: the sid and the name of the symbols to read,
+        see `self._assign_sids`
+        :type symbols: list of tuple of (int, str)
+        """
+        def jobs():
+            for symbol_index, symbol in symbols:
+                after = self._last_bar(symbol)
+                yield symbol_index, symbol, path, after, self._previous_adj_close(symbol, after)
+        loaded = ordered_map(functools.partial(timed_call, self._load), jobs(), self._max_workers)
+        with maybe_show_progress(loaded, show_progress, label='Loading {} files: '.format(self._fmt),
+                                 length=len(symbols)) as it:
+            for (symbol_index, symbol, df_data), wall, cpu in it:
+                self._profiler.record('read', symbol, wall, cpu, 0 if df_data is None else len(df_data))
+                df_data = self._convert(symbol_index, symbol, df_data)
+                if df_data is not None:
+                    yield symbol_index, df_data
+
+    def __call__(self,
+                 environ,
+                 asset_db_writer,
+                 minute_bar_writer,
+                 daily_bar_writer,
+                 adjustment_writer,
+                 calendar,
+                 start_session,
+                 end_session,
+                 cache,
+                 show_progress,
+                 output_dir):
+        """implements the actual ingest function
+
+        The order of calls are as follows
+        1. `self._open_dataset()` and `self._partition()`, if the
+           symbols share a dataset
+        2. `self._extract_symbols()`
+        3. `self._assign_sids()`
+        4. `self._start_conversion()`, which opens the previous
+           ingestion and creates the filter
+        5. `self._scan()`, if the shared dataset is not partitioned by symbol
+        6. `self._write()` of the bars of `self._read_and_convert()`
+        7. `ingestion_shard.save()` if the ingestion is sharded
+        """
+        with self._ingestion(start_session, end_session, environ, output_dir):
+            path = self._get_path(show_progress)
+            if self._symbol_column is not None:
+                self._dataset = self._open_dataset(path)
+                self._partitions = self._partition(self._dataset)
+            symbols = self._assign_sids(self._extract_symbols(path))
+            self._start_conversion(symbols, calendar, output_dir, show_progress)
+            if self._symbol_column is not None and self._partitions is None:
+                self._tables = self._scan(symbols)
+            self._write(self._read_and_convert(symbols, path, show_progress), asset_db_writer, minute_bar_writer,
+                        daily_bar_writer, adjustment_writer, calendar, show_progress)
+            self._dataset, self._partitions, self._tables = None, None, None
+            self._finish_ingestion(show_progress, output_dir)
+        if show_progress:
+            log.info('writing completed')
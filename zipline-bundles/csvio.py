@@ -0,0 +1,608 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import io
+import csv
+import bz2
+import gzip
+import tarfile
+import zipfile
+import importlib.util
+from collections import namedtuple
+#
+from logbook import Logger
+
+log = Logger(__name__)
+
+def _arrow_modules(*names):
+    """imports pyarrow and its submodules `names`, e.g. 'dataset'
+
+    pyarrow, requests and the zipline readers are imported by the code
+    paths using them only, so that loading the ingester modules,
+    e.g. by every zipline command through `extension.py`, does not
+    import them.
+
+    :return: the pyarrow module, or `None` if it is not installed
+    """
+    try:
+        pyarrow = importlib.import_module('pyarrow')
+    except ImportError: # parquet support is optional
+        return None
+    for name in names:
+        importlib.import_module('pyarrow.' + name)
+    return pyarrow
+
+def _reverse_lines(f, start, end, block_size=1 << 16):
+    """yields the lines of binary file `f` within byte range [`start`, `end`) from the last to the first
+
+    :return: the generator of (offset, line) pairs, where offset is
+    the position of the line's first byte in the file
+    :rtype: generator of (int, bytes)
+    """
+    head = b''
+    block_end = end
+    while block_end > start:
+        block_start = max(start, block_end - block_size)
+        f.seek(block_start)
+        chunk = f.read(block_end - block_start) + head
+        lines = chunk.split(b'\n')
+        # the first piece may be the tail of a line starting in an earlier block
+        head = lines.pop(0) if block_start > start else b''
+        pos = block_start + len(chunk)
+        for line in reversed(lines):
+            pos -= len(line)
+            yield pos, line
+            pos -= 1 # the newline
+        block_end = block_start
+
+# the parser engines of csv files
+CSV_ENGINES = ('c', 'python', 'pyarrow')
+
+# the types of the price columns read from csv files. Integer columns
+# are parsed as float64, so that missing values are kept, and cast
+# once the bars are filtered and validated, see `csv_ingester`
+CSV_DTYPES = {'open': 'float64', 'high': 'float64', 'low': 'float64', 'close': 'float64',
+              'volume': 'uint64', 'dividend': 'float64', 'split': 'float64',}
+
+# the suffixes of csv files, mapped to their compression
+CSV_SUFFIXES = {'.csv': None, '.csv.gz': 'gzip', '.csv.bz2': 'bz2', '.csv.zst': 'zstd',}
+
+# the suffixes of archives whose csv files are read as well
+ARCHIVE_SUFFIXES = ('.zip', '.tar',)
+
+def _csv_suffix(name):
+    """returns the suffix in `CSV_SUFFIXES` that `name` ends with, or `None`
+    """
+    for suffix in CSV_SUFFIXES:
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+class _owning_stream(io.BufferedIOBase):
+    """a binary stream that closes the handles it reads from when it is closed
+
+    Decompressing streams and archive members do not close the file,
+    or the archive, they are given, so they are closed in reverse
+    order after the stream.
+    """
+    def __init__(self, stream, handles):
+        super().__init__()
+        self._stream = stream
+        self._handles = handles
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def read1(self, size=-1):
+        return self._stream.read1(size)
+
+    def readinto(self, b):
+        return self._stream.readinto(b)
+
+    def readline(self, size=-1):
+        return self._stream.readline(size)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._stream.close()
+        finally:
+            for handle in reversed(self._handles):
+                handle.close()
+            super().close()
+
+def _decompress(f, compression, handles=()):
+    """returns the binary stream decompressing `f` on the fly
+
+    Closing the stream closes `f` and then `handles`, the handles `f`
+    is read from.
+    """
+    if compression is None:
+        return _owning_stream(f, list(handles)) if handles else f
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=f)
+    elif compression == 'bz2':
+        stream = bz2.BZ2File(f)
+    else:
+        pyarrow = _arrow_modules()
+        if pyarrow is None:
+            for handle in (*handles, f)[::-1]:
+                handle.close()
+            raise ValueError('reading zstd compressed csv files requires pyarrow to be installed')
+        stream = io.BufferedReader(pyarrow.CompressedInputStream(pyarrow.PythonFile(f, mode='r'), 'zstd'))
+    return _owning_stream(stream, [*handles, f])
+
+class archive_member:
+    """a csv file, possibly compressed, stored in a zip or tar archive
+    """
+    __slots__ = ('archive', 'member')
+
+    def __init__(self, archive, member):
+        """
+        :param archive: the path to the archive
+        :param member: the name of the member in zip archives, or its
+        header in tar archives, which locates its data without
+        scanning the archive
+        :type archive: str
+        :type member: str or tarfile.TarInfo
+        """
+        self.archive = archive
+        self.member = member
+
+    @property
+    def name(self):
+        return self.member if isinstance(self.member, str) else self.member.name
+
+    def open(self):
+        """returns the binary stream of the decompressed member
+
+        Every member is read through its own handle of the archive,
+        which can therefore be read by several threads or processes at
+        a time, and which is closed with the stream.
+        """
+        handle = open(self.archive, 'rb')
+        try:
+            if isinstance(self.member, str):
+                archive = zipfile.ZipFile(handle)
+            else:
+                archive = tarfile.TarFile(fileobj=handle)
+            try:
+                f = archive.open(self.member) if isinstance(self.member, str) else archive.extractfile(self.member)
+            except BaseException:
+                archive.close()
+                raise
+        except BaseException:
+            handle.close()
+            raise
+        return _decompress(f, CSV_SUFFIXES[_csv_suffix(self.name)], (handle, archive))
+
+    def __repr__(self):
+        return "'{}' in '{}'".format(self.name, self.archive)
+
+def open_csv(source):
+    """returns the binary stream of a csv file decompressed according to its suffix, or of an archive member
+
+    :type source: str or archive_member
+    :rtype: binary file object
+    """
+    if isinstance(source, archive_member):
+        return source.open()
+    return _decompress(open(source, 'rb'), CSV_SUFFIXES.get(_csv_suffix(source)))
+
+# a csv file found by `find_csv_files`, where `key` is its path
+# relative to the csv directory, `source` is its path or archive
+# member, `size` is its size in bytes and `mtime` is its modification
+# time in nanoseconds
+csv_file = namedtuple('csv_file', ['key', 'source', 'size', 'mtime'])
+
+def _archive_members(archive, key):
+    """yields the csv files stored in zip or tar archive `archive`, whose relative path is `key`
+    """
+    if archive.endswith('.zip'):
+        with zipfile.ZipFile(archive) as zip_file:
+            infos = zip_file.infolist()
+        for info in infos:
+            if not info.is_dir() and _csv_suffix(info.filename) is not None:
+                mtime = int(time.mktime(info.date_time + (0, 0, -1))) * 10**9
+                yield csv_file('{}/{}'.format(key, info.filename), archive_member(archive, info.filename),
+                               info.file_size, mtime)
+    else:
+        with tarfile.open(archive) as tar:
+            for info in tar:
+                if info.isfile() and _csv_suffix(info.name) is not None:
+                    yield csv_file('{}/{}'.format(key, info.name), archive_member(archive, info),
+                                   info.size, int(info.mtime) * 10**9)
+
+def find_csv_files(path, recursive=False):
+    """returns the csv files in directory `path`, grouped by their name without suffix
+
+    Compressed csv files with a suffix in `CSV_SUFFIXES` and the csv
+    files stored in the archives with a suffix in `ARCHIVE_SUFFIXES`
+    are found as well. If `recursive` is `True`, the subdirectories
+    are walked too, such that nested layouts like
+    'exchange/symbol.csv' or partitioned ones like
+    'year=2024/symbol.csv' are found. A symbol may therefore have
+    several files, e.g. one per partition. Hidden files and
+    directories are skipped.
+
+    The directories are walked by `os.scandir`, and every file is
+    stat'ed once.
+
+    :param path: the path to directory
+    :param recursive: whether subdirectories are walked
+    :type path: str
+    :type recursive: bool
+    :return: the files of every symbol, sorted by their relative path
+    :rtype: dict mapping str to list of csv_file
+    """
+    files = []
+    directories = [(path, '')]
+    while directories:
+        directory, prefix = directories.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                key = prefix + entry.name
+                if entry.is_dir():
+                    if recursive:
+                        directories.append((entry.path, key + '/'))
+                elif _csv_suffix(entry.name) is not None:
+                    stat = entry.stat()
+                    files.append(csv_file(key, entry.path, stat.st_size, stat.st_mtime_ns))
+                elif entry.name.endswith(ARCHIVE_SUFFIXES):
+                    files.extend(_archive_members(entry.path, key))
+    symbols = {}
+    for f in sorted(files):
+        name = f.key.rsplit('/', 1)[-1]
+        symbols.setdefault(name[:-len(_csv_suffix(name))], []).append(f)
+    return symbols
+
+def _csv_fields(line):
+    """returns the fields of csv line `line`, unquoted, without a leading utf-8 byte order mark
+
+    :type line: bytes
+    :rtype: list of str
+    """
+    return [field.strip() for field in next(csv.reader([line.decode('utf-8-sig').rstrip('\r\n')]), [])]
+
+def _csv_header(source):
+    """returns the column labels in the first line of a csv file, an archive member or a binary buffer
+    """
+    if isinstance(source, (str, archive_member)):
+        with open_csv(source) as f:
+            header = f.readline()
+    else:
+        header = source.readline()
+        source.seek(0)
+    return _csv_fields(header)
+
+def _column_position(header, index_column, file_path):
+    """returns the position of column `index_column` in csv header line `header`
+
+    :raise: ValueError when the header has no such column
+    """
+    columns = _csv_fields(header)
+    if index_column not in columns:
+        raise ValueError("csv file '{}' has no column '{}'".format(file_path, index_column))
+    return columns.index(index_column)
+
+def _line_timestamp(line, position):
+    """returns the timestamp in field `position` of csv line `line`"""
+    return pd.Timestamp(_csv_fields(line)[position])
+
+def _rows_after(df, after):
+    """returns the rows of `df` later than timestamp `after`
+    """
+    after = pd.Timestamp(after)
+    if df.index.tz is None and after.tz is not None:
+        after = after.tz_convert(None)
+    return df[df.index > after]
+
+def _naive(ts):
+    """returns timestamp `ts` without time zone, in UTC if it has one"""
+    return ts if ts.tz is None else ts.tz_convert(None)
+
+def _comparable(ts, tz):
+    """returns timestamp `ts` comparable with the timestamps of time zone `tz`, naive ones being in UTC"""
+    ts = pd.Timestamp(ts)
+    if tz is None:
+        return _naive(ts)
+    return ts.tz_localize('UTC') if ts.tz is None else ts
+
+def _below(bound):
+    """returns the predicate telling if a timestamp, or each one of an index, is below the lower bound `bound`"""
+    ts, inclusive = bound
+    return (lambda t: t < _comparable(ts, t.tz)) if inclusive else (lambda t: t <= _comparable(ts, t.tz))
+
+def _within(bound):
+    """returns the predicate telling if a timestamp, or each one of an index, is within the upper bound `bound`"""
+    ts, inclusive = bound
+    return (lambda t: t <= _comparable(ts, t.tz)) if inclusive else (lambda t: t < _comparable(ts, t.tz))
+
+def _rows_within(df, lower, upper):
+    """returns the rows of `df` within the bounds returned by `ingester_base._date_range`
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if lower is not None:
+        mask &= ~np.asarray(_below(lower)(df.index))
+    if upper is not None:
+        mask &= np.asarray(_within(upper)(df.index))
+    return df if mask.all() else df[mask]
+
+def read_csv(source, index_column, engine=None, usecols=None, dtype=None, date_format=None, chunk_size=None):
+    """reads price data from a csv file into a dataframe indexed by timestamp
+
+    :param source: the path to csv file, compressed or not, an
+    archive member or a binary buffer holding its content
+
+    :param index_column: the label of the timestamp column
+
+    :param engine: the parser, one of `CSV_ENGINES`. 'pyarrow'
+    parses the file with `pyarrow.csv`, which is usually several
+    times faster than the other ones, implemented by
+    `pandas.read_csv`. `None` means the default engine of pandas.
+
+    :param usecols: the labels of the columns to read beside
+    `index_column`. The labels missing in the file are skipped. All
+    columns are read if it is `None`.
+
+    :param dtype: the type of columns, keyed by their labels. The
+    labels missing in the file are skipped.
+
+    :param date_format: the format of timestamps, e.g. '%Y-%m-%d'. If
+    it is `None`, the format is inferred.
+
+    :param chunk_size: if it is given, the file is streamed and an
+    iterator of dataframes of `chunk_size` rows is returned. The
+    'pyarrow' engine reads whole blocks, so its chunks may be
+    slightly larger.
+
+    :type source: str, archive_member or io.BytesIO
+    :type index_column: str
+    :type engine: str
+    :type usecols: iterable of str
+    :type dtype: dict mapping str to str or numpy.dtype
+    :type date_format: str
+    :type chunk_size: int
+    :rtype: pandas.DataFrame, or iterator of pandas.DataFrame
+    :raise: ValueError when the engine is unknown or unavailable
+    """
+    if engine is not None and engine not in CSV_ENGINES:
+        raise ValueError("unknown csv engine '{}', it must be one of {}".format(engine, CSV_ENGINES))
+    if usecols is not None or dtype:
+        header = _csv_header(source)
+        if usecols is not None:
+            usecols = [index_column] + [column for column in header if column in set(usecols) and column != index_column]
+        dtype = {column: t for column, t in (dtype or {}).items()
+                 if column in header and column != index_column and (usecols is None or column in usecols)}
+    # pyarrow decompresses files by itself, others are decompressed while they are parsed
+    if isinstance(source, archive_member) or \
+       (isinstance(source, str) and CSV_SUFFIXES.get(_csv_suffix(source)) and engine != 'pyarrow'):
+        stream = open_csv(source)
+        if chunk_size is None:
+            with stream:
+                return _parse_csv(stream, index_column, engine, usecols, dtype, date_format)
+        return _closing(stream, _parse_csv(stream, index_column, engine, usecols, dtype, date_format, chunk_size))
+    return _parse_csv(source, index_column, engine, usecols, dtype, date_format, chunk_size)
+
+def _parse_csv(source, index_column, engine, usecols, dtype, date_format, chunk_size=None):
+    """parses csv `source` by `engine`, where `usecols` and `dtype` match the header of the file
+    """
+    if engine != 'pyarrow':
+        return pd.read_csv(source, engine=engine, index_col=index_column, usecols=usecols, dtype=dtype,
+                           parse_dates=True, date_format=date_format, chunksize=chunk_size)
+    pyarrow = _arrow_modules('csv')
+    if pyarrow is None:
+        raise ValueError("csv engine 'pyarrow' requires pyarrow to be installed")
+    column_types = {column: pyarrow.string() if np.dtype(t).kind in 'OSU' else pyarrow.from_numpy_dtype(np.dtype(t))
+                    for column, t in (dtype or {}).items()}
+    if date_format:
+        column_types[index_column] = pyarrow.timestamp('ns')
+    convert_options = pyarrow.csv.ConvertOptions(include_columns=usecols, column_types=column_types,
+                                                 timestamp_parsers=[date_format] if date_format else None)
+    if chunk_size is not None:
+        return _arrow_chunks(pyarrow.csv.open_csv(source, convert_options=convert_options), index_column, chunk_size)
+    return _table2frame(pyarrow.csv.read_csv(source, convert_options=convert_options), index_column)
+
+def _closing(stream, chunks):
+    """yields `chunks` and closes `stream` once they are consumed
+    """
+    with stream:
+        yield from chunks
+
+def _arrow_chunks(reader, index_column, chunk_size):
+    """yields the record batches of a streaming csv reader as dataframes of at least `chunk_size` rows
+
+    Only the last dataframe may be smaller.
+    """
+    pyarrow = _arrow_modules()
+    batches, nrows = [], 0
+    for batch in reader:
+        batches.append(batch)
+        nrows += batch.num_rows
+        if nrows >= chunk_size:
+            yield _table2frame(pyarrow.Table.from_batches(batches), index_column)
+            batches, nrows = [], 0
+    if nrows:
+        yield _table2frame(pyarrow.Table.from_batches(batches), index_column)
+
+def _table2frame(table, index_column):
+    """converts an arrow table into a dataframe indexed by `index_column`
+
+    The dataframe is built from the arrow columns directly, which is
+    cheaper than `table.to_pandas` followed by `set_index` for the
+    small tables typical of daily prices.
+    """
+    index = pd.Index(table.column(index_column).to_pandas(date_as_object=False), name=index_column)
+    if isinstance(index, pd.DatetimeIndex):
+        index = index.as_unit('ns')
+    return pd.DataFrame({column: table.column(column).to_numpy() for column in table.column_names if column != index_column},
+                        index=index)
+
+def read_csv_after(file_path, index_column, after, reader=None, **kwargs):
+    """reads the rows of a csv file whose timestamp is later than `after`
+
+    The file is assumed to be sorted by `index_column` in ascending
+    order, as is the case for files that are only appended to. Lines
+    are scanned backward from the end of the file until a timestamp
+    not later than `after` is met, so the cost is proportional to the
+    number of new rows and not to the size of the file.
+
+    :param file_path: the path to csv file
+    :param index_column: the label of the timestamp column
+    :param after: the timestamp of the last row already ingested
+    :param reader: the callable parsing the selected rows. It is
+    called with a binary buffer, `index_column` and `kwargs`, e.g.
+    `read_csv`. Its default value `None` means `pandas.read_csv`.
+    :param kwargs: the keyword arguments passed to `reader`
+
+    :type file_path: str
+    :type index_column: str
+    :type after: pandas.Timestamp
+    :type reader: callable
+    :return: the dataframe with rows later than `after`, indexed by `index_column`
+    :rtype: pandas.DataFrame
+    """
+    after = pd.Timestamp(after)
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        position = _column_position(header, index_column, file_path)
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        for line_offset, line in _reverse_lines(f, data_start, offset):
+            if line.strip():
+                ts = _line_timestamp(line, position)
+                if ts.tz is None and after.tz is not None:
+                    after = after.tz_convert(None)
+                if ts <= after:
+                    break
+            offset = line_offset
+        f.seek(offset)
+        return _parse_tail(header, f.read(), index_column, reader, kwargs)
+
+def read_csv_from(file_path, index_column, offset, reader=None, **kwargs):
+    """reads the rows of a csv file starting at byte `offset`
+
+    This is used to read the rows appended to a file whose first
+    `offset` bytes were already ingested. `offset` must be the start of
+    a line.
+
+    :param file_path: the path to csv file
+    :param index_column: the label of the timestamp column
+    :param offset: the position of the first row to read
+    :param reader: the callable parsing the selected rows, as in `read_csv_after`
+    :param kwargs: the keyword arguments passed to `reader`
+
+    :type file_path: str
+    :type index_column: str
+    :type offset: int
+    :type reader: callable
+    :return: the dataframe with the rows from `offset`, indexed by `index_column`
+    :rtype: pandas.DataFrame
+    """
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        f.seek(max(offset, f.tell()))
+        return _parse_tail(header, f.read(), index_column, reader, kwargs)
+
+def read_csv_range(file_path, index_column, lower=None, upper=None, reader=None, **kwargs):
+    """reads the rows of a csv file whose timestamp is within bounds
+
+    The file is expected to be sorted by `index_column` in ascending
+    order. The first row within the bounds and the first one beyond
+    them are found by binary searches over the byte offsets of the
+    file, so only the rows in between are parsed and the search
+    reads a number of lines logarithmic in the size of the file. If
+    the lines read by the search are not in ascending order, the
+    whole file is parsed and sorted instead.
+
+    :param file_path: the path to csv file
+    :param index_column: the label of the timestamp column
+    :param lower: the lower bound and whether it is inclusive, `None` for no lower bound
+    :param upper: the upper bound and whether it is inclusive, `None` for no upper bound
+    :param reader: the callable parsing the selected rows, as in `read_csv_after`
+    :param kwargs: the keyword arguments passed to `reader`
+
+    :type file_path: str
+    :type index_column: str
+    :type lower: tuple of (pandas.Timestamp, bool)
+    :type upper: tuple of (pandas.Timestamp, bool)
+    :type reader: callable
+    :return: the dataframe with the rows within the bounds, indexed by `index_column`
+    :rtype: pandas.DataFrame
+    """
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        data_start = start = f.tell()
+        position = _column_position(header, index_column, file_path)
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        probes = []
+        if lower is not None:
+            start = _bisect_lines(f, start, end, position, _below(lower), probes)
+        if upper is not None:
+            end = _bisect_lines(f, start, end, position, _within(upper), probes)
+        timestamps = [ts for _, ts in sorted(probes, key=lambda probe: probe[0])]
+        if any(later < earlier for earlier, later in zip(timestamps, timestamps[1:])):
+            log.warning("csv file '{}' is not sorted by '{}', it is read entirely".format(file_path, index_column))
+            f.seek(data_start)
+            df = _parse_tail(header, f.read(), index_column, reader, kwargs)
+            return _rows_within(df.sort_index(kind='stable'), lower, upper)
+        f.seek(start)
+        return _parse_tail(header, f.read(end - start), index_column, reader, kwargs)
+
+def _bisect_lines(f, start, end, position, before, probes=None):
+    """returns the offset of the first line of sorted binary csv file `f`
+    within byte range [`start`, `end`) whose timestamp does not satisfy
+    `before`, or `end` if all of them do
+
+    `start` must be the start of a line. Blank lines are skipped.
+
+    :param position: the position of the timestamp column
+    :param before: the predicate on timestamps holding for the lines
+    before the returned one
+    :param probes: if it is given, the offset and the timestamp of
+    every line read are appended to it, so that the caller can check
+    they are sorted
+    """
+    def first_line(offset):
+        """returns the first non blank line starting at or after `offset`, and its offset"""
+        f.seek(offset)
+        if offset > start:
+            # the rest of the line containing the previous byte
+            f.seek(offset - 1)
+            f.readline()
+        while f.tell() < end:
+            line_offset = f.tell()
+            line = f.readline()
+            if line.strip():
+                return line_offset, line
+        return end, None
+
+    lo, hi = start, end
+    while lo < hi:
+        mid = (lo + hi) // 2
+        line_offset, line = first_line(mid)
+        ts = None if line is None else _line_timestamp(line, position)
+        if ts is not None and probes is not None:
+            probes.append((line_offset, ts))
+        if ts is None or not before(ts):
+            hi = mid
+        else:
+            lo = mid + 1
+    return first_line(lo)[0]
+
+def _parse_tail(header, body, index_column, reader, kwargs):
+    """parses the csv rows in `body` preceded by `header`"""
+    if not body.endswith(b'\n'):
+        header = header.rstrip(b'\r\n') + b'\n'
+    if reader is None:
+        return pd.read_csv(io.BytesIO(header + body), index_col=index_column, **kwargs)
+    return reader(io.BytesIO(header + body), index_column, **kwargs)
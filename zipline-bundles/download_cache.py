@@ -0,0 +1,232 @@
+import os
+import time
+import threading
+import pandas as pd
+import pickle
+import copy
+import hashlib
+import importlib.util
+
+class cached_downloader:
+    """downloader wrapper that caches downloaded price data on disk
+
+    Every downloaded dataframe is stored under a content address
+    derived from the source, the symbol, the date range and the
+    granularity of the download. The first three items, except the
+    symbol, are taken from the `cache_key` attribute of the wrapped
+    downloader, which is set by `get_downloader` of the yahoo, iex
+    and binance modules.
+
+    When `path` is given, the cache is persistent: entries are kept
+    across ingestions until they are older than `ttl`, or until the
+    cache grows beyond `max_bytes`, in which case the least recently
+    used entries are evicted, except the one just stored. Otherwise,
+    the dataframe cache that zipline passes to the ingest function is
+    used, which survives a failed ingestion and is removed after a
+    successful one, so that restarting a failed ingestion does not
+    download again what was already downloaded.
+
+    A batch downloader, see `direct_ingester`, stays one: the symbols
+    of a batch are looked up one by one, and only those missing from
+    the cache are downloaded, by a single call.
+    """
+    def __init__(self, downloader, path=None, ttl=None, max_bytes=None, key=None, fmt=None):
+        """wraps `downloader` with a cache
+
+        :param downloader: the downloader closure to be wrapped
+        :param path: the directory storing the persistent cache
+        :param ttl: the time to live of cache entries, e.g. '1D'. The
+        default value `None` means entries never expire
+        :param max_bytes: the maximum size of the persistent cache in bytes
+        :param key: the tuple identifying the source, the date range
+        and the granularity of `downloader`. Its default value is the
+        `cache_key` attribute of `downloader`
+        :param fmt: the storage format of the persistent cache, either
+        'parquet' or 'pickle'. Its default value is 'parquet' if
+        pyarrow is installed, otherwise 'pickle'
+
+        :type downloader: callable
+        :type path: str
+        :type ttl: str or pandas.Timedelta
+        :type max_bytes: int
+        :type key: tuple
+        :type fmt: str
+        :raise: ValueError when no key is given and `downloader` has no `cache_key`
+        """
+        self._downloader = downloader
+        self._fixed_key = key is not None
+        self._key = key if key is not None else getattr(downloader, 'cache_key', None)
+        if self._key is None:
+            raise ValueError('the downloader has no cache_key, pass a key identifying its source, date range and granularity')
+        self._path = path
+        self._ttl = pd.Timedelta(ttl).total_seconds() if ttl is not None else None
+        self._max_bytes = max_bytes
+        self._fmt = fmt or ('parquet' if importlib.util.find_spec('pyarrow') is not None else 'pickle')
+        if self._fmt not in ('parquet', 'pickle'):
+            raise ValueError("unknown cache format '{}'".format(self._fmt))
+        self._ingest_cache = None
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    @property
+    def batch_size(self):
+        """the batch size of the wrapped downloader, `None` if it is not a batch downloader"""
+        return getattr(self._downloader, 'batch_size', None)
+
+    def bind_cache(self, cache):
+        """returns a copy of this downloader using the dataframe cache of an ingestion
+
+        It is called by `direct_ingester` with the `cache` argument of
+        the ingest function, which is used when no persistent path is
+        given. This downloader is left unchanged.
+
+        :rtype: cached_downloader
+        """
+        bound = copy.copy(self)
+        bound._ingest_cache = cache
+        return bound
+
+    def bind_sessions(self, start_session, end_session):
+        """returns a copy of this downloader wrapping the downloader bound to the sessions of an ingestion
+
+        The sessions may narrow the range of the wrapped downloader,
+        so the `cache_key` of the bound one is used unless a key was
+        given. This downloader is left unchanged.
+
+        :rtype: cached_downloader
+        """
+        bind_sessions = getattr(self._downloader, 'bind_sessions', None)
+        if bind_sessions is None:
+            return self
+        bound = copy.copy(self)
+        bound._downloader = bind_sessions(start_session, end_session)
+        if not self._fixed_key:
+            bound._key = getattr(bound._downloader, 'cache_key', self._key)
+        return bound
+
+    def open(self):
+        """opens the wrapped downloader, if it has a lifecycle"""
+        open_downloader = getattr(self._downloader, 'open', None)
+        if open_downloader is not None:
+            open_downloader()
+
+    def close(self):
+        """closes the wrapped downloader, if it has a lifecycle"""
+        close_downloader = getattr(self._downloader, 'close', None)
+        if close_downloader is not None:
+            close_downloader()
+
+    def entry_name(self, symbol, start_date=None):
+        """returns the content address of the price data of `symbol`
+        """
+        key = tuple(str(k) for k in self._key) + (symbol, str(start_date))
+        return hashlib.sha256(repr(key).encode()).hexdigest()
+
+    def _entry_path(self, name):
+        return os.path.join(self._path, '{}.{}'.format(name, self._fmt))
+
+    def _load(self, name):
+        """returns the cached dataframe of entry `name`, or `None` if it is missing or expired
+        """
+        if not self._path:
+            if self._ingest_cache is None:
+                return None
+            try:
+                return self._ingest_cache[name]
+            except KeyError:
+                return None
+        entry_path = self._entry_path(name)
+        try:
+            mtime = os.stat(entry_path).st_mtime
+        except FileNotFoundError:
+            return None
+        if self._ttl is not None and time.time() - mtime > self._ttl:
+            return None
+        if self._fmt == 'parquet':
+            df = pd.read_parquet(entry_path)
+        else:
+            with open(entry_path, 'rb') as f:
+                df = pickle.load(f)
+        # the access time orders entries for eviction
+        os.utime(entry_path, (time.time(), mtime))
+        return df
+
+    def _store(self, name, df):
+        """stores `df` as entry `name` and evicts other entries beyond the size limit
+
+        Writes into the ingestion cache, which is not thread-safe, are
+        serialized by `self._lock`.
+        """
+        if not self._path:
+            if self._ingest_cache is not None:
+                with self._lock:
+                    self._ingest_cache[name] = df
+            return
+        entry_path = self._entry_path(name)
+        tmp_path = '{}.{}.tmp'.format(entry_path, threading.get_ident())
+        if self._fmt == 'parquet':
+            df.to_parquet(tmp_path)
+        else:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+        if self._max_bytes is not None:
+            self._evict(entry_path)
+
+    def _evict(self, keep):
+        """removes the least recently used entries until the cache fits in `max_bytes`
+
+        :param keep: the path of the entry just stored, which is never
+        removed, even if it alone exceeds `max_bytes`
+        :type keep: str
+        """
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self._path):
+                if entry.name.endswith('.' + self._fmt) and entry.path != keep:
+                    st = entry.stat()
+                    entries.append((st.st_atime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            try:
+                total += os.stat(keep).st_size
+            except FileNotFoundError:
+                pass
+            for _, size, entry_path in sorted(entries):
+                if total <= self._max_bytes:
+                    break
+                try:
+                    os.remove(entry_path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def _call_batch(self, symbols, start_date=None):
+        """returns the price data of `symbols` from the cache, downloading the missing ones by a single call
+        """
+        names = {symbol: self.entry_name(symbol, start_date) for symbol in symbols}
+        frames = {symbol: self._load(name) for symbol, name in names.items()}
+        missing = [symbol for symbol, df in frames.items() if df is None]
+        if missing:
+            downloaded = self._downloader(missing) if start_date is None else self._downloader(missing,
+                                                                                              start_date=start_date)
+            for symbol, df in downloaded.items():
+                if symbol in names and df is not None:
+                    self._store(names[symbol], df)
+                    frames[symbol] = df
+        return {symbol: df for symbol, df in frames.items() if df is not None}
+
+    def __call__(self, symbol, start_date=None):
+        """returns the price data of `symbol` from the cache, downloading it on a miss
+
+        A list of symbols is given to batch downloaders, whose price
+        data is returned keyed by symbol.
+        """
+        if not isinstance(symbol, str):
+            return self._call_batch(symbol, start_date)
+        name = self.entry_name(symbol, start_date)
+        df = self._load(name)
+        if df is None:
+            df = self._downloader(symbol) if start_date is None else self._downloader(symbol, start_date=start_date)
+            self._store(name, df)
+        return df
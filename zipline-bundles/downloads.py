@@ -0,0 +1,154 @@
+import time
+import threading
+
+class token_bucket:
+    """thread-safe token bucket rate limiter
+
+    Tokens are refilled continuously at `rate` tokens per second up to
+    `capacity`. A caller takes tokens by `acquire` and sleeps while
+    the bucket does not hold enough of them. Weighted requests, as
+    enforced by Binance and IEX, take more than one token.
+    """
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        """creates a token bucket
+
+        :param rate: the number of tokens refilled per second
+        :param capacity: the maximum number of tokens, i.e. the
+        allowed burst. Its default value is `max(rate, 1)`.
+        :param clock: the callable returning the current time in seconds
+        :param sleep: the callable used to wait for tokens
+
+        :type rate: float
+        :type capacity: float
+        :type clock: callable
+        :type sleep: callable
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive, got {}'.format(rate))
+        self._rate = float(rate)
+        self._capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self._capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """takes `tokens` from the bucket, waiting until they are available
+
+        :param tokens: the number of tokens, i.e. the weight of the request
+        :type tokens: float
+        :raise: ValueError when `tokens` exceeds the bucket capacity
+        """
+        if tokens > self._capacity:
+            raise ValueError('{} tokens exceed the bucket capacity {}'.format(tokens, self._capacity))
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self._rate
+            self._sleep(wait)
+
+# the exceptions of transient failures, retried by `call_with_retries`.
+# OSError covers ConnectionError, TimeoutError and the exceptions of requests.
+RETRYABLE_EXCEPTIONS = (OSError,)
+
+def call_with_retries(func, args=(), retries=0, backoff=1., max_backoff=60., on_retry=None,
+                      retry_on=RETRYABLE_EXCEPTIONS):
+    """calls `func(*args)` and retries with exponential backoff when it raises a retryable exception
+
+    The i-th retry waits `min(backoff * 2**i, max_backoff)` seconds. The
+    exception of the last attempt is propagated, as well as any
+    exception not in `retry_on`, which is not retried.
+
+    :param func: the callable to call
+    :param args: the positional arguments passed to `func`
+    :param retries: the maximum number of retries
+    :param backoff: the waiting time before the first retry in seconds
+    :param max_backoff: the upper bound of the waiting time in seconds
+    :param on_retry: an optional callable taking the attempt number
+    and the raised exception, called before waiting for a retry
+    :param retry_on: the exception types that are retried
+
+    :type func: callable
+    :type args: tuple
+    :type retries: int
+    :type backoff: float
+    :type max_backoff: float
+    :type on_retry: callable
+    :type retry_on: tuple of type
+    :return: the return value of `func`
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args)
+        except retry_on as exp:
+            if attempt >= retries:
+                raise
+            if on_retry is not None:
+                on_retry(attempt, exp)
+            time.sleep(min(backoff * 2 ** attempt, max_backoff))
+            attempt += 1
+
+def pooled_session(pool_size, session=None):
+    """returns an HTTP session keeping up to `pool_size` connections alive per host
+
+    :param pool_size: the maximum number of connections kept alive,
+    which should not be less than the number of concurrent requests
+    :param session: the session to pool, e.g. that of an API client.
+    A new one is created by default.
+    :type pool_size: int
+    :type session: requests.Session
+    :rtype: requests.Session
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session() if session is None else session
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+class shared_resource:
+    """a resource shared by all downloads of an ingestion, e.g. an HTTP session or an API client
+
+    The downloaders returned by `get_downloader` of the yahoo, iex
+    and binance modules expose `open` and `close` of their shared
+    resource as their lifecycle, see `direct_ingester`. A download
+    started before `open` opens the resource itself. Opening and
+    closing are thread safe.
+    """
+    def __init__(self, factory, closer=None):
+        """
+        :param factory: the callable creating the resource
+        :param closer: the callable releasing the resource. Its
+        default value `None` calls the `close` method of the resource.
+        :type factory: callable
+        :type closer: callable
+        """
+        self._factory = factory
+        self._closer = closer
+        self._resource = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """creates the resource, unless it exists, and returns it"""
+        with self._lock:
+            if self._resource is None:
+                self._resource = self._factory()
+            return self._resource
+
+    def close(self):
+        """releases the resource, if it exists"""
+        with self._lock:
+            resource, self._resource = self._resource, None
+        if resource is not None:
+            if self._closer is None:
+                resource.close()
+            else:
+                self._closer(resource)
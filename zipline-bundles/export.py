@@ -0,0 +1,166 @@
+import os
+import shutil
+import urllib.parse
+import pandas as pd
+#
+import zipline.utils.paths as pth
+from zipline.data.bundles.core import to_bundle_ingest_dirname
+try:
+    import pyarrow
+except ImportError: # parquet support is optional
+    pyarrow = None
+from .csvio import _arrow_modules
+from .manifest import ingestion_shard
+
+# the directory of the dataset exported into an ingestion, see `dataset_exporter`
+DATASET_DIR = 'dataset'
+
+class dataset_exporter:
+    """writes the bars, the adjustments and the asset metadata of
+    every ingestion to a parquet dataset, as a side output of the pass
+    streaming them to zipline's writers
+
+    The dataset is written into the ingestion directory, so it is
+    versioned, merged and cleaned with the ingestion itself. Its
+    layout is
+
+        dataset/daily/symbol=<symbol>/year=<year>/part-0.parquet
+        dataset/minute/symbol=<symbol>/year=<year>/part-0.parquet
+        dataset/equities.parquet
+        dataset/splits.parquet
+        dataset/dividends.parquet
+
+    The bar tables are partitioned by symbol and year in the hive
+    flavor, so `pyarrow.dataset` reads only the files of the symbols
+    and years selected by a filter. Bars have columns sid, date,
+    open, high, low, close and volume. The other tables are those
+    given to the asset db and the adjustment writers, keyed by sid.
+    Minute ingestions have the minute table, and the daily one too
+    if the ingester resamples daily bars. Bars are exported as they
+    are given to zipline's writers, so bars off the sessions of the
+    calendar are left out by a filter only, e.g. 'sessions', and not
+    by the writers. Datasets are opened by
+    `bundle_dataset`:
+
+        register('yahoo', direct_ingester(..., exporter=dataset_exporter()))
+        bars = bundle_dataset('yahoo').to_table(filter=pyarrow.compute.field('symbol') == 'AAPL')
+    """
+    # the tables of the dataset other than bars
+    TABLES = ('equities', 'splits', 'dividends')
+    # the exported columns of bars
+    BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, compression='snappy', partition_by_year=True):
+        """creates an exporter
+
+        :param compression: the compression codec of the parquet files
+        :param partition_by_year: if `False`, the bars are partitioned
+        by symbol only
+        :type compression: str
+        :type partition_by_year: bool
+        :raise: ValueError when pyarrow is not installed
+        """
+        if pyarrow is None:
+            raise ValueError('exporting a dataset requires pyarrow to be installed')
+        self._compression = compression
+        self._partition_by_year = partition_by_year
+        self._path = None
+
+    @property
+    def path(self):
+        """the dataset directory of the ingestion in progress, `None` out of an ingestion"""
+        return self._path
+
+    def open(self, output_dir):
+        """starts the dataset in ingestion directory `output_dir`"""
+        _arrow_modules('parquet')
+        self._path = os.path.join(output_dir, DATASET_DIR)
+        shutil.rmtree(self._path, ignore_errors=True)
+        os.makedirs(self._path)
+
+    def close(self):
+        self._path = None
+
+    def write_bars(self, frequency, sid, symbol, df):
+        """writes the bars of a symbol into the partitions of its years
+
+        :param frequency: the bar table, 'daily' or 'minute'
+        :param sid: the sid of the symbol
+        :param symbol: the symbol name
+        :param df: the bars indexed by timestamp
+        :type frequency: str
+        :type sid: int
+        :type symbol: str
+        :type df: pandas.DataFrame
+        """
+        frame = df[[column for column in self.BAR_COLUMNS if column in df.columns]]
+        frame = frame.rename_axis('date').reset_index()
+        frame.insert(0, 'sid', sid)
+        # the partition values are percent-encoded, as pyarrow decodes them
+        directory = os.path.join(self._path, frequency, 'symbol=' + urllib.parse.quote(symbol, safe=''))
+        parts = frame.groupby(frame.date.dt.year) if self._partition_by_year else [(None, frame)]
+        for year, part in parts:
+            part_dir = directory if year is None else os.path.join(directory, 'year={}'.format(year))
+            os.makedirs(part_dir, exist_ok=True)
+            pyarrow.parquet.write_table(pyarrow.Table.from_pandas(part, preserve_index=False),
+                                        os.path.join(part_dir, 'part-0.parquet'), compression=self._compression)
+
+    def write_table(self, name, df):
+        """writes table `name` of `TABLES`, whose index, if named, is kept as a column
+
+        A `None` table, e.g. when there is no split, is not written.
+        """
+        if df is None:
+            return
+        table = pyarrow.Table.from_pandas(df if df.index.name is None else df.reset_index(), preserve_index=False)
+        pyarrow.parquet.write_table(table, os.path.join(self._path, name + '.parquet'), compression=self._compression)
+
+def bundle_dataset(name, table='daily', timestamp=None, environ=None):
+    """opens a table of the dataset exported by an ingestion of bundle `name`, see `dataset_exporter`
+
+    :param name: the name of the bundle
+    :param table: 'daily', 'minute' or one of `dataset_exporter.TABLES`
+    :param timestamp: the time of the ingestion. The default value
+    `None` means the latest ingestion with a dataset that is not a
+    shard.
+    :param environ: the environment giving the zipline root
+    :type name: str
+    :type table: str
+    :type timestamp: pandas.Timestamp
+    :type environ: mapping
+    :return: the table, whose bars have the symbol, a string, and the
+    year, an int32, as partition columns. The year is left out if the
+    bars were partitioned by symbol only.
+    :rtype: pyarrow.dataset.Dataset
+    :raise: ValueError when pyarrow is not installed, or there is no
+    such ingestion or table
+    """
+    if pyarrow is None:
+        raise ValueError('reading a dataset requires pyarrow to be installed')
+    _arrow_modules('dataset')
+    root = pth.data_path([name], environ=environ)
+    if timestamp is not None:
+        entries = [to_bundle_ingest_dirname(pd.Timestamp(timestamp))]
+    else:
+        entries = sorted(entry for entry in (os.listdir(root) if os.path.isdir(root) else [])
+                         if not entry.startswith('.')
+                         and not os.path.isfile(os.path.join(root, entry, ingestion_shard.FILE_NAME)))
+    entries = [entry for entry in entries if os.path.isdir(os.path.join(root, entry, DATASET_DIR))]
+    if not entries:
+        raise ValueError("no ingestion of bundle '{}' has a dataset".format(name))
+    path = os.path.join(root, entries[-1], DATASET_DIR)
+    if table in dataset_exporter.TABLES:
+        path = os.path.join(path, table + '.parquet')
+        if not os.path.isfile(path):
+            raise ValueError("the dataset has no table '{}'".format(table))
+        return pyarrow.dataset.dataset(path, format='parquet')
+    path = os.path.join(path, table)
+    if not os.path.isdir(path):
+        raise ValueError("the dataset has no table '{}'".format(table))
+    # the partition types are explicit, so that symbols such as '0700' are not inferred as numbers
+    fields = [('symbol', pyarrow.string())]
+    symbol_dirs = [entry.path for entry in os.scandir(path) if entry.is_dir()]
+    if symbol_dirs and any(entry.startswith('year=') for entry in os.listdir(symbol_dirs[0])):
+        fields.append(('year', pyarrow.int32()))
+    partitioning = pyarrow.dataset.partitioning(pyarrow.schema(fields), flavor='hive')
+    return pyarrow.dataset.dataset(path, format='parquet', partitioning=partitioning)
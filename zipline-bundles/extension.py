@@ -3,80 +3,85 @@
 
 from pathlib import Path
 from zipline.data.bundles import register
-from zipline.data.bundles.ingester import csv_ingester # ingester.py need to be placed in zipline.data.bundles
+# ingester.py and its modules need to be placed in zipline.data.bundles,
+# see install.py. The bundles are registered lazily: their modules and
+# third-party clients are imported only when they are ingested, which
+# keeps every zipline command fast.
+from zipline.data.bundles.ingester import csv_ingester, direct_ingester, cached_downloader, deferred, lazy_ingester
 
 _DEFAULT_PATH = str(Path.home() / '.zipline/csv/yahoo')
 
 register(
     'yahoo_csv',
-    csv_ingester('YAHOO',
-                 every_min_bar=False, # the price is daily
-                 csvdir_env='YAHOO_CSVDIR',
-                 csvdir=_DEFAULT_PATH,
-                 index_column='Date',
-                 column_mapper={'Open': 'open',
-                                'High': 'high',
-                                'Low': 'low',
-                                'Close': 'close',
-                                'Volume': 'volume',
-                                'Adj Close': 'price',
-                 },
+    lazy_ingester(csv_ingester, 'YAHOO',
+                  every_min_bar=False, # the price is daily
+                  csvdir_env='YAHOO_CSVDIR',
+                  csvdir=_DEFAULT_PATH,
+                  index_column='Date',
+                  column_mapper={'Open': 'open',
+                                 'High': 'high',
+                                 'Low': 'low',
+                                 'Close': 'close',
+                                 'Volume': 'volume',
+                                 'Adj Close': 'price',
+                  },
+                  adj_close_column='price', # derive dividend adjustments from adjusted close
+                  date_format='%Y-%m-%d',
     ),
     calendar_name='NYSE',
 )
 
-from zipline.data.bundles.ingester import direct_ingester
-
-from zipline.data.bundles import yahoo
 register('yahoo_direct', # bundle's name
-         direct_ingester('YAHOO',
-                         every_min_bar=False,
-                         symbol_list_env='YAHOO_SYM_LST', # the environemnt variable holding the comma separated list of assert names
-                         downloader=yahoo.get_downloader(start_date='2010-01-01',
-                                                         end_date='2020-01-01'
-                         ),
+         lazy_ingester(direct_ingester, 'YAHOO',
+                       every_min_bar=False,
+                       symbol_list_env='YAHOO_SYM_LST', # the environemnt variable holding the comma separated list of assert names
+                       downloader=deferred('zipline.data.bundles.yahoo:get_downloader',
+                                           start_date='2010-01-01',
+                                           end_date='2020-01-01'
+                       ),
          ),
          calendar_name='NYSE',
 )
 
-from zipline.data.bundles import iex
-import exchange_calendars as xcals
-
-cal=xcals.get_calendar('NYSE')
 register('iex', # bundle's name
-         direct_ingester('IEX Cloud',
-                         every_min_bar=False,
-                         symbol_list_env='IEX_SYM_LST', # the environemnt variable holding the comma separated list of assert names
-                         downloader=iex.get_downloader(start_date='2020-01-01',
-                                                       end_date='2020-01-05'
-                         ),
-                         filter_cb=lambda df: df[[cal.is_session(dt) for dt in df.index]]
+         lazy_ingester(direct_ingester, 'IEX Cloud',
+                       every_min_bar=False,
+                       symbol_list_env='IEX_SYM_LST', # the environemnt variable holding the comma separated list of assert names
+                       downloader=deferred('zipline.data.bundles.iex:get_downloader',
+                                           start_date='2020-01-01',
+                                           end_date='2020-01-05',
+                                           batch_size=100, # 100 symbols per request
+                       ),
+                       filter_cb='sessions', # drop the bars off NYSE sessions
          ),
          calendar_name='NYSE',
 )
 
-from zipline.data.bundles import binance
-
 register('binance_daily', # bundle's name
-         direct_ingester('Binance Exchange',
-                         every_min_bar=False,
-                         symbol_list_env='BINANCE_SYM_LST', # the environemnt variable holding the comma separated list of assert names
-                         downloader=binance.get_downloader(start_date='2020-01-01',
-                                                           end_date='2020-01-05',
-                                                           every_min_bar=False # True for minute price, False for dailyprice
-                         ),
+         lazy_ingester(direct_ingester, 'Binance Exchange',
+                       every_min_bar=False,
+                       symbol_list_env='BINANCE_SYM_LST', # the environemnt variable holding the comma separated list of assert names
+                       downloader=deferred('zipline.data.bundles.binance:get_downloader',
+                                           start_date='2020-01-01',
+                                           end_date='2020-01-05',
+                                           every_min_bar=False # True for minute price, False for dailyprice
+                       ),
          ),
          calendar_name='24/7',
 )
 
 register('binance_min', # bundle's name
-         direct_ingester('Binance Exchange',
-                         every_min_bar=True,
-                         symbol_list_env='BINANCE_SYM_LST', # the environemnt variable holding the comma separated list of assert names
-                         downloader=binance.get_downloader(start_date='2020-01-01',
-                                                           end_date='2020-01-05',
-                                                           every_min_bar=True # True for minute price, False for dailyprice
-                         ),
+         lazy_ingester(direct_ingester, 'Binance Exchange',
+                       every_min_bar=True,
+                       symbol_list_env='BINANCE_SYM_LST', # the environemnt variable holding the comma separated list of assert names
+                       # downloads are kept in zipline's cache until the ingestion succeeds
+                       downloader=deferred(cached_downloader,
+                                           deferred('zipline.data.bundles.binance:get_downloader',
+                                                    start_date='2020-01-01',
+                                                    end_date='2020-01-05',
+                                                    every_min_bar=True # True for minute price, False for dailyprice
+                       )),
+                       resample_daily=True, # daily bars are aggregated from the minute bars
          ),
          calendar_name='24/7',
 )
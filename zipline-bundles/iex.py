@@ -1,24 +1,100 @@
-from pandas import Timestamp
+import functools
+from pandas import Timestamp, DataFrame
 from iexfinance.stocks import get_historical_data
+from .downloads import pooled_session, shared_resource
+
+# the maximum number of symbols of a batch request
+MAX_BATCH_SIZE=100
+
+def split_batch(df, symbols):
+    """splits the price data of several symbols returned by
+    `get_historical_data` into a dataframe per symbol
+
+    :param df: the price data indexed by symbol and date, or by date
+    only if a single symbol was requested
+    :param symbols: the requested symbols
+    :type df: pandas.DataFrame
+    :type symbols: list of str
+    :return: the price data of every symbol with data, keyed by the requested symbol
+    :rtype: dict mapping str to pandas.DataFrame
+    """
+    if df.empty:
+        return {}
+    if len(symbols) == 1:
+        return {symbols[0]: df}
+    # iex returns the symbols upper case
+    requested={symbol.upper(): symbol for symbol in symbols}
+    return {requested[key]: frame.droplevel(0) for key, frame in df.groupby(level=0, sort=False) if key in requested}
 
 def get_downloader(start_date,
-               end_date,):
+               end_date,
+               pool_size=10,
+               batch_size=None,):
     """returns a downloader closure for iex cloud
+
+    The downloader has `open` and `close` methods, called by
+    `direct_ingester` at the beginning and the end of an ingestion.
+    Between them, all symbols are downloaded through a single HTTP
+    session, whose connections are kept alive. A downloader called
+    before `open` opens the session itself. Its `bind_sessions`
+    method, called by `direct_ingester` too, returns a new downloader
+    whose range is narrowed to the sessions of an ingestion, and
+    leaves this one unchanged.
+
     :param start_date: the first day on which dat are downloaded
     :param end_date: the last day on which data are downloaded
+    :param pool_size: the maximum number of connections kept alive,
+    which should not be less than the number of concurrent downloads
+    :param batch_size: the number of symbols downloaded by a single
+    request to the batch endpoint, up to `MAX_BATCH_SIZE`. The
+    default value `None` means one request per symbol.
     :type start_date: str in format YYYY-MM-DD
     :type end_date: str in format YYYY-MM-DD
+    :type pool_size: int
+    :type batch_size: int
+    :raise: ValueError when `batch_size` is greater than `MAX_BATCH_SIZE`
     """
+    if batch_size is not None and batch_size > MAX_BATCH_SIZE:
+        raise ValueError('batch_size must not exceed {}'.format(MAX_BATCH_SIZE))
     dt_start=Timestamp(start_date).date()
     dt_end=Timestamp(end_date).date()
+    session=shared_resource(functools.partial(pooled_session, pool_size))
+
+    def bind_sessions(start_session, end_session):
+        """returns a downloader of the days from `start_session` to `end_session` within the range of this one"""
+        start, end = dt_start, dt_end
+        if start_session is not None:
+            start = max(start, Timestamp(start_session).date())
+        if end_session is not None:
+            end = min(end, Timestamp(end_session).date())
+        return get_downloader(start, end, pool_size, batch_size)
 
-    def downloader(symbol):
+    def downloader(symbol, start_date=None):
         """downloads symbol price data using iex cloud API
-        :param symbol: the symbol name
-        :type symbol: str
+        :param symbol: the symbol name, or a list of symbol names if
+        the downloader has a batch size
+        :param start_date: the first day on which data are downloaded,
+        it overrides the one given to `get_downloader`
+        :type symbol: str or list of str
+        :type start_date: str in format YYYY-MM-DD or pandas.Timestamp
+        :return: the price data, keyed by symbol for a list of symbols
+        :rtype: pandas.DataFrame or dict mapping str to pandas.DataFrame
         """
-        df = get_historical_data(symbol, dt_start, dt_end, output_format='pandas')
+        batch = not isinstance(symbol, str)
+        start, end = dt_start, dt_end
+        if start_date is not None:
+            start = max(start, Timestamp(start_date).date())
+        if start > end:
+            return {} if batch else DataFrame()
+        df = get_historical_data(list(symbol) if batch else symbol, start, end, output_format='pandas',
+                                 session=session.open())
 
-        return df
+        return split_batch(df, list(symbol)) if batch else df
 
+    downloader.cache_key=('iex', str(dt_start), str(dt_end), 'daily')
+    downloader.open=session.open
+    downloader.bind_sessions=bind_sessions
+    downloader.close=session.close
+    if batch_size is not None and batch_size > 1:
+        downloader.batch_size=batch_size
     return downloader
@@ -0,0 +1,182 @@
+import os
+import numpy as np
+import pandas as pd
+import json
+#
+from .manifest import ingestion_shard
+
+# the file of an ingestion storing the last raw and adjusted close of every symbol, see `adj_close2dividends`
+ADJ_CLOSE_FILE = 'adj_close.json'
+
+def _event_dates(index):
+    """returns the session dates of the bars in `index`"""
+    if index.tz is not None:
+        index = index.tz_convert(None)
+    return index.normalize()
+
+class previous_ingestion:
+    """read access to an earlier ingestion of a bundle
+
+    Zipline stores every ingestion of a bundle in its own directory,
+    named after the ingestion time, next to the earlier ones. This
+    class reads the asset metadata and the bars of one of those
+    directories, so that an incremental ingestion only needs to fetch
+    the bars later than the last bar of each symbol.
+    """
+    _FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, path, every_min_bar):
+        """opens an earlier ingestion
+
+        :param path: the ingestion directory
+        :param every_min_bar: `True` if the minute bars must be read,
+        otherwise the daily bars are read
+
+        :type path: str
+        :type every_min_bar: bool
+        """
+        from zipline.assets import AssetFinder, ASSET_DB_VERSION
+        from zipline.data.bcolz_daily_bars import BcolzDailyBarReader
+        from zipline.data.bcolz_minute_bars import BcolzMinuteBarReader, BcolzMinuteBarMetadata, OHLC_RATIO
+        from zipline.data.adjustments import SQLiteAdjustmentReader
+        self._path = path
+        self._every_min_bar = every_min_bar
+        finder = AssetFinder(os.path.join(path, 'assets-{}.sqlite'.format(ASSET_DB_VERSION)))
+        self._assets = {asset.symbol: asset for asset in finder.retrieve_all(finder.sids)}
+        # the ratio by which the writer multiplied the prices of every sid before storing them as integers
+        self._ohlc_ratio, self._ohlc_ratios = OHLC_RATIO, {}
+        if every_min_bar:
+            rootdir = os.path.join(path, 'minute_equities.bcolz')
+            self._reader = BcolzMinuteBarReader(rootdir)
+            metadata = BcolzMinuteBarMetadata.read(rootdir)
+            self._ohlc_ratio, self._ohlc_ratios = metadata.default_ohlc_ratio, metadata.ohlc_ratios_per_sid or {}
+        else:
+            self._reader = BcolzDailyBarReader(os.path.join(path, 'daily_equities.bcolz'))
+        self._splits, self._dividends = None, None
+        adjustments_path = os.path.join(path, 'adjustments.sqlite')
+        if os.path.isfile(adjustments_path):
+            reader = SQLiteAdjustmentReader(adjustments_path)
+            try:
+                adjustments = reader.unpack_db_to_component_dfs(convert_dates=True)
+            finally:
+                reader.close()
+            self._splits = adjustments['splits'].groupby('sid')
+            self._dividends = adjustments['dividend_payouts'].groupby('sid')
+        self._adj_closes = {}
+        try:
+            with open(os.path.join(path, ADJ_CLOSE_FILE)) as f:
+                self._adj_closes = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def path(self):
+        """the ingestion directory"""
+        return self._path
+
+    def last_adj_close(self, symbol):
+        """returns the date, the raw and the adjusted close of the last
+        bar of `symbol` that had an adjusted close, or `None` if none
+        was stored
+
+        :rtype: tuple of (pandas.Timestamp, float, float)
+        """
+        last = self._adj_closes.get(symbol)
+        return None if last is None else (pd.Timestamp(last[0]), last[1], last[2])
+
+    @staticmethod
+    def find(output_dir):
+        """returns the most recent ingestion directory older than `output_dir`
+
+        The ingestions of shards are skipped, since they hold a part
+        of the symbols only, see `merge_shards`.
+
+        :param output_dir: the directory of the ingestion in progress,
+        as passed by zipline to the ingest function
+        :type output_dir: str
+        :return: the path to the earlier ingestion, or `None` if there is none
+        :rtype: str
+        """
+        from zipline.assets import ASSET_DB_VERSION
+        if not output_dir:
+            return None
+        parent, current = os.path.split(os.path.normpath(output_dir))
+        if not os.path.isdir(parent):
+            return None
+        asset_db = 'assets-{}.sqlite'.format(ASSET_DB_VERSION)
+        earlier = sorted(name for name in os.listdir(parent)
+                         if name < current and not name.startswith('.')
+                         and os.path.isfile(os.path.join(parent, name, asset_db))
+                         and not os.path.isfile(os.path.join(parent, name, ingestion_shard.FILE_NAME)))
+        return os.path.join(parent, earlier[-1]) if earlier else None
+
+    def symbols(self):
+        """returns the ingested symbols
+
+        :rtype: list of str
+        """
+        return sorted(self._assets)
+
+    def last_bar(self, symbol):
+        """returns the timestamp of the last ingested bar of `symbol`, or `None` if it was not ingested
+        """
+        asset = self._assets.get(symbol)
+        return None if asset is None else asset.end_date
+
+    @staticmethod
+    def _events(grouped, sid, date_column, value_column):
+        """returns the events of `sid` as a series of values indexed by date"""
+        if grouped is None or sid not in grouped.groups:
+            return pd.Series(dtype=np.float64)
+        events = grouped.get_group(sid)
+        return pd.Series(events[value_column].values, index=pd.DatetimeIndex(events[date_column]))
+
+    def bars(self, symbol):
+        """returns the ingested bars of `symbol`, or `None` if it was not ingested
+
+        Besides OHLCV, the dataframe has the columns `dividend` and
+        `split` restored from the adjustments of the ingestion, so
+        that merging new bars into it keeps the earlier events.
+
+        The bars are returned as they are stored, so that writing them
+        again leaves them unchanged: prices are the stored integers
+        divided by the ratio of the writer, without the rounding error
+        of the reader, and the prices stored as zero, which the reader
+        turns into nan, are zero. Every session from the first to the
+        last daily bar of the symbol is a stored bar, whereas the
+        minutes without a bar are stored with zero prices and volume,
+        which are left out.
+
+        :param symbol: the symbol name
+        :type symbol: str
+        :rtype: pandas.DataFrame
+        """
+        asset = self._assets.get(symbol)
+        if asset is None:
+            return None
+        start, end = asset.start_date, asset.end_date
+        if self._every_min_bar:
+            start = start.tz_localize('UTC') if start.tz is None else start
+            end = end.tz_localize('UTC') if end.tz is None else end
+            index = self._reader.calendar.minutes_in_range(start, end)
+        else:
+            sessions = self._reader.sessions
+            index = sessions[(sessions >= start) & (sessions <= end)]
+            start, end = index[0], index[-1]
+        arrays = self._reader.load_raw_arrays(self._FIELDS, start, end, [asset.sid])
+        df = pd.DataFrame({field: values[:, 0] for field, values in zip(self._FIELDS, arrays)}, index=index)
+        if self._every_min_bar:
+            missing = np.isnan(df[['open', 'high', 'low', 'close']].values).all(axis=1) & (df['volume'].values == 0)
+            df = df[~missing]
+        ratio = self._ohlc_ratios.get(asset.sid, self._ohlc_ratio)
+        for field in ('open', 'high', 'low', 'close'):
+            df[field] = np.round(np.nan_to_num(df[field].values) * ratio) / ratio
+        df['volume'] = np.nan_to_num(df['volume'].values)
+        # events belong to the first bar of their session
+        dates = _event_dates(df.index)
+        first = ~dates.duplicated()
+        dividends = self._events(self._dividends, asset.sid, 'ex_date', 'amount')
+        splits = self._events(self._splits, asset.sid, 'effective_date', 'ratio')
+        df['dividend'] = np.where(first, dividends.groupby(level=0).sum().reindex(dates, fill_value=0).values, 0)
+        df['split'] = np.where(first, 1. / splits.groupby(level=0).prod().reindex(dates, fill_value=1).values, 1)
+        return df
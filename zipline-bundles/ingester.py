@@ -1,36 +1,504 @@
 import os
 import sys
+import time
 import numpy as np
 import pandas as pd
 import datetime as dt
+import pickle
+import tempfile
+import zlib
+import functools
+import contextlib
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 #
 from logbook import Logger
 #
 from zipline.utils.cli import maybe_show_progress
+#
+# the building blocks of the ingesters live in their own modules and
+# are re-exported here, where `extension.py` and the bundles import them
+from .csvio import CSV_ENGINES, CSV_DTYPES, CSV_SUFFIXES, ARCHIVE_SUFFIXES, archive_member, open_csv, csv_file, \
+    find_csv_files, read_csv, read_csv_after, read_csv_from, read_csv_range, _arrow_modules, _csv_suffix, \
+    _rows_after, _naive, _rows_within, _table2frame
+from .manifest import csv_manifest, ingestion_shard
+from .incremental import ADJ_CLOSE_FILE, previous_ingestion, _event_dates
+from .validation import VALIDATION_CHECKS, VALIDATION_POLICIES, bar_validator
+from .profiling import PROFILE_ENV, timed_call, ingest_profiler
+from .downloads import token_bucket, RETRYABLE_EXCEPTIONS, call_with_retries, pooled_session, shared_resource
+from .download_cache import cached_downloader
+from .registration import deferred, lazy_ingester
 
 log = Logger(__name__)
 
-def create_metadata(nsymbols):
-    """creates and return metadata dataframe with appropriate columns with length of `nsymbols`
+class metadata_accumulator:
+    """columnar accumulator of asset metadata
+
+    The start and end dates of every symbol are stored into arrays
+    allocated once for all symbols, and the equities dataframe
+    expected by zipline's asset db writer is built by a single
+    construction at the end of the ingestion.
+    """
+    __slots__ = ('_exchange', '_symbols', '_start', '_end', '_filled', '_expected')
+
+    def __init__(self, symbols, exchange, sids=None):
+        """creates an accumulator for `symbols`, indexed by their position
+
+        :param symbols: the symbol names
+        :param exchange: the name of the exchange
+        :param sids: the positions of the symbols that are ingested,
+        e.g. by a shard of the ingestion. All symbols are ingested if
+        it is `None`.
+        :type symbols: sequence of str
+        :type exchange: str
+        :type sids: sequence of int
+        """
+        self._exchange = exchange
+        self._symbols = np.array(symbols, dtype=object)
+        self._start = np.empty(len(symbols), dtype='datetime64[ns]')
+        self._end = np.empty(len(symbols), dtype='datetime64[ns]')
+        self._filled = np.zeros(len(symbols), dtype=bool)
+        self._expected = np.ones(len(symbols), dtype=bool)
+        if sids is not None:
+            self._expected[:] = False
+            self._expected[np.asarray(sids, dtype=np.intp)] = True
+
+    def update(self, symbol_index, start_date, end_date):
+        """records the first and the last bar of the symbol at `symbol_index`
+
+        :type symbol_index: int
+        :type start_date: pandas.Timestamp
+        :type end_date: pandas.Timestamp
+        """
+        # tz-aware timestamps are stored in UTC
+        self._start[symbol_index] = start_date.to_datetime64()
+        self._end[symbol_index] = end_date.to_datetime64()
+        self._filled[symbol_index] = True
+
+    def missing(self):
+        """returns the ingested symbols that produced no data
+
+        :rtype: list of str
+        """
+        return list(self._symbols[self._expected & ~self._filled])
+
+    def to_frame(self):
+        """returns the equities dataframe of the symbols that produced data
 
-    :param nsymbols: the number of symbols
-    :type nsymbols: int
-    :return: the resulting metadata dataframe
+        The dataframe is indexed by symbol index, i.e. sid. Symbols
+        without data are left out.
+
+        :rtype: pandas.DataFrame
+        """
+        sids = np.flatnonzero(self._filled)
+        end = self._end[sids]
+        return pd.DataFrame({'start_date': self._start[sids],
+                             'end_date': end,
+                             'auto_close_date': end + np.timedelta64(1, 'D'),
+                             'symbol': self._symbols[sids],
+                             'exchange': self._exchange,},
+                            index=sids)
+
+_EXECUTORS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+
+def ordered_map(func, items, max_workers=None, executor='thread', max_pending=None, initializer=None, initargs=()):
+    """applies `func` on every item of `items` in a worker pool and yields the results in order
+
+    At most `max_pending` items are in flight at any time, a new item
+    is only submitted once the oldest result is taken by the
+    consumer. Therefore a slow consumer, e.g. a zipline bar writer,
+    puts back pressure on the workers and the memory held by finished
+    but not yet consumed results stays bounded.
+
+    :param func: the callable applied on each item. It must be
+    picklable when `executor` is 'process'
+
+    :param items: an iterable of items passed to `func`
+
+    :param max_workers: the number of workers. `None`, 0 or 1 means
+    no pool is created and `func` is applied serially in the calling
+    thread.
+
+    :param executor: the kind of worker pool, either 'thread' or
+    'process'
+
+    :param max_pending: the maximum number of submitted items whose
+    results are not consumed yet. Its default value is twice the
+    number of workers.
+
+    :param initializer: the callable called with `initargs` once by
+    every worker before it applies `func`, e.g. to receive a large
+    argument once per process rather than with every item. Without a
+    pool, it is called once in the calling thread.
+
+    :param initargs: the arguments of `initializer`
+
+    :type func: callable
+    :type items: iterable
+    :type max_workers: int
+    :type executor: str
+    :type max_pending: int
+    :type initializer: callable
+    :type initargs: tuple
+    :return: the generator of `func(item)` in the order of `items`
+    :raise: ValueError when `executor` is unknown
+    """
+    if executor not in _EXECUTORS:
+        raise ValueError("unknown executor '{}', it must be one of {}".format(executor, tuple(_EXECUTORS)))
+    if not max_workers or max_workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield func(item)
+        return
+    max_pending = max(max_pending or 2 * max_workers, 1)
+    it = iter(items)
+    pending = deque()
+    with _EXECUTORS[executor](max_workers=max_workers, initializer=initializer, initargs=initargs) as pool:
+        try:
+            for item in it:
+                pending.append(pool.submit(func, item))
+                if len(pending) >= max_pending:
+                    break
+            while pending:
+                result = pending.popleft().result()
+                # keep the workers busy while the consumer handles the result
+                for item in it:
+                    pending.append(pool.submit(func, item))
+                    break
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# the environment variable selecting the shard of an ingestion, e.g. '2/8'
+SHARD_ENV = 'ZIPLINE_SHARD'
+
+def parse_shard(shard):
+    """returns the index and the count of a shard
+
+    :param shard: the shard as a pair of index and count, or as
+    '<index>/<count>', e.g. '2/8' for the third of eight shards
+    :type shard: tuple of (int, int) or str
+    :rtype: tuple of (int, int)
+    :raise: ValueError when `shard` is malformed or its index is not below its count
+    """
+    try:
+        index, count = shard.split('/') if isinstance(shard, str) else shard
+        index, count = int(index), int(count)
+    except (TypeError, ValueError):
+        raise ValueError("shard '{}' must be of the form '<index>/<count>'".format(shard))
+    if not 0 <= index < count:
+        raise ValueError('shard index {} is not in [0, {})'.format(index, count))
+    return index, count
+
+def shard_of(symbol, count):
+    """returns the shard of `symbol` among `count` shards
+
+    It is the crc32 of the symbol name modulo `count`, which, unlike
+    the builtin `hash`, is the same in every process and on every
+    machine.
+
+    :type symbol: str
+    :type count: int
+    :rtype: int
+    """
+    return zlib.crc32(symbol.encode('utf-8')) % count
+
+
+def align_to_sessions(df, calendar, every_min_bar=False, fill=None, report=False, symbol=None):
+    """keeps the bars of `df` that fall on a session of `calendar`
+
+    The index of `df` is matched against all the sessions (or trading
+    minutes when `every_min_bar` is `True`) of `calendar` between its
+    first and its last bar by a single vectorized lookup.
+
+    :param df: the price dataframe indexed by timestamp
+    :param calendar: the trading calendar of the bundle
+    :param every_min_bar: `True` if `df` holds minute bars
+    :param fill: how the sessions without a bar are filled. `None`
+    leaves them out, 'ffill' adds them with open, high, low and
+    close equal to the last close and zero volume
+    :param report: if `True`, the number of dropped bars and missing
+    sessions is logged
+    :param symbol: the symbol name used in the report
+
+    :type df: pandas.DataFrame
+    :type calendar: exchange_calendars.ExchangeCalendar
+    :type every_min_bar: bool
+    :type fill: str
+    :type report: bool
+    :type symbol: str
+    :return: the aligned dataframe
+    :rtype: pandas.DataFrame
+    :raise: ValueError when `fill` is unknown
+    """
+    if fill not in (None, 'ffill'):
+        raise ValueError("unknown fill method '{}'".format(fill))
+    if df is None or df.empty:
+        return df
+    tz = df.index.tz
+    if every_min_bar:
+        index = df.index if tz is not None else df.index.tz_localize('UTC')
+        expected = calendar.minutes_in_range(index[0], index[-1])
+    else:
+        index = (df.index if tz is None else df.index.tz_convert(None)).normalize()
+        expected = calendar.sessions_in_range(index[0], index[-1])
+    on_session = index.isin(expected)
+    aligned = df[on_session]
+    missing = expected.difference(index[on_session])
+    if report and (len(missing) or not on_session.all()):
+        log.info('{}: dropped {} bars off sessions, {} sessions without bar'.format(
+            symbol or 'price data', int((~on_session).sum()), len(missing)))
+    if fill == 'ffill' and len(missing):
+        aligned = aligned.set_axis(index[on_session])
+        aligned = aligned[~aligned.index.duplicated(keep='last')].reindex(expected)
+        close = aligned['close'].ffill()
+        gaps = aligned['close'].isna()
+        for column in ('open', 'high', 'low', 'close'):
+            if column in aligned.columns:
+                aligned[column] = aligned[column].where(~gaps, close)
+        if 'volume' in aligned.columns:
+            aligned['volume'] = aligned['volume'].fillna(0)
+        for column, default in (('dividend', 0), ('split', 1)):
+            if column in aligned.columns:
+                aligned[column] = aligned[column].fillna(default)
+        if every_min_bar and tz is None:
+            aligned.index = aligned.index.tz_convert(None)
+    return aligned
+
+# the columns of daily bars aggregated from minute bars by `minutes_to_daily`
+DAILY_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+def minutes_to_daily(df, calendar, start_session=None, end_session=None):
+    """aggregates minute bars into the daily bars of the sessions of `calendar`
+
+    Only the trading minutes of `calendar` are aggregated, the other
+    bars being left out, and each of them is labelled by the session
+    `calendar.minutes_to_sessions` maps it to. Whether the open and
+    the close are trading minutes follows the side of `calendar`: for
+    side 'right' of zipline calendars, the bar at the close is the
+    last minute of a session and the bar at the open is not a minute
+    of its session. It is the last minute of the previous session if
+    that one closes at this open, e.g. 00:00 on the 24/7 calendar,
+    and it is left out otherwise. Since the bars are sorted, every
+    session is a contiguous block aggregated by a single `reduceat`
+    per column: open is the first open, high the highest high, low
+    the lowest low, close the last close and volume the total volume.
+
+    The daily bars are clipped to the sessions from `start_session`
+    to `end_session`, and the sessions without minute bars between
+    the first and the last daily bar are added with missing prices
+    and zero volume, so that the bars cover every session between
+    them as zipline's daily bar writer requires.
+
+    :param df: the minute bars indexed by UTC timestamps, which may be
+    naive or aware, sorted in ascending order
+    :param calendar: the trading calendar of the bundle
+    :param start_session: the first session of the daily bars, if given
+    :param end_session: the last session of the daily bars, if given
+    :type df: pandas.DataFrame
+    :type calendar: exchange_calendars.ExchangeCalendar
+    :type start_session: pandas.Timestamp
+    :type end_session: pandas.Timestamp
+    :return: the daily bars indexed by session, with the columns in
+    `DAILY_COLUMNS` that `df` has
     :rtype: pandas.DataFrame
     """
-    return pd.DataFrame(np.empty(nsymbols, dtype=[
-        ('start_date', 'datetime64[ns]'),
-        ('end_date', 'datetime64[ns]'),
-        ('auto_close_date', 'datetime64[ns]'),
-        ('symbol', 'object'),
-        ('exchange', 'object'),]))
+    columns = [column for column in DAILY_COLUMNS if column in df.columns]
+    index = df.index if df.index.tz is None else df.index.tz_convert(None)
+    ts = index.asi8
+    opens = calendar.opens.values.view('i8')
+    closes = calendar.closes.values.view('i8')
+    side = getattr(calendar, 'side', 'right')
+    position = np.searchsorted(closes, ts, side='left' if side in ('right', 'both') else 'right')
+    on_session = position < len(closes)
+    if side in ('left', 'both'):
+        on_session[on_session] = ts[on_session] >= opens[position[on_session]]
+    else:
+        on_session[on_session] = ts[on_session] > opens[position[on_session]]
+    labels = calendar.minutes_to_sessions(index[on_session].tz_localize('UTC')).tz_localize(None)
+    if start_session is not None or end_session is not None:
+        lower = labels[0] if start_session is None else _naive(pd.Timestamp(start_session))
+        upper = labels[-1] if end_session is None or not len(labels) else _naive(pd.Timestamp(end_session))
+        in_range = np.asarray((labels >= lower) & (labels <= upper))
+        on_session[on_session] = in_range
+        labels = labels[in_range]
+    if not len(labels):
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([]), dtype=np.float64)
+    label_values = labels.asi8
+    starts = np.flatnonzero(np.concatenate(([True], label_values[1:] != label_values[:-1])))
+    ends = np.append(starts[1:], len(label_values)) - 1
+    daily = {}
+    for column in columns:
+        values = df[column].values[on_session]
+        if column == 'open':
+            daily[column] = values[starts]
+        elif column == 'close':
+            daily[column] = values[ends]
+        elif column == 'high':
+            daily[column] = np.fmax.reduceat(values, starts)
+        elif column == 'low':
+            daily[column] = np.fmin.reduceat(values, starts)
+        else:
+            daily[column] = np.add.reduceat(values, starts)
+    daily = pd.DataFrame(daily, index=labels[starts])
+    sessions = calendar.sessions_in_range(daily.index[0], daily.index[-1])
+    if len(sessions) != len(daily):
+        daily = daily.reindex(sessions)
+        if 'volume' in daily.columns:
+            daily['volume'] = daily['volume'].fillna(0)
+    return daily
+
+
+def extract_adjustments(sid, df):
+    """extracts split and dividend events of a symbol from its price dataframe
+
+    Events are the rows whose `split` column is not 1 or whose
+    `dividend` column is not 0. They are selected by vectorized masks
+    over the whole dataframe.
+
+    :param sid: the symbol index
+    :param df: the price dataframe
+    :type sid: int
+    :type df: pandas.DataFrame
+    :return: the splits and the dividends of the symbol in the format
+    expected by zipline's adjustment writer, or `None` for the kinds
+    of event not present
+    :rtype: tuple of (pandas.DataFrame, pandas.DataFrame)
+    """
+    splits, dividends = None, None
+    if 'split' in df.columns:
+        split = df['split'].values.astype(np.float64)
+        mask = (split != 1) & (split > 0)
+        if mask.any():
+            splits = pd.DataFrame({'effective_date': _event_dates(df.index[mask]),
+                                   'ratio': 1. / split[mask],
+                                   'sid': sid})
+    if 'dividend' in df.columns:
+        amount = df['dividend'].values.astype(np.float64)
+        mask = amount > 0
+        if mask.any():
+            ex_date = _event_dates(df.index[mask])
+            dividends = pd.DataFrame({'sid': sid,
+                                      'ex_date': ex_date,
+                                      'declared_date': ex_date,
+                                      'record_date': ex_date,
+                                      'pay_date': ex_date,
+                                      'amount': amount[mask]})
+    return splits, dividends
+
+def adj_close2dividends(df, adj_close_column, rtol=1e-5, previous=None):
+    """derives dividend amounts from an adjusted close column
+
+    The ratio of adjusted to raw close is the cumulative adjustment
+    factor of each bar. Wherever it changes from a bar to the next,
+    the change is converted into the cash dividend that yields the same
+    price adjustment in zipline, i.e. `close_prev * (1 - ratio)` where
+    ratio is the factor of the previous bar relative to the current one.
+
+    On the bars of a split, given by the `split` column, the factor
+    also changes by the split ratio if the raw close is not split
+    adjusted. Of the ratio with and without the split, the one closer
+    to 1 is kept there, so that a split is not taken for a dividend
+    whichever the close is.
+
+    :param df: the price dataframe with `close` and the adjusted close column
+    :param adj_close_column: the label of the adjusted close column
+    :param rtol: the relative change of the factor below which it is
+    considered as rounding noise
+    :param previous: the raw and the adjusted close of the bar before
+    the first bar of `df`, e.g. the last bar of the previous
+    ingestion, so that a dividend on the first bar is not lost
+    :type df: pandas.DataFrame
+    :type adj_close_column: str
+    :type rtol: float
+    :type previous: tuple of (float, float)
+    :return: the derived dividend amount per bar, zero on bars without event
+    :rtype: numpy.ndarray
+    """
+    close = df['close'].values.astype(np.float64)
+    adj_close = df[adj_close_column].values.astype(np.float64)
+    split = df['split'].values.astype(np.float64) if 'split' in df.columns else np.ones(len(df))
+    if previous is not None:
+        close = np.concatenate([[previous[0]], close])
+        adj_close = np.concatenate([[previous[1]], adj_close])
+        split = np.concatenate([[1.], split])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = adj_close / close
+        ratio = factor[:-1] / factor[1:]
+        split_ratio = ratio * split[1:]
+        ratio = np.where(np.abs(np.log(split_ratio)) < np.abs(np.log(ratio)), split_ratio, ratio)
+    amount = np.zeros(len(close))
+    if len(close) > 1:
+        event = np.isfinite(ratio) & (np.abs(ratio - 1) > rtol) & (ratio < 1)
+        amount[1:][event] = close[:-1][event] * (1 - ratio[event])
+    return amount if previous is None else amount[1:]
+
+# named filters that an ingester can opt into, mapped to factories
+# taking the calendar and the bar frequency. The filters are partials
+# of module level functions, so that they can be sent to worker processes
+FILTERS = {
+    'sessions': lambda calendar, every_min_bar: (
+        functools.partial(align_to_sessions, calendar=calendar, every_min_bar=every_min_bar)),
+    'sessions_ffill': lambda calendar, every_min_bar: (
+        functools.partial(align_to_sessions, calendar=calendar, every_min_bar=every_min_bar, fill='ffill')),
+}
+
+def create_filter(filter_cb, calendar, every_min_bar):
+    """returns the filter callable for an ingestion
+
+    :param filter_cb: a callable that takes a data frame and returns
+    the filtered dataframe, the name of a filter in `FILTERS`, or
+    `None` for no filter
+    :param calendar: the trading calendar of the ingestion
+    :param every_min_bar: `True` if the ingested bars are minute bars
+
+    :type filter_cb: callable or str
+    :type calendar: exchange_calendars.ExchangeCalendar
+    :type every_min_bar: bool
+    :rtype: callable
+    :raise: ValueError when there is no filter with the given name
+    """
+    if filter_cb is None or callable(filter_cb):
+        return filter_cb
+    if filter_cb not in FILTERS:
+        raise ValueError("unknown filter '{}', it must be one of {}".format(filter_cb, tuple(FILTERS)))
+    return FILTERS[filter_cb](calendar, every_min_bar)
 
 
+def _date_range(sessions, after):
+    """returns the bounds of the bars to read as pairs of timestamp and inclusiveness
+
+    The lower bound is the last bar of the previous ingestion,
+    exclusive, or the start session. The upper bound is the end of
+    the end session. A bound is `None` if it is not known.
+
+    :param sessions: the start and the end session of the ingestion
+    :param after: the last bar of the symbol in the previous ingestion
+    :type sessions: tuple of (pandas.Timestamp, pandas.Timestamp)
+    :type after: pandas.Timestamp
+    :rtype: tuple
+    """
+    start_session, end_session = sessions
+    lower = (after, False) if after is not None else (start_session, True)
+    upper = None if end_session is None else (end_session + pd.Timedelta(days=1), False)
+    return (lower if lower[0] is not None else None), upper
+
 class ingester_base:
     """
     data bundle reader base
     """
-    def __init__(self, exchange, every_min_bar):
+    # the label of the adjusted close column, set by the ingesters deriving dividends from it
+    _adj_close_column = None
+    # the filter given to the ingester, see `create_filter`, and the one created for an ingestion
+    _filter_cb = None
+    _filter_fn = None
+
+    def __init__(self, exchange, every_min_bar, incremental=False, profiler=None, validator=None,
+                 resample_daily=False, shard=None, exporter=None):
         """initializes an ingester instance
 
         :param exchange: the name of the exchange providing price data
@@ -40,12 +508,452 @@ class ingester_base:
         being `True` means the frequency is 1-minute, otherwise the
         price is provided daily.
 
+        :param incremental: if `True`, only the bars later than the
+        last bar of the previous ingestion are read, and they are
+        merged with the bars of the previous ingestion
+
+        :param profiler: the profiler recording the stages of every
+        ingestion. The default value `None` creates one, whose report
+        is written only if environment variable `PROFILE_ENV` is set.
+
+        :param validator: the validator of the new bars of every
+        symbol, see `bar_validator`. The default value `None` means
+        bars are not validated.
+
+        :param resample_daily: if `True`, the minute bars are also
+        aggregated into daily bars, which are written by the daily
+        bar writer in the same ingestion, see `minutes_to_daily`. It
+        requires `every_min_bar` to be `True`.
+
+        :param shard: the shard of the symbols ingested, as a pair of
+        index and count or as '<index>/<count>', see `parse_shard`.
+        Environment variable `SHARD_ENV` overrides it. The default
+        value `None` means all symbols are ingested.
+
+        :param exporter: the exporter of every ingestion to a parquet
+        dataset, see `dataset_exporter`. The default value `None`
+        means no dataset is exported.
+
         :type exchange: str
         :type every_min_bar: bool
-
+        :type incremental: bool
+        :type profiler: ingest_profiler
+        :type validator: bar_validator
+        :type resample_daily: bool
+        :type shard: tuple of (int, int) or str
+        :type exporter: dataset_exporter
+
+        :raise: ValueError when `resample_daily` is given for daily
+        bars, or `shard` is malformed
         """
+        if resample_daily and not every_min_bar:
+            raise ValueError('resample_daily requires minute bars')
+        self._shard_spec=None if shard is None else parse_shard(shard)
+        self._shard=self._shard_spec
+        self._universe=None
+        self._resample_daily=resample_daily
         self._exchange=exchange
         self._every_min_bar=every_min_bar
+        self._incremental=incremental
+        self._profiler=ingest_profiler() if profiler is None else profiler
+        self._validator=validator
+        self._exporter=exporter
+        self._previous=None
+        self._dropped=[]
+        self._sessions=(None, None)
+        self._splits=[]
+        self._dividends=[]
+
+    def _open_previous(self, output_dir, show_progress):
+        """opens the previous ingestion when the ingester is incremental
+
+        It is called once the universe is assigned by `_assign_sids`,
+        so that the symbols of the previous ingestion missing from the
+        universe are reported, see `dropped_symbols`.
+        """
+        self._previous = None
+        if not self._incremental:
+            return
+        path = previous_ingestion.find(output_dir)
+        if path is None:
+            if show_progress:
+                log.info('no previous ingestion found, ingesting the whole history')
+            return
+        if show_progress:
+            log.info('merging with previous ingestion \'{}\''.format(path))
+        self._previous = previous_ingestion(path, self._every_min_bar)
+        self._dropped = sorted(set(self._previous.symbols()) - set(self._universe or ()))
+        if self._dropped:
+            log.warning('{} symbols of the previous ingestion are missing from the universe and dropped: {}'.format(
+                len(self._dropped), ', '.join(self._dropped)))
+
+    def _start_ingestion(self, start_session=None, end_session=None, environ=None, output_dir=None):
+        """restarts the profiler and the validator at the beginning of an
+        ingestion, and keeps its sessions, which bound the bars to
+        read, and its shard, which is set by `SHARD_ENV` in `environ`
+        if it is given there. The dataset of the exporter, if any, is
+        started in `output_dir`.
+        """
+        self._profiler.reset(self._exchange)
+        if self._validator is not None:
+            self._validator.reset()
+        if self._exporter is not None:
+            if output_dir:
+                self._exporter.open(output_dir)
+            else:
+                log.warning('no ingestion directory, the dataset is not exported')
+                self._exporter.close()
+        self._sessions = tuple(None if session is None else _naive(pd.Timestamp(session))
+                               for session in (start_session, end_session))
+        self._adj_closes = {}
+        self._dropped = []
+        shard = (environ or {}).get(SHARD_ENV)
+        self._shard = parse_shard(shard) if shard else self._shard_spec
+
+    @contextlib.contextmanager
+    def _ingestion(self, start_session=None, end_session=None, environ=None, output_dir=None):
+        """starts an ingestion, see `_start_ingestion`, and closes the
+        dataset of the exporter, if any, even if the ingestion fails,
+        so that a failed ingestion does not leave its dataset open
+        """
+        self._start_ingestion(start_session, end_session, environ, output_dir)
+        try:
+            yield
+        finally:
+            if self._exporter is not None:
+                self._exporter.close()
+
+    def _assign_sids(self, symbols):
+        """assigns the sids of the symbol universe `symbols` and
+        returns those of the symbols ingested by the shard of the
+        ingestion
+
+        The sid of a symbol is its position in the sorted universe, so
+        that it is the same in every ingestion of the same universe,
+        whatever the order the symbols are found in, and every shard
+        assigns the same sids. The shard of a symbol is given by
+        `shard_of`. The metadata accumulator of the ingestion is
+        created for the whole universe.
+
+        :param symbols: the symbol universe
+        :type symbols: iterable of str
+        :return: the sid and the name of the ingested symbols, sorted by sid
+        :rtype: list of tuple of (int, str)
+        """
+        self._universe = sorted(symbols)
+        selected = list(enumerate(self._universe))
+        if self._shard is not None:
+            index, count = self._shard
+            selected = [(sid, symbol) for sid, symbol in selected if shard_of(symbol, count) == index]
+        self._metadata = metadata_accumulator(self._universe, self._exchange, [sid for sid, _ in selected])
+        return selected
+
+    def _date_range(self, after):
+        """returns the bounds of the bars to read, see `_date_range`
+        """
+        return _date_range(self._sessions, after)
+
+    def _validate(self, symbol, df):
+        """validates the new bars of `symbol` by `self._validator`, if there is one
+        """
+        if self._validator is None or df is None:
+            return df
+        with self._profiler.stage('validate', symbol) as counts:
+            counts['rows'] = len(df)
+            return self._validator.validate(df, symbol)
+
+    def _start_conversion(self, symbols, calendar, output_dir, show_progress):
+        """starts converting the bars of `symbols`, the sids and the
+        names returned by `self._assign_sids`: the adjustments are
+        reset, the previous ingestion is opened in incremental mode
+        and the filter of the ingestion is created
+        """
+        if show_progress:
+            log.info('symbols are: {0}'.format([symbol for _, symbol in symbols]))
+        self._splits, self._dividends = [], []
+        self._open_previous(output_dir, show_progress)
+        self._filter_fn = create_filter(self._filter_cb, calendar, self._every_min_bar)
+
+    def _filter_bars(self, symbol, df):
+        """applies the filter of the ingestion on the new bars of `symbol`, if there is one
+        """
+        if self._filter_fn is None or df is None:
+            return df
+        with self._profiler.stage('filter', symbol) as counts:
+            df = self._filter_fn(df)
+            counts['rows'] = 0 if df is None else len(df)
+        return df
+
+    def _convert(self, symbol_index, symbol, df, filtered=False):
+        """converts the new bars `df` of a symbol into the bars written to the bundle
+
+        This is the step shared by the `_read_and_convert` generators
+        of the ingesters. The new bars are filtered, validated and
+        merged with the previous ingestion, and the metadata and the
+        adjustments of the symbol are recorded.
+
+        :param symbol_index: the sid of the symbol
+        :param symbol: the symbol name
+        :param df: the new bars, which may be empty or `None`
+        :param filtered: `True` if the new bars were already filtered,
+        e.g. by the workers downloading them
+        :type symbol_index: int
+        :type symbol: str
+        :type df: pandas.DataFrame
+        :type filtered: bool
+        :return: the bars to write, or `None` if there is none
+        :rtype: pandas.DataFrame
+        """
+        if not filtered:
+            df = self._filter_bars(symbol, df)
+        df = self._validate(symbol, df)
+        self._record_adj_close(symbol, df)
+        df = self._merge_previous(symbol, df)
+        if df is None or df.empty:
+            return None
+        self._update_symbol_metadata(symbol_index, symbol, df)
+        self._collect_adjustments(symbol_index, df)
+        return df
+
+    def _write(self, bars, asset_db_writer, minute_bar_writer, daily_bar_writer, adjustment_writer, calendar,
+               show_progress):
+        """writes the bars yielded by `bars`, see `self._write_bars`, and
+        then the asset metadata and the adjustments recorded while they
+        were converted
+        """
+        if show_progress:
+            log.info('writing data...')
+        self._write_bars(bars, minute_bar_writer, daily_bar_writer, calendar, show_progress)
+        self._write_metadata(asset_db_writer, show_progress)
+        self._write_adjustments(adjustment_writer, show_progress)
+
+    def _write_bars(self, bars, minute_bar_writer, daily_bar_writer, calendar, show_progress):
+        """writes the bars yielded by `bars` by the bar writer of the ingester frequency
+
+        If `self._resample_daily` is `True`, the daily bars of every
+        symbol are aggregated over the sessions of the ingestion while
+        its minute bars are in memory, and they are written by
+        `daily_bar_writer` once all the minute bars are written.
+
+        The bars are exported by `self._exporter`, if any, as they
+        are passed to the writers.
+
+        :param bars: the generator of symbol index and the dataframe storing its price data
+        """
+        if not self._every_min_bar:
+            daily_bar_writer.write(self._profiler.timed_items(self._exported(bars, 'daily'), 'write'),
+                                   show_progress=show_progress)
+            return
+        if not self._resample_daily:
+            minute_bar_writer.write(self._profiler.timed_items(self._exported(bars, 'minute'), 'write'),
+                                    show_progress=show_progress)
+            return
+        daily = []
+        def resampled():
+            for sid, df in bars:
+                with self._profiler.stage('resample') as counts:
+                    bars_of_sessions = minutes_to_daily(df, calendar, *self._sessions)
+                    counts['rows'] = len(df)
+                if len(bars_of_sessions):
+                    daily.append((sid, bars_of_sessions))
+                yield sid, df
+        minute_bar_writer.write(self._profiler.timed_items(self._exported(resampled(), 'minute'), 'write'),
+                                show_progress=show_progress)
+        if show_progress:
+            log.info('writing daily bars of {} symbols'.format(len(daily)))
+        daily_bar_writer.write(self._profiler.timed_items(self._exported(daily, 'daily'), 'write_daily'),
+                               show_progress=show_progress)
+
+    def _exported(self, bars, frequency):
+        """yields the bars of `bars` after writing them to table `frequency` of the dataset, if it is exported
+        """
+        for sid, df in bars:
+            if self._exporter is not None and self._exporter.path is not None:
+                with self._profiler.stage('export', self._universe[sid]) as counts:
+                    self._exporter.write_bars(frequency, sid, self._universe[sid], df)
+                    counts['rows'] = len(df)
+            yield sid, df
+
+    def _finish_ingestion(self, show_progress, output_dir=None):
+        """reports the validation, stops the profiler and writes its
+        report if it has a path. The ingestion of a shard is marked as
+        such in `output_dir`, see `ingestion_shard`. The dataset of
+        the exporter, if any, is closed.
+        """
+        if self._exporter is not None:
+            self._exporter.close()
+        if self._adj_closes and output_dir:
+            with open(os.path.join(output_dir, ADJ_CLOSE_FILE), 'w') as f:
+                json.dump(self._adj_closes, f)
+        self._adj_closes = {}
+        if self._shard is not None and output_dir:
+            ingestion_shard.create(self._shard, self._universe, self._sessions).save(output_dir)
+            if show_progress:
+                log.info('shard {}/{} written, the shards are merged by merge_shards'.format(*self._shard))
+        self._universe = None
+        if self._validator is not None:
+            self._validator.log_summary()
+        self._profiler.finish()
+        path = self._profiler.path
+        if path:
+            self._profiler.save(path)
+            if show_progress:
+                stages = self._profiler.to_frame()
+                log.info('profile written to \'{}\':\n{}'.format(
+                    path, stages[stages.symbol == ''].drop(columns='symbol').to_string(index=False)))
+
+    def dropped_symbols(self):
+        """returns the symbols of the previous ingestion that the last
+        incremental ingestion dropped, since they were missing from
+        its universe, e.g. removed from the symbol list or whose csv
+        files were removed
+
+        :rtype: list of str
+        """
+        return list(self._dropped)
+
+    def _last_bar(self, symbol):
+        """returns the timestamp of the last bar of `symbol` in the previous ingestion, or `None`
+        """
+        return None if self._previous is None else self._previous.last_bar(symbol)
+
+    def _update_symbol_metadata(self, symbol_index, symbol, df):
+        """update metadata for the given symbol
+
+        Metadata are extracted from the given dataframe `df`, which is
+        the price data read from csv file or downloaded via the firm
+        API. They are stored in `self._metadata` at `symbol_index`.
+
+        :param symbol_index: the symbol index
+        :param symbol: the symbol name
+        :param df: the dataframe storing symbol's price data
+
+        :type symbol_index: int
+        :type symbol: str
+        :type df: pandas.DataFrame
+        """
+        with self._profiler.stage('metadata', symbol):
+            self._metadata.update(symbol_index, df.index[0], df.index[-1])
+
+    def _write_metadata(self, asset_db_writer, show_progress):
+        """writes the accumulated metadata by a single call to `asset_db_writer`
+
+        Symbols that produced no data are reported and left out.
+        """
+        missing = self._metadata.missing()
+        if missing:
+            log.warning('no price data for symbols: {}'.format(', '.join(missing)))
+        equities = self._metadata.to_frame()
+        if show_progress:
+            log.info('meta data:\n{0}'.format(equities))
+        with self._profiler.stage('asset_db') as counts:
+            asset_db_writer.write(equities=equities)
+            counts['rows'] = len(equities)
+        if self._exporter is not None and self._exporter.path is not None:
+            self._exporter.write_table('equities', equities.rename_axis('sid'))
+
+    @staticmethod
+    def _filter(df):
+        """applies filter on price dataframe read by ingestor
+
+        This method is called within `self._read_and_convert`, after
+        the column mapping is done. It checks if the dataframe has
+        `split` and `dividend` column, if not it creates them and
+        assigns their default value.
+
+        :param df: the price dataframe to be filtered
+        :type df: pandas.DataFrame
+
+        """
+        if 'dividend' not in df.columns:
+            df['dividend'] = 0;
+        if 'split' not in df.columns:
+            df['split'] = 1
+
+    def _collect_adjustments(self, symbol_index, df):
+        """collects the split and dividend events of a symbol while its bars are streamed to the writer
+        """
+        with self._profiler.stage('adjustments'):
+            splits, dividends = extract_adjustments(symbol_index, df)
+        if splits is not None:
+            self._splits.append(splits)
+        if dividends is not None:
+            self._dividends.append(dividends)
+
+    def _write_adjustments(self, adjustment_writer, show_progress):
+        """writes all the collected events by a single call to `adjustment_writer`
+        """
+        splits = pd.concat(self._splits, ignore_index=True) if self._splits else None
+        dividends = pd.concat(self._dividends, ignore_index=True) if self._dividends else None
+        if show_progress:
+            log.info('writing {} splits and {} dividends'.format(
+                0 if splits is None else len(splits), 0 if dividends is None else len(dividends)))
+        with self._profiler.stage('adjustment_db'):
+            adjustment_writer.write(splits=splits, dividends=dividends)
+        if self._exporter is not None and self._exporter.path is not None:
+            self._exporter.write_table('splits', splits)
+            self._exporter.write_table('dividends', dividends)
+        self._splits, self._dividends = [], []
+
+    def _previous_adj_close(self, symbol, after):
+        """returns the raw and the adjusted close of the last bar of
+        `symbol` in the previous ingestion, if new bars are read after
+        it, see `adj_close2dividends`
+        """
+        if self._adj_close_column is None or self._previous is None or after is None:
+            return None
+        last = self._previous.last_adj_close(symbol)
+        if last is None or _naive(last[0]) > _naive(after):
+            return None
+        return last[1:]
+
+    def _record_adj_close(self, symbol, df):
+        """keeps the raw and the adjusted close of the last bar of
+        `symbol`, or those of the previous ingestion if there is no
+        new bar, so that the next incremental ingestion derives the
+        dividend of its first bar, see `ADJ_CLOSE_FILE`
+        """
+        if self._adj_close_column is None:
+            return
+        if df is not None and self._adj_close_column in df.columns:
+            valid = df[df['close'].notna() & df[self._adj_close_column].notna()]
+            if not valid.empty:
+                self._adj_closes[symbol] = [str(valid.index[-1]), float(valid['close'].iloc[-1]),
+                                            float(valid[self._adj_close_column].iloc[-1])]
+                return
+        last = None if self._previous is None else self._previous.last_adj_close(symbol)
+        if last is not None:
+            self._adj_closes[symbol] = [str(last[0]), last[1], last[2]]
+
+    def _merge_previous(self, symbol, df):
+        """prepends the bars of `symbol` from the previous ingestion to the new bars `df`
+
+        Bars of the previous ingestion overlapping with `df` are
+        replaced by those of `df`.
+
+        :param symbol: the symbol name
+        :param df: the new bars, which may be empty or `None`
+        :type symbol: str
+        :type df: pandas.DataFrame
+        :return: the merged bars
+        :rtype: pandas.DataFrame
+        """
+        if self._previous is None:
+            return df
+        with self._profiler.stage('merge', symbol) as counts:
+            prior = self._previous.bars(symbol)
+            if prior is None:
+                return df
+            counts['rows'] = len(prior)
+            if df is None or df.empty:
+                return prior
+            if prior.index.tz is not None and df.index.tz is None:
+                prior.index = prior.index.tz_convert(None)
+            merged = pd.concat([prior[prior.index < df.index[0]], df])
+            for column, default in (('dividend', 0), ('split', 1)):
+                if column in merged.columns:
+                    merged[column] = merged[column].fillna(default)
+            return merged
 
     def __call__(self,
                  environ,
@@ -65,10 +973,224 @@ class ingester_base:
         """
         raise NotImplementedError
 
+def _bytes_to_read(f, entry, status):
+    """returns the number of bytes of csv file `f` read by an ingestion, given its status in the manifest
+    """
+    if status == 'unchanged':
+        return 0
+    if status == 'appended':
+        return f.size - entry['size']
+    return f.size or 0
+
+class csv_parser:
+    """parses the csv files of a symbol and filters its bars
+
+    This is the unit of work run by the workers of `csv_ingester`. It
+    holds only the arguments of parsing and the filter of the
+    ingestion, and no state shared between symbols, so that it is
+    cheap to send to a worker process. A process pool receives it
+    once per worker, see `_start_csv_worker`.
+    """
+    def __init__(self, index_column, column_mapper=None, engine=None, usecols=None, dtype=None, date_format=None,
+                 symbol_column=None, adj_close_column=None, sessions=(None, None), incremental=False,
+                 filter_fn=None):
+        """creates a csv parser, see `csv_ingester` for the parameters
+
+        :param sessions: the start and the end session of the
+        ingestion, which bound the rows read, see `_date_range`
+        :param filter_fn: the filter of the ingestion, see
+        `create_filter`. It must be picklable to run in a process pool.
+        :type sessions: tuple of (pandas.Timestamp, pandas.Timestamp)
+        :type filter_fn: callable
+        """
+        self._index_column=index_column
+        self._column_mapper=column_mapper
+        self._options=dict(engine=engine, usecols=usecols, dtype=dtype, date_format=date_format)
+        self._symbol_column=symbol_column
+        self._adj_close_column=adj_close_column
+        self._sessions=sessions
+        self._incremental=incremental
+        self._filter_fn=filter_fn
+
+    @staticmethod
+    def _read_spilled(file_path, lower, upper):
+        """reads the rows of a symbol from its spill file, keeping those within bounds `lower` and `upper`
+        """
+        frames = []
+        with open(file_path, 'rb') as f:
+            while True:
+                try:
+                    frames.append(pickle.load(f))
+                except EOFError:
+                    break
+        df = pd.concat(frames) if len(frames) > 1 else frames[0]
+        return _rows_within(df, lower, upper)
+
+    def _read_source(self, source, after):
+        """reads a csv file or an archive member, keeping the rows within `_date_range(self._sessions, after)`
+
+        The rows of plain csv files are selected before they are
+        parsed, see `read_csv_range`. Compressed files and archive
+        members cannot be searched, so they are parsed entirely.
+        """
+        lower, upper = _date_range(self._sessions, after)
+        if lower is None and upper is None:
+            return read_csv(source, self._index_column, **self._options)
+        if isinstance(source, str) and _csv_suffix(source) == '.csv':
+            return read_csv_range(source, self._index_column, lower, upper, reader=read_csv, **self._options)
+        return _rows_within(read_csv(source, self._index_column, **self._options), lower, upper)
+
+    def _read_appended(self, f, entry):
+        """reads the rows appended to csv file `f` since it was indexed by `entry`
+
+        :return: the appended rows, or `None` if the file was not only
+        appended to, in which case it has to be read again
+        :rtype: pandas.DataFrame
+        """
+        if not csv_manifest.is_appended(f, entry):
+            return None
+        df = read_csv_from(f.source, self._index_column, entry['size'], reader=read_csv, **self._options)
+        if len(_rows_after(df, pd.Timestamp(entry['last']))) != len(df):
+            return None
+        return _rows_within(df, None, _date_range(self._sessions, None)[1])
+
+    def _read_files(self, files, after):
+        """reads the price data of a symbol from its csv files
+
+        Files left unchanged since the previous ingestion are not
+        read, and only the appended rows are read from the files that
+        grew. If any file of the symbol changed otherwise, all of them
+        are read again. Without a manifest, the rows within
+        `_date_range(self._sessions, after)` are read from every file.
+
+        :param files: the csv files of the symbol with their manifest
+        entry and status, see `csv_manifest.status`. Both are `None`
+        without a manifest.
+        :param after: the last bar of the symbol in the previous ingestion
+        :type files: list of tuple of (csv_file, dict, str)
+        :type after: pandas.Timestamp
+        :return: the concatenated rows, or `None` if none is read, and
+        whether they are only the rows after `after`, i.e. appended to
+        the bars of the previous ingestion
+        :rtype: tuple of (pandas.DataFrame, bool)
+        """
+        statuses = {status for _, _, status in files}
+        if statuses and statuses <= {'unchanged', 'appended'}:
+            frames = []
+            for f, entry, status in files:
+                if status == 'appended':
+                    df = self._read_appended(f, entry)
+                    if df is None:
+                        break
+                    frames.append(df)
+            else:
+                return (pd.concat(frames) if frames else None), True
+        if statuses - {None}:
+            # the manifest no longer matches, so the whole history is read
+            after = None
+        frames = [self._read_source(f.source, after) for f, _, _ in files
+                  if not isinstance(f.source, str) or os.path.exists(f.source)]
+        frames = [df for df in frames if not df.empty]
+        if not frames:
+            return None, after is not None
+        if len(frames) == 1:
+            return frames[0], after is not None
+        # the rows of the later partitions take precedence
+        df = pd.concat(frames).sort_index(kind='stable')
+        return df[~df.index.duplicated(keep='last')], after is not None
+
+    def load(self, job):
+        """reads the price data of a single symbol from its csv files
+
+        It parses the files, renames the columns and applies
+        `ingester_base._filter`, but not the filter of the ingestion.
+
+        :param job: the symbol index, the symbol name, its csv files
+        as described in `self._read_files`, or the path to a single
+        csv file or archive member, or its spill file for long format
+        files, and the timestamp after which rows are read. The whole
+        files, from the start session, are read when the timestamp is
+        `None`. It may end with the raw and the adjusted close of the
+        bar before the rows read, see `adj_close2dividends`, which is
+        ignored if the whole history is read again.
+        :type job: tuple of (int, str, list or str or archive_member, pandas.Timestamp[, tuple])
+
+        :return: the symbol index, the symbol name and its price
+        dataframe, which is `None` if no row is read
+        :rtype: tuple of (int, str, pandas.DataFrame)
+        """
+        symbol_index, symbol, file_path, after = job[:4]
+        previous = job[4] if len(job) > 4 else None
+        if self._symbol_column is not None:
+            df_data = self._read_spilled(file_path, *_date_range(self._sessions, after))
+        else:
+            if not isinstance(file_path, list):
+                file_path = [(csv_file(None, file_path, None, None), None, None)]
+            df_data, appended = self._read_files(file_path, after)
+            if not appended:
+                # the bar before the rows read is not the last bar of the previous ingestion
+                previous = None
+            if df_data is None:
+                return symbol_index, symbol, None
+        df_data = df_data.sort_index()
+        # rename columns if necessary
+        if self._column_mapper:
+            df_data.columns = [self._column_mapper.get(column, column) for column in df_data.columns]
+        ingester_base._filter(df_data)
+        if self._adj_close_column:
+            df_data['dividend'] += adj_close2dividends(df_data, self._adj_close_column, previous=previous)
+        return symbol_index, symbol, df_data
+
+    def __call__(self, job):
+        """reads the price data of a symbol by `self.load` and applies the filter of the ingestion
+
+        In incremental mode, the plain csv files of the symbol that
+        are indexed anew are hashed too.
+
+        :param job: the job of `self.load`
+        :return: the result of `self.load`, the hash of every hashed
+        file keyed by its relative path, the wall and the cpu time of
+        reading followed by the number of rows read, and those of
+        filtering, which are `None` if no filter ran
+        :rtype: tuple of (int, str, pandas.DataFrame, dict, tuple, tuple)
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        hashes = {}
+        if self._incremental and isinstance(job[2], list):
+            hashes = {f.key: csv_manifest.content_hash(f.source, f.size) for f, _, status in job[2]
+                      if status != 'unchanged' and isinstance(f.source, str) and _csv_suffix(f.source) == '.csv'}
+        symbol_index, symbol, df_data = self.load(job)
+        read = (time.perf_counter() - wall, time.thread_time() - cpu, 0 if df_data is None else len(df_data))
+        filtered = None
+        if self._filter_fn is not None and df_data is not None:
+            wall, cpu = time.perf_counter(), time.thread_time()
+            df_data = self._filter_fn(df_data)
+            filtered = (time.perf_counter() - wall, time.thread_time() - cpu, 0 if df_data is None else len(df_data))
+        return symbol_index, symbol, df_data, hashes, read, filtered
+
+# the parser of a worker process of `csv_ingester`, see `_start_csv_worker`
+_worker_parser = None
+
+def _start_csv_worker(parser):
+    """installs `parser` in a worker process, so that it is sent once per worker rather than with every job
+    """
+    global _worker_parser
+    _worker_parser = parser
+
+def _parse_csv_job(job):
+    """parses `job` by the parser installed in the worker process, see `csv_parser`
+    """
+    return _worker_parser(job)
+
+
 class csv_ingester(ingester_base):
     """inegester from csv files
     """
-    def __init__(self, exchange, every_min_bar, csvdir, csvdir_env, index_column='date', column_mapper=None):
+    def __init__(self, exchange, every_min_bar, csvdir, csvdir_env, index_column='date', column_mapper=None,
+                 max_workers=None, executor='thread', incremental=False, filter_cb=None,
+                 adj_close_column=None, engine=None, dtype=None, usecols=None, date_format=None,
+                 symbol_column=None, chunk_size=1000000, spill_dir=None, recursive=False, profiler=None,
+                 validator=None, resample_daily=False, shard=None, exporter=None):
         """creates an instance of csv ingester
 
         :param exchange: an arbitrary name for the exchange providing
@@ -81,7 +1203,10 @@ class csv_ingester(ingester_base):
 
         :param csvdir: The path to the directory containing csv
         files. For each symbol there must be a single file of name
-        '<symbolname>.csv'
+        '<symbolname>.csv'. The files may also be compressed, e.g.
+        '<symbolname>.csv.gz', or stored in zip and tar archives in
+        the directory, see `find_csv_files`. Subdirectories are
+        searched if `recursive` is `True`.
 
         :param csvdir_env: The envireonment variable used to locate
         the csv directory containing the csv files. After setting this
@@ -103,19 +1228,191 @@ class csv_ingester(ingester_base):
         'date' in all symbol dataframes read by the ingester. The
         default value is `None`, which means no renaming will happen.
 
+        :param max_workers: the number of workers parsing csv files
+        concurrently. The default value is `None`, which means files
+        are parsed one by one in the main thread.
+
+        :param executor: the kind of worker pool used when
+        `max_workers` is greater than one, either 'thread' or
+        'process'. Since parsing is mostly CPU bound, 'process' scales
+        better with the number of cores, while 'thread' avoids copying
+        dataframes between processes. The files are parsed and
+        filtered by the workers, see `csv_parser`.
+
+        :param incremental: if `True`, only the rows later than the
+        last bar of the previous ingestion are parsed, which requires
+        the csv files to be sorted by date and only appended to. The
+        parsed rows are merged with the bars of the previous
+        ingestion. The csv files read are recorded in the manifest of
+        the ingestion, see `csv_manifest`, so that the next ingestion
+        skips the files left unchanged and reads only the rows
+        appended to the others.
+
+        :param filter_cb: The callback that is called on every price
+        dataframe after `self._filter`. It takes a data frame and
+        returns the filtered dataframe. It can also be the name of a
+        filter in `FILTERS`, e.g. 'sessions' to drop the bars off the
+        sessions of the bundle calendar. It runs in the workers, so a
+        callback must be picklable when `executor` is 'process'.
+
+        :param adj_close_column: the label, after column mapping, of
+        the column holding the close price adjusted for splits and
+        dividends, e.g. 'price' for yahoo csv files. When it is given,
+        the changes of the adjustment factor between consecutive bars
+        are written as dividends, so that zipline adjusts the history
+        the same way.
+
+        :param engine: the csv parser, one of `CSV_ENGINES`. 'pyarrow'
+        is the fastest one, but it requires pyarrow to be
+        installed. The default value `None` means the default parser
+        of pandas.
+
+        :param dtype: the type of price columns, keyed by their labels
+        after column mapping. It updates `CSV_DTYPES`, e.g.
+        `dtype={'volume': 'float64'}` reads fractional volumes and
+        `dtype={'open': 'float32', ...}` halves the memory of prices.
+        Integer columns are parsed as float64 and cast after the
+        filter and the validator, see `self._cast_int_columns`.
+
+        :param usecols: the labels, after column mapping, of the
+        columns read beside the index column, e.g. `list(CSV_DTYPES)`
+        reads only the columns stored by zipline. The column given by
+        `adj_close_column` is always read. All columns are read if it
+        is `None`.
+
+        :param date_format: the format of the index column,
+        e.g. '%Y-%m-%d'. Parsing is faster with an explicit format
+        than with an inferred one.
+
+        :param symbol_column: the label of the column holding symbol
+        names in long format files. When it is given, every csv file
+        in the csv directory, e.g. a single vendor dump or one file
+        per day, may contain the bars of many symbols. The files are
+        streamed in chunks and the rows of each chunk are spilled by
+        symbol into temporary files, which are read back one symbol
+        at a time. Memory is therefore bounded by a chunk and the bars
+        of a single symbol, whatever the size and the order of the
+        files.
+
+        :param chunk_size: the number of rows of long format files
+        read at once
+
+        :param spill_dir: the directory where the temporary files of
+        long format ingestion are created. Its default value `None`
+        means the default temporary directory of the system. They
+        take about as much space as the ingested bars.
+
+        :param recursive: if `True`, the csv files are searched in the
+        subdirectories of the csv directory too, e.g. in
+        'NYSE/AAPL.csv' or in partitions like 'year=2024/AAPL.csv'. The
+        files of a symbol in several partitions are concatenated, and
+        the rows of the later ones in path order take precedence over
+        those with the same timestamp.
+
+        :param profiler: the profiler recording the stages of every
+        ingestion, see `ingest_profiler`. Besides the stages of
+        `ingester_base`, it records 'scan', 'spill' for long format
+        files, 'read' and 'filter'.
+
+        :param validator: the validator of the new bars of every
+        symbol, see `bar_validator`. It runs after `filter_cb`.
+
+        :param resample_daily: if `True`, the minute bars are also
+        written as daily bars aggregated over the sessions of the
+        bundle calendar, so that a single minute bundle serves both
+        frequencies, see `ingester_base`.
+
+        :param shard: the shard of the symbols ingested, see
+        `ingester_base`. Every shard lists the whole csv directory to
+        assign the sids, but reads only the files of its symbols.
+
+        :param exporter: the exporter of every ingestion to a parquet
+        dataset, see `ingester_base`
+
         :type exchange: str
         :type every_min_bar: bool
         :type csvdir: str
         :type csvdir_env: str
         :type index_column: str
         :type column_mapper: dict mapping str to str
-
+        :type max_workers: int
+        :type executor: str
+        :type incremental: bool
+        :type filter_cb: a callable that takes a data frame and return a data frame, or str
+        :type adj_close_column: str
+        :type engine: str
+        :type dtype: dict mapping str to str or numpy.dtype
+        :type usecols: iterable of str
+        :type date_format: str
+        :type symbol_column: str
+        :type chunk_size: int
+        :type spill_dir: str
+        :type recursive: bool
+        :type profiler: ingest_profiler
+        :type validator: bar_validator
+        :type resample_daily: bool
+        :type shard: tuple of (int, int) or str
+        :type exporter: dataset_exporter
+
+        :raise: ValueError when `engine` is unknown, `resample_daily`
+        is given for daily bars, or `shard` is malformed
         """
-        super().__init__(exchange, every_min_bar)
+        if engine is not None and engine not in CSV_ENGINES:
+            raise ValueError("unknown csv engine '{}', it must be one of {}".format(engine, CSV_ENGINES))
+        super().__init__(exchange, every_min_bar, incremental, profiler, validator, resample_daily, shard, exporter)
         self._csvdir = csvdir
         self._csvdir_env = csvdir_env
         self._index_column=index_column
         self._column_mapper=column_mapper
+        self._max_workers=max_workers
+        self._executor=executor
+        self._filter_cb=filter_cb
+        self._filter_fn=None
+        self._adj_close_column=adj_close_column
+        self._engine=engine
+        self._date_format=date_format
+        # the csv labels of columns, i.e. before column mapping
+        labels={column: label for label, column in (column_mapper or {}).items()}
+        dtypes={**CSV_DTYPES, **(dtype or {})}
+        self._dtype={labels.get(column, column): 'float64' if np.dtype(t).kind in 'iu' else t
+                     for column, t in dtypes.items()}
+        self._int_dtype={column: t for column, t in dtypes.items() if np.dtype(t).kind in 'iu'}
+        self._usecols=None
+        if usecols is not None:
+            self._usecols=[labels.get(column, column) for column in
+                           list(usecols) + ([adj_close_column] if adj_close_column else [])]
+        self._symbol_column=symbol_column
+        self._chunk_size=chunk_size
+        self._spill_dir=spill_dir
+        self._recursive=recursive
+        self._files=None
+        self._manifest=None
+        self._index=None
+        if symbol_column is not None:
+            self._dtype[symbol_column]='str'
+            if self._usecols is not None:
+                self._usecols.append(symbol_column)
+
+    def _validate(self, symbol, df):
+        """validates the new bars of `symbol`, see `ingester_base`, and
+        casts their integer columns, see `self._cast_int_columns`
+        """
+        return self._cast_int_columns(super()._validate(symbol, df))
+
+    def _cast_int_columns(self, df):
+        """casts the columns declared as integers, e.g. volume, to their type
+
+        They are parsed as float64, so that a missing volume does not
+        fail parsing and can be handled by the filter and the
+        validator. The missing and the negative values left are cast
+        to 0, which is what zipline writes for them anyway.
+        """
+        if df is None:
+            return df
+        for column, t in self._int_dtype.items():
+            if column in df.columns and df[column].dtype != t:
+                df[column] = df[column].fillna(0).clip(lower=0).astype(t)
+        return df
 
     @staticmethod
     def get_csvdir(csvdir, csvdir_env, show_progress=False):
@@ -164,73 +1461,138 @@ class csv_ingester(ingester_base):
             sys.exit(1)
 
 
+    def _find_files(self, show_progress=False):
+        """returns the csv files of every symbol, see `find_csv_files`
+
+        The csv directory is walked once per ingestion, which matters
+        when listing it is slow, e.g. on network file systems.
+        """
+        if self._files is None:
+            with self._profiler.stage('scan') as counts:
+                self._files = find_csv_files(self._get_csvdir(show_progress), self._recursive)
+                counts['rows'] = sum(len(files) for files in self._files.values())
+        return self._files
+
     def _extract_symbols(self):
         """returns the list of (symbol, csv_file_path) pair from the csv directory path
 
         This function extracts the list symbols from csv files located
         in `self._get_csvdir`. The assumption is that the price data
         of each asset is stored in `symbol_name.csv` within the csv
-        directory.
+        directory, or in its compressed or archived version found by
+        `find_csv_files`.
 
         :return: the list of symbols
         :rtype: list of str
         """
-        return [csv_file_path.split('.csv')[0] # symbol name
-                for csv_file_path in os.listdir(self._get_csvdir()) if csv_file_path.endswith('.csv')]
-
-    def _update_symbol_metadata(self, symbol_index, symbol, df):
-        """update metadata for the given symbol
-
-        Metadata are extracted from the given dataframe `df`, which is
-        the price data read from csv file or downloaded via the firm
-        API. They are stored in `self._df_metadata[symbol_index]`
-
-        :param symbol_index: the symbol index
-        :param symbol: the symbol name
-        :param df: the dataframe storing symbol's price data
-
-        :type symbol_index: int
-        :type symbol: str
-        :type df: pandas.DataFrame
+        return list(self._find_files())
+
+    def _spill_long_format(self, spill_path, show_progress):
+        """splits the rows of long format csv files by symbol into temporary files
+
+        The csv files found by `find_csv_files` are read in the order
+        of their relative path and chunk by chunk. The rows of each
+        chunk are grouped by `self._symbol_column`, and every group is
+        appended as a pickled dataframe to the spill file of its
+        symbol in `spill_path`. The rows of the symbols outside the
+        shard of the ingestion are not spilled.
+
+        :param spill_path: the directory of spill files
+        :type spill_path: str
+        :return: the spill file of every symbol, keyed by symbol name,
+        which is `None` for the symbols outside the shard
+        :rtype: dict mapping str to str
         """
-        start_date = df.index[0]
-        end_date = df.index[-1]
-        autoclose_date = end_date + pd.Timedelta(days=1)
-        self._df_metadata.iloc[symbol_index] = start_date, end_date, autoclose_date, symbol, self._exchange
-
-    def _read_and_convert(self, symbols, show_progress):
-        """returns the generator of symbol index and the dataframe storing its price data
+        files = sorted(f for fs in self._find_files(show_progress).values() for f in fs)
+        options = dict(engine=self._engine, usecols=self._usecols, dtype=self._dtype, date_format=self._date_format)
+        spilled = {}
+        with maybe_show_progress(files, show_progress,
+                                 label='Splitting csv files by symbol: ') as it:
+            for f in it:
+                with self._profiler.stage('spill') as counts:
+                    for chunk in read_csv(f.source, self._index_column, chunk_size=self._chunk_size, **options):
+                        symbols = chunk.pop(self._symbol_column)
+                        for symbol, rows in chunk.groupby(symbols, sort=False):
+                            if self._shard is not None and shard_of(symbol, self._shard[1]) != self._shard[0]:
+                                spilled.setdefault(symbol, None)
+                                continue
+                            spill_file = spilled.setdefault(symbol,
+                                                            os.path.join(spill_path, '{}.pkl'.format(len(spilled))))
+                            with open(spill_file, 'ab') as spill:
+                                pickle.dump(rows, spill, pickle.HIGHEST_PROTOCOL)
+                        counts['rows'] += len(chunk)
+                    counts['bytes'] = f.size
+        return spilled
+
+    def _parser(self):
+        """returns the parser of the csv files of the ingestion, see `csv_parser`
         """
-        path = self._get_csvdir(show_progress)
-        with maybe_show_progress(symbols, show_progress, label='Loading csv files: ') as it:
-            for symbol_index, symbol in enumerate(it):
-                file_path = '{0}/{1}.csv'.format(path, symbol)
-                if os.path.exists(file_path):
-                    # read data from csv file and set the index
-                    df_data = pd.read_csv(file_path, index_col=self._index_column, parse_dates=True, dtype={"Volumn": np.uint64}).sort_index()
-                    # rename columns if necessary
-                    if self._column_mapper:
-                        df_data.rename(columns=self._column_mapper, inplace=True)
-                    self._filter(df_data)
-                    self._update_symbol_metadata(symbol_index, symbol, df_data)
-                    yield symbol_index, df_data
-
-    def _filter(self, df):
-        """applies filter on price dataframe read by ingestor
+        return csv_parser(self._index_column, self._column_mapper, self._engine, self._usecols, self._dtype,
+                          self._date_format, self._symbol_column, self._adj_close_column, self._sessions,
+                          self._incremental, self._filter_fn)
 
-        This method is called within `self._read_and_convert`, after
-        the column mapping is done. It checks if the dataframe has
-        `split` and `dividend` column, if not it creates them and
-        assigns their default value.
+    def _load_csv(self, job):
+        """reads the price data of a single symbol from its csv files in the calling thread, see `csv_parser.load`
+        """
+        return self._parser().load(job)
 
-        :param df: the price dataframe to be filtered
-        :type df: pandas.DataFrame
+    def _read_and_convert(self, symbols, show_progress, spilled=None):
+        """returns the generator of symbol index and the dataframe storing its price data
 
+        :param symbols: the sid and the name of the symbols to read,
+        see `self._assign_sids`
+        :type symbols: list of tuple of (int, str)
+
+        Csv files are parsed and filtered by `csv_parser` in a pool of
+        `self._max_workers` workers, while the dataframes are yielded
+        in the symbol order. A process pool receives the parser once
+        per worker and only the jobs afterwards. The number of parsed
+        dataframes waiting for the bar writer is bounded by
+        `ordered_map`. In incremental
+        mode, the new rows are merged with the previous ingestion, the
+        files are planned against the manifest of the previous
+        ingestion, see `csv_parser._read_files`, and they are recorded in
+        `self._index`. Compressed files and archive members are
+        decompressed by the workers too, so that decompressing a file
+        overlaps with parsing the others. For long format files, the
+        symbols are read from their spill files given by `spilled`.
         """
-        if 'dividend' not in df.columns:
-            df['dividend'] = 0;
-        if 'split' not in df.columns:
-            df['split'] = 1
+        if spilled is None:
+            sources = self._find_files(show_progress)
+            manifest = self._manifest
+            file_paths = {sid: [(f, None, None) if manifest is None else (f, manifest.entries.get(f.key),
+                                                                          manifest.status(f))
+                                for f in sources.get(symbol, [])] for sid, symbol in symbols}
+        else:
+            file_paths = {sid: spilled[symbol] for sid, symbol in symbols}
+        def jobs():
+            for symbol_index, symbol in symbols:
+                after = self._last_bar(symbol)
+                yield symbol_index, symbol, file_paths[symbol_index], after, self._previous_adj_close(symbol, after)
+        parser = self._parser()
+        if self._executor == 'process' and self._max_workers and self._max_workers > 1:
+            loaded = ordered_map(_parse_csv_job, jobs(), self._max_workers, self._executor,
+                                 initializer=_start_csv_worker, initargs=(parser,))
+        else:
+            loaded = ordered_map(parser, jobs(), self._max_workers, self._executor)
+        with maybe_show_progress(loaded, show_progress, label='Loading csv files: ', length=len(symbols)) as it:
+            for symbol_index, symbol, df_data, hashes, read, filtered in it:
+                files = file_paths[symbol_index] if spilled is None else []
+                if filtered is not None:
+                    self._profiler.record('filter', symbol, *filtered)
+                self._profiler.record('read', symbol, *read,
+                                      sum(_bytes_to_read(f, entry, status) for f, entry, status in files))
+                unchanged = files and all(status == 'unchanged' for _, _, status in files)
+                if df_data is None and not unchanged:
+                    continue
+                # the workers filtered the bars while parsing them
+                df_data = self._convert(symbol_index, symbol, df_data, filtered=True)
+                if df_data is None:
+                    continue
+                if self._index is not None:
+                    for f, entry, _ in files:
+                        self._index.index(f, df_data.index[-1], hashes.get(f.key, entry and entry.get('hash')))
+                yield symbol_index, df_data
 
     def __call__(self,
                  environ,
@@ -247,24 +1609,38 @@ class csv_ingester(ingester_base):
         """implements the actual ingest function
 
         The order of calls are as follows
-        1. `self._extract_symbols()`
-        2. `create_metadata()`
-        3. `self._read_and_convert()`
+        1. `self._extract_symbols()`, or `self._spill_long_format()`
+        for long format files
+        2. `self._assign_sids()`
+        3. `self._start_conversion()`, which opens the previous
+           ingestion and creates the filter
+        4. `self._write()` of the bars of `self._read_and_convert()`
+        5. `csv_manifest.save()` in incremental mode
+        6. `ingestion_shard.save()` if the ingestion is sharded
         """
-        symbols = self._extract_symbols()
-        if show_progress:
-            log.info('symbols are: {0}'.format(symbols))
-        self._df_metadata=create_metadata(len(symbols))
-        if show_progress:
-            log.info('writing data...')
-        if self._every_min_bar:
-            minute_bar_writer.write(self._read_and_convert(symbols, show_progress), show_progress=show_progress)
-        else:
-            daily_bar_writer.write(self._read_and_convert(symbols, show_progress), show_progress=show_progress)
-        if show_progress:
-            log.info('meta data:\n{0}'.format(self._df_metadata))
-        asset_db_writer.write(equities=self._df_metadata)
-        adjustment_writer.write()
+        with self._ingestion(start_session, end_session, environ, output_dir):
+            long_format = self._symbol_column is not None
+            self._files = None
+            with (tempfile.TemporaryDirectory(prefix='long-format-', dir=self._spill_dir) if long_format
+                  else contextlib.nullcontext()) as spill_path:
+                spilled = self._spill_long_format(spill_path, show_progress) if long_format else None
+                symbols = self._assign_sids(spilled if long_format else self._extract_symbols())
+                self._start_conversion(symbols, calendar, output_dir, show_progress)
+                # the manifest is not used for long format files, whose symbols span several files
+                self._manifest = None
+                end = self._date_range(None)[1]
+                end = None if end is None else end[0]
+                if self._previous is not None and not long_format:
+                    self._manifest = csv_manifest.load(self._previous.path)
+                    if self._manifest is not None and not self._manifest.covers(end):
+                        self._manifest = None
+                self._index = csv_manifest(end=end) if self._incremental and not long_format else None
+                self._write(self._read_and_convert(symbols, show_progress, spilled), asset_db_writer,
+                            minute_bar_writer, daily_bar_writer, adjustment_writer, calendar, show_progress)
+            if self._index is not None and output_dir:
+                self._index.save(output_dir)
+            self._files = None
+            self._finish_ingestion(show_progress, output_dir)
         if show_progress:
             log.info('writing completed')
 
@@ -278,7 +1654,10 @@ class direct_ingester(ingester_base):
     to the format accepted by zipline.
 
     """
-    def __init__(self, exchange, every_min_bar, symbol_list_env, downloader, symbol_list=None, filter_cb=None):
+    def __init__(self, exchange, every_min_bar, symbol_list_env, downloader, symbol_list=None, filter_cb=None,
+                 max_workers=None, rate_limit=None, rate_limit_burst=None, retries=0, backoff=1.,
+                 incremental=False, profiler=None, validator=None, resample_daily=False, shard=None,
+                 exporter=None, retry_on=RETRYABLE_EXCEPTIONS):
         """creates an instance of csv ingester
 
         :param exchange: an arbitrary name for the exchange providing
@@ -303,23 +1682,112 @@ class direct_ingester(ingester_base):
 
         :param downloader: a callable that downloads price data. It takes the following arguments:
            - symbol: an string referring to the symbol name
+           - start_date: an optional keyword argument, passed only in
+             incremental mode, that overrides the first date to download
+        If the downloader has a `bind_sessions` method, e.g. those
+        returned by `get_downloader` of the yahoo, iex and binance
+        modules, it is called with the start and the end session of
+        every ingestion, and returns the downloader used by the
+        ingestion, which requests only the bars of these sessions.
+        If the downloader used has `open` and `close` methods, `open`
+        is called before the first download and `close` after the
+        last one, so that the HTTP sessions and clients of the
+        downloader are shared by all symbols of an ingestion. If it
+        has a `batch_size` attribute greater than one, it is a batch
+        downloader: it is given a list of up to `batch_size` symbols
+        instead of a single symbol, and it returns a dictionary
+        mapping each symbol to its dataframe. Symbols left out of the
+        dictionary produced no data.
 
         :param filter_cb: The callback that is called after the
         downloader is invoked. It takes a data frame and returns the
-        filtered dataframe
+        filtered dataframe. It can also be the name of a filter in
+        `FILTERS`, e.g. 'sessions' to drop the bars off the sessions
+        of the bundle calendar.
+
+        :param max_workers: the maximum number of concurrent downloads
+        of this bundle. The default value is `None`, which means
+        symbols are downloaded one by one.
+
+        :param rate_limit: the maximum number of downloader calls per
+        second, shared by all workers, or a `token_bucket` taken one
+        token per call, e.g. to share a limit between ingesters. The
+        default value is `None`, which means no rate limit.
+
+        :param rate_limit_burst: the number of calls that can be made
+        at once before `rate_limit` applies. Its default value is
+        `rate_limit`.
+
+        :param retries: the number of times a failing download is
+        retried before the ingestion fails
+
+        :param retry_on: the exception types of the failures that are
+        retried, see `call_with_retries`. Other exceptions fail the
+        ingestion at once.
+
+        :param backoff: the waiting time before the first retry in
+        seconds, it is doubled after each retry
+
+        :param incremental: if `True`, only the bars later than the
+        last bar of the previous ingestion are downloaded and merged
+        with the bars of the previous ingestion
+
+        :param profiler: the profiler recording the stages of every
+        ingestion, see `ingest_profiler`. Besides the stages of
+        `ingester_base`, it records 'download', which includes the
+        retries and the waiting for the rate limiter, 'filter' and the
+        number of retries of every symbol.
+
+        :param validator: the validator of the new bars of every
+        symbol, see `bar_validator`. It runs after `filter_cb`.
+
+        :param resample_daily: if `True`, the minute bars are also
+        written as daily bars aggregated over the sessions of the
+        bundle calendar, so that a single minute bundle serves both
+        frequencies, see `ingester_base`.
+
+        :param shard: the shard of the symbols downloaded, see
+        `ingester_base`. Every shard must be given the same symbols.
+
+        :param exporter: the exporter of every ingestion to a parquet
+        dataset, see `ingester_base`
 
         :type exchange: str
         :type every_min_bar: bool
         :type symbol_list_env: str
         :type downloader: a callable that downloads price data
         :type symbol_list: an iterable container of str type
-        :type filter_cb: a callable that takes a data frame and return a data frame
-
+        :type filter_cb: a callable that takes a data frame and return a data frame, or str
+        :type max_workers: int
+        :type rate_limit: float or token_bucket
+        :type rate_limit_burst: float
+        :type retries: int
+        :type backoff: float
+        :type incremental: bool
+        :type profiler: ingest_profiler
+        :type validator: bar_validator
+        :type resample_daily: bool
+        :type shard: tuple of (int, int) or str
+        :type exporter: dataset_exporter
+        :type retry_on: tuple of type
+
+        :raise: ValueError when `resample_daily` is given for daily
+        bars, or `shard` is malformed
         """
-        super().__init__(exchange, every_min_bar)
+        super().__init__(exchange, every_min_bar, incremental, profiler, validator, resample_daily, shard, exporter)
         self._symbols = direct_ingester.create_symbol_list(symbol_list_env, symbol_list)
         self._downloader = downloader
-        self._filter=filter_cb
+        self._bound_downloader = None
+        self._filter_cb=filter_cb
+        self._filter_fn=None
+        self._max_workers=max_workers
+        if isinstance(rate_limit, token_bucket):
+            self._rate_limiter=rate_limit
+        else:
+            self._rate_limiter=token_bucket(rate_limit, rate_limit_burst) if rate_limit else None
+        self._retries=retries
+        self._backoff=backoff
+        self._retry_on=retry_on
 
     @staticmethod
     def create_symbol_list(symbol_list_env, symbol_list, show_progress=False):
@@ -338,7 +1806,7 @@ class direct_ingester(ingester_base):
         :param show_progress: if `True`, it will be verbose
         :type show_progress: bool
 
-        :return: the symbol list
+        :return: the symbol list, sorted by name
         :rtype: tuple of str
 
         """
@@ -358,51 +1826,147 @@ class direct_ingester(ingester_base):
                 log.warn("no symbol were added.")
             else:
                 log.info("price data of symbols {} to be ".format(symbols))
-        return tuple(symbols)
+        return tuple(sorted(symbols))
 
-    def _update_symbol_metadata(self, symbol_index, symbol, df):
-        """update metadata for the given symbol
-
-        Metadata are extracted from the given dataframe `df`, which is
-        the price data read from csv file or downloaded via the firm
-        API. They are stored in `self._df_metadata[symbol_index]`
+    def _bind_downloader(self, cache):
+        """returns the downloader of the ingestion in progress
 
-        :param symbol_index: the symbol index
-        :param symbol: the symbol name
-        :param df: the dataframe storing symbol's price data
-
-        :type symbol_index: int
-        :type symbol: str
-        :type df: pandas.DataFrame
+        The downloader given to the constructor is bound to `cache`
+        and to the sessions of the ingestion, if it accepts them, and
+        left unchanged.
         """
-        start_date = df.index[0]
-        end_date = df.index[-1]
-        autoclose_date = end_date + pd.Timedelta(days=1)
-        self._df_metadata.iloc[symbol_index] = start_date, end_date, autoclose_date, symbol, self._exchange
+        downloader = self._downloader
+        bind_cache = getattr(downloader, 'bind_cache', None)
+        if bind_cache is not None:
+            downloader = bind_cache(cache)
+        bind_sessions = getattr(downloader, 'bind_sessions', None)
+        if bind_sessions is not None:
+            downloader = bind_sessions(*self._sessions)
+        return downloader
+
+    def _fetch(self, symbol, start_date=None):
+        """calls the downloader once, after taking a token from the rate limiter
+        """
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+        if start_date is None:
+            return self._bound_downloader(symbol)
+        return self._bound_downloader(symbol, start_date=start_date)
+
+    def _download(self, job):
+        """downloads and filters the price data of a single symbol
+
+        This is the unit of work run by the workers in
+        `self._read_and_convert`. Failing downloads are retried
+        `self._retries` times with exponential backoff, when they raise
+        one of `self._retry_on`.
+
+        :param job: the symbol index, the symbol name and the first
+        timestamp to download, which is `None` to download the whole
+        range of the downloader
+        :type job: tuple of (int, str, pandas.Timestamp)
+
+        :return: the symbol index, the symbol name and its price dataframe
+        :rtype: tuple of (int, str, pandas.DataFrame)
+        """
+        symbol_index, symbol, start_date = job
+        def on_retry(attempt, exp):
+            log.warning("downloading '{}' failed at attempt {}: {}".format(symbol, attempt + 1, exp))
+            self._profiler.retry(symbol)
+        with self._profiler.stage('download', symbol) as counts:
+            df_data = call_with_retries(self._fetch, (symbol, start_date), self._retries, self._backoff,
+                                        on_retry=on_retry, retry_on=self._retry_on)
+            counts['rows'] = 0 if df_data is None else len(df_data)
+        return symbol_index, symbol, self._filter_bars(symbol, df_data)
 
-    def _read_and_convert(self, calendar, show_progress):
+    @staticmethod
+    def _batches(jobs, batch_size):
+        """groups consecutive jobs of `self._download` with the same first timestamp into batches of up to
+        `batch_size` jobs
+        """
+        batch = []
+        for job in jobs:
+            if batch and (len(batch) == batch_size or batch[-1][2] != job[2]):
+                yield batch
+                batch = []
+            batch.append(job)
+        if batch:
+            yield batch
+
+    def _download_batch(self, batch):
+        """downloads and filters the price data of a batch of symbols by a single call to a batch downloader
+
+        This is the unit of work run by the workers in
+        `self._read_and_convert` for batch downloaders. The call is
+        retried as a whole, and its wall and cpu times are shared
+        evenly by the symbols of the batch in the profiler.
+
+        :param batch: the jobs of the symbols, see `self._download`,
+        which have the same first timestamp
+        :type batch: list of tuple of (int, str, pandas.Timestamp)
+
+        :return: the symbol index, the symbol name and the price dataframe of every symbol of the batch
+        :rtype: list of tuple of (int, str, pandas.DataFrame)
+        """
+        symbols = [symbol for _, symbol, _ in batch]
+        def on_retry(attempt, exp):
+            log.warning("downloading {} symbols from '{}' failed at attempt {}: {}".format(
+                len(symbols), symbols[0], attempt + 1, exp))
+            for symbol in symbols:
+                self._profiler.retry(symbol)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        frames = call_with_retries(self._fetch, (symbols, batch[0][2]), self._retries, self._backoff,
+                                   on_retry=on_retry, retry_on=self._retry_on) or {}
+        wall, cpu = (time.perf_counter() - wall) / len(batch), (time.thread_time() - cpu) / len(batch)
+        downloaded = []
+        for symbol_index, symbol, _ in batch:
+            df_data = frames.get(symbol)
+            self._profiler.record('download', symbol, wall, cpu, 0 if df_data is None else len(df_data))
+            downloaded.append((symbol_index, symbol, self._filter_bars(symbol, df_data)))
+        return downloaded
+
+    def _read_and_convert(self, symbols, calendar, show_progress):
         """returns the generator of symbol index and the dataframe storing its price data
+
+        Symbols are downloaded by `self._download` in a thread pool of
+        `self._max_workers` workers, while the dataframes are yielded
+        in the symbol order. Batch downloaders are given consecutive
+        symbols by `self._download_batch` instead. In incremental
+        mode, only the bars after the previous ingestion are
+        downloaded and merged with it.
+
+        :param symbols: the sid and the name of the symbols to
+        download, see `self._assign_sids`
+        :type symbols: list of tuple of (int, str)
         """
         assert self._symbols, (
             f"Symbol list for bundle {self._exchange} is empty. Consider "
             "setting the proper environment variable, or passing a symobol "
             "list at bundle registration time."
         )
+        bar_step = pd.Timedelta(minutes=1) if self._every_min_bar else pd.Timedelta(days=1)
+        def jobs():
+            for symbol_index, symbol in symbols:
+                last_bar = self._last_bar(symbol)
+                yield symbol_index, symbol, None if last_bar is None else last_bar + bar_step
+        batch_size = getattr(self._bound_downloader, 'batch_size', None) or 1
+        if batch_size > 1:
+            batches = ordered_map(self._download_batch, self._batches(jobs(), batch_size), self._max_workers)
+            downloaded = (item for batch in batches for item in batch)
+        else:
+            downloaded = ordered_map(self._download, jobs(), self._max_workers)
         with maybe_show_progress(
-                self._symbols,
+                downloaded,
                 show_progress,
                 label=f"Downloading from {self._exchange}: ",
-                length=len(self._symbols),
-                item_show_func=lambda s: s,
+                length=len(symbols),
+                item_show_func=lambda item: item[1] if item else None,
         ) as it:
-            for symbol_index, symbol in enumerate(it):
-                # read data from csv file and set the index
-                df_data = self._downloader(symbol)
-                # apply filter when it is provided
-                if self._filter is not None:
-                    df_data = self._filter(df_data)
-                self._update_symbol_metadata(symbol_index, symbol, df_data)
-                yield symbol_index, df_data
+            for symbol_index, symbol, df_data in it:
+                # the workers filtered the bars while downloading them
+                df_data = self._convert(symbol_index, symbol, df_data, filtered=True)
+                if df_data is not None:
+                    yield symbol_index, df_data
 
     def __call__(self,
                  environ,
@@ -419,21 +1983,32 @@ class direct_ingester(ingester_base):
         """implements the actual ingest function
 
         The order of calls are as follows
-        1. `create_metadata()`
-        2. `self._read_and_convert()`
+        1. `self._assign_sids()`
+        2. `self._start_conversion()`, which opens the previous
+           ingestion and creates the filter
+        3. `self._bind_downloader()`, which calls `bind_cache()` and
+           `bind_sessions()` of the downloader, if it has them
+        4. `open()` of the bound downloader, if it has a lifecycle
+        5. `self._write()` of the bars of `self._read_and_convert()`
+        6. `close()` of the bound downloader, even if the ingestion fails
+        7. `ingestion_shard.save()` if the ingestion is sharded
         """
-        if show_progress:
-            log.info('symbols are: {0}'.format(self._symbols))
-        self._df_metadata=create_metadata(len(self._symbols))
-        if show_progress:
-            log.info('writing data...')
-        if self._every_min_bar:
-            minute_bar_writer.write(self._read_and_convert(calendar, show_progress), show_progress=show_progress)
-        else:
-            daily_bar_writer.write(self._read_and_convert(calendar, show_progress), show_progress=show_progress)
-        if show_progress:
-            log.info('meta data:\n{0}'.format(self._df_metadata))
-        asset_db_writer.write(equities=self._df_metadata)
-        adjustment_writer.write()
+        with self._ingestion(start_session, end_session, environ, output_dir):
+            symbols = self._assign_sids(self._symbols)
+            self._start_conversion(symbols, calendar, output_dir, show_progress)
+            self._bound_downloader = self._bind_downloader(cache)
+            open_downloader = getattr(self._bound_downloader, 'open', None)
+            if open_downloader is not None:
+                open_downloader()
+            try:
+                self._write(self._read_and_convert(symbols, calendar, show_progress), asset_db_writer,
+                            minute_bar_writer, daily_bar_writer, adjustment_writer, calendar, show_progress)
+            finally:
+                close_downloader = getattr(self._bound_downloader, 'close', None)
+                if close_downloader is not None:
+                    close_downloader()
+            self._finish_ingestion(show_progress, output_dir)
         if show_progress:
             log.info('writing completed')
+
+
@@ -0,0 +1,227 @@
+import os
+import time
+import pandas as pd
+import hashlib
+import json
+#
+from .csvio import _csv_suffix, _comparable
+
+class csv_manifest:
+    """the index of the csv files read by an incremental ingestion
+
+    Each file is recorded by its path relative to the csv directory
+    with its size, its modification time, the hash of its whole
+    content and the last bar of its symbol at the time it was
+    ingested. The index is stored in the ingestion directory, so
+    that the next ingestion skips the files left unchanged and reads
+    only the rows appended to the others. The upper bound of the rows
+    read by the ingestion is stored too, see `covers`.
+    """
+    FILE_NAME = 'csv_manifest.json'
+    # the number of bytes hashed at a time
+    HASH_BLOCK = 1 << 20
+
+    def __init__(self, entries=None, end=None, saved=None):
+        """
+        :param entries: the entries of the files, keyed by their relative path
+        :param end: the exclusive upper bound of the rows read, `None` if they are not bounded
+        :param saved: the time the manifest was saved, in seconds since the epoch
+        :type entries: dict
+        :type end: pandas.Timestamp
+        :type saved: float
+        """
+        self.entries = {} if entries is None else entries
+        self.end = end
+        self.saved = saved
+
+    @classmethod
+    def load(cls, ingestion_path):
+        """loads the manifest stored in an ingestion directory
+
+        :param ingestion_path: the ingestion directory
+        :type ingestion_path: str
+        :return: the manifest, or `None` if the ingestion has none
+        :rtype: csv_manifest
+        """
+        try:
+            with open(os.path.join(ingestion_path, cls.FILE_NAME)) as f:
+                manifest = json.load(f)
+            end = manifest.get('end')
+            return cls(manifest['files'], None if end is None else pd.Timestamp(end), manifest.get('saved'))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, ingestion_path):
+        """stores the manifest in an ingestion directory
+
+        The time it is saved is recorded, unless it is already known,
+        e.g. for the manifests merged from shards, see `merge_shards`.
+
+        :param ingestion_path: the ingestion directory
+        :type ingestion_path: str
+        """
+        file_path = os.path.join(ingestion_path, self.FILE_NAME)
+        if self.saved is None:
+            self.saved = time.time()
+        with open(file_path + '.tmp', 'w') as f:
+            json.dump({'version': 2, 'files': self.entries, 'end': None if self.end is None else str(self.end),
+                       'saved': self.saved}, f)
+        os.replace(file_path + '.tmp', file_path)
+
+    def covers(self, end):
+        """tells if the indexed files were read up to the exclusive upper bound `end`
+
+        The rows beyond the upper bound of the indexing ingestion were
+        not read, which matters only if that bound was in the past
+        when the manifest was saved. In that case the files left
+        unchanged must be read again by an ingestion with a later
+        upper bound.
+
+        :param end: the upper bound of the ingestion, `None` if the rows are not bounded
+        :type end: pandas.Timestamp
+        :rtype: bool
+        """
+        if self.end is None or self.saved is None or _comparable(self.end, 'UTC').timestamp() > self.saved:
+            return True
+        return end is not None and _comparable(end, self.end.tz) <= self.end
+
+    @classmethod
+    def content_hash(cls, file_path, size):
+        """returns the hash of the first `size` bytes of a file
+
+        The whole indexed content is hashed, so that a row rewritten
+        anywhere in a file that also grew is not taken for appended
+        rows.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            while size > 0:
+                block = f.read(min(size, cls.HASH_BLOCK))
+                if not block:
+                    break
+                digest.update(block)
+                size -= len(block)
+        return digest.hexdigest()
+
+    def status(self, f):
+        """tells how a csv file changed since it was indexed, without reading it
+
+        :param f: the csv file as found by `find_csv_files`
+        :type f: csv_file
+        :return: `'unchanged'`, `'appended'` if it is a plain csv file
+        that grew, or `'changed'` otherwise, which includes new files
+        :rtype: str
+        """
+        entry = self.entries.get(f.key)
+        if entry is None:
+            return 'changed'
+        if entry['size'] == f.size and entry['mtime'] == f.mtime:
+            return 'unchanged'
+        if f.size > entry['size'] and entry.get('hash') and isinstance(f.source, str) \
+           and _csv_suffix(f.source) == '.csv':
+            return 'appended'
+        return 'changed'
+
+    @classmethod
+    def is_appended(cls, f, entry):
+        """verifies that the indexed content of a grown file is left
+        intact and ends with a complete line
+
+        :param f: the csv file
+        :param entry: the manifest entry of `f`
+        :type f: csv_file
+        :type entry: dict
+        :rtype: bool
+        """
+        with open(f.source, 'rb') as stream:
+            stream.seek(entry['size'] - 1)
+            if stream.read(1) != b'\n':
+                return False
+        return cls.content_hash(f.source, entry['size']) == entry['hash']
+
+    def index(self, f, last, hash=None):
+        """records a csv file
+
+        :param f: the csv file
+        :param last: the last bar of its symbol
+        :param hash: the hash returned by `content_hash`, `None` for
+        compressed and archived files
+        :type f: csv_file
+        :type last: pandas.Timestamp
+        :type hash: str
+        """
+        self.entries[f.key] = {'size': f.size, 'mtime': f.mtime, 'hash': hash, 'last': str(last)}
+
+class ingestion_shard:
+    """the description of a shard stored in its ingestion directory
+
+    A sharded ingestion is run by several processes or machines, each
+    ingesting the symbols of its shard into its own ingestion
+    directory, see `ingester_base`. The description identifies the
+    shard and the universe and the sessions it was ingested from,
+    so that `merge_shards` only merges shards of the same ingestion.
+    """
+    FILE_NAME = 'shard.json'
+
+    def __init__(self, index, count, size, digest, start=None, end=None):
+        """
+        :param index: the index of the shard
+        :param count: the number of shards
+        :param size: the number of symbols of the universe
+        :param digest: the hash of the universe
+        :param start: the start session of the ingestion
+        :param end: the end session of the ingestion
+        :type index: int
+        :type count: int
+        :type size: int
+        :type digest: str
+        :type start: str
+        :type end: str
+        """
+        self.index = index
+        self.count = count
+        self.size = size
+        self.digest = digest
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def create(cls, shard, universe, sessions):
+        """describes shard `shard` of an ingestion of the sorted symbol universe `universe` within `sessions`
+        """
+        digest = hashlib.sha256('\n'.join(universe).encode('utf-8')).hexdigest()
+        start, end = (None if session is None else str(session) for session in sessions)
+        return cls(shard[0], shard[1], len(universe), digest, start, end)
+
+    @property
+    def ingestion(self):
+        """the attributes shared by all the shards of an ingestion"""
+        return self.count, self.size, self.digest, self.start, self.end
+
+    @classmethod
+    def load(cls, ingestion_path):
+        """loads the description stored in an ingestion directory
+
+        :param ingestion_path: the ingestion directory
+        :type ingestion_path: str
+        :return: the description, or `None` if the ingestion is not a shard
+        :rtype: ingestion_shard
+        """
+        try:
+            with open(os.path.join(ingestion_path, cls.FILE_NAME)) as f:
+                shard = json.load(f)
+            return cls(shard['index'], shard['count'], shard['size'], shard['digest'], shard.get('start'),
+                       shard.get('end'))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, ingestion_path):
+        """stores the description in an ingestion directory
+
+        :param ingestion_path: the ingestion directory
+        :type ingestion_path: str
+        """
+        os.makedirs(ingestion_path, exist_ok=True)
+        with open(os.path.join(ingestion_path, self.FILE_NAME), 'w') as f:
+            json.dump({'version': 1, 'index': self.index, 'count': self.count, 'size': self.size,
+                       'digest': self.digest, 'start': self.start, 'end': self.end}, f)
@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import threading
+import pandas as pd
+import contextlib
+import json
+try:
+    import resource
+except ImportError: # peak memory is reported on unix only
+    resource = None
+
+# the environment variable holding the path to which the profile of an ingestion is written
+PROFILE_ENV = 'ZIPLINE_BUNDLES_PROFILE'
+
+def timed_call(func, item):
+    """calls `func(item)` and measures it in the calling thread
+
+    It runs in the worker that does the call, which may be another
+    process, so that the timings are returned with the result.
+
+    :return: the result of `func(item)`, the wall time and the cpu
+    time of the call in seconds
+    :rtype: tuple
+    """
+    wall, cpu = time.perf_counter(), time.thread_time()
+    result = func(item)
+    return result, time.perf_counter() - wall, time.thread_time() - cpu
+
+def _peak_rss():
+    """returns the peak resident memory of this process and of its finished children in bytes, or `None`
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes, except on macos
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return unit * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+class ingest_profiler:
+    """collects the wall time, the cpu time, the rows and the bytes of
+    every stage of an ingestion, per symbol
+
+    Every ingester records its built-in stages, e.g. 'read', 'filter',
+    'merge', 'metadata' and 'write', in its profiler. A custom bundle
+    adds its own stages by creating a profiler in `extension.py`,
+    passing it to the ingester and using it in its callbacks:
+
+        profiler = ingest_profiler('/tmp/yahoo.prom')
+        def downloader(symbol, start_date=None):
+            with profiler.stage('request', symbol) as counts:
+                df = ...
+                counts['rows'] = len(df)
+            return df
+        register('yahoo', direct_ingester(..., downloader, profiler=profiler))
+
+    Cpu times are those of the thread running the stage, so the
+    threads started by a stage itself, e.g. by pyarrow, are left out.
+    Profilers are thread safe. A pickled profiler keeps only its path.
+    """
+    def __init__(self, path=None):
+        """creates a profiler
+
+        :param path: the file the report is written to at the end of
+        every ingestion, see `self.save`. Its default value `None`
+        means the path in environment variable `PROFILE_ENV` if it is
+        set, otherwise no report is written.
+        :type path: str
+        """
+        self._path = path
+        self.reset()
+
+    def __getstate__(self):
+        return {'_path': self._path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reset()
+
+    @property
+    def path(self):
+        """the file the report is written to, or `None`"""
+        return self._path or os.environ.get(PROFILE_ENV) or None
+
+    def reset(self, exchange=None):
+        """forgets the recorded stages and restarts the clock
+
+        :param exchange: the exchange of the ingester, reported as a label
+        :type exchange: str
+        """
+        self._lock = threading.Lock()
+        # [calls, wall, cpu, rows, bytes] keyed by (stage, symbol)
+        self._stages = {}
+        self._retries = {}
+        self._exchange = exchange
+        self._start = (time.perf_counter(), time.process_time())
+        self._elapsed = None
+
+    def record(self, name, symbol=None, wall=0., cpu=0., rows=0, nbytes=0):
+        """adds a measurement of a stage
+
+        :param name: the stage name
+        :param symbol: the symbol processed by the stage, `None` for
+        stages of the whole ingestion
+        :param wall: the wall time in seconds
+        :param cpu: the cpu time in seconds
+        :param rows: the number of rows processed
+        :param nbytes: the number of bytes read
+        :type name: str
+        :type symbol: str
+        :type wall: float
+        :type cpu: float
+        :type rows: int
+        :type nbytes: int
+        """
+        with self._lock:
+            totals = self._stages.setdefault((name, symbol), [0, 0., 0., 0, 0])
+            totals[0] += 1
+            totals[1] += wall
+            totals[2] += cpu
+            totals[3] += rows
+            totals[4] += nbytes
+
+    @contextlib.contextmanager
+    def stage(self, name, symbol=None):
+        """measures the block it enters as stage `name`
+
+        It yields a dictionary where the block may set the number of
+        'rows' it processed and of 'bytes' it read.
+
+        :param name: the stage name
+        :param symbol: the symbol processed by the stage
+        :type name: str
+        :type symbol: str
+        """
+        counts = {'rows': 0, 'bytes': 0}
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield counts
+        finally:
+            self.record(name, symbol, time.perf_counter() - wall, time.thread_time() - cpu,
+                        counts['rows'], counts['bytes'])
+
+    def timed_items(self, items, name):
+        """yields `items`, measuring the time their consumer takes for each of them as stage `name`
+
+        It measures the bar writers, which consume the bars yielded
+        by an ingester.
+        """
+        for item in items:
+            wall, cpu = time.perf_counter(), time.thread_time()
+            yield item
+            rows = len(item[1]) if isinstance(item, tuple) and hasattr(item[-1], '__len__') else 0
+            self.record(name, None, time.perf_counter() - wall, time.thread_time() - cpu, rows)
+
+    def retry(self, symbol=None):
+        """counts a retry of a failed call for `symbol`"""
+        with self._lock:
+            self._retries[symbol] = self._retries.get(symbol, 0) + 1
+
+    def finish(self):
+        """stops the clock of the ingestion"""
+        self._elapsed = (time.perf_counter() - self._start[0], time.process_time() - self._start[1])
+
+    def report(self):
+        """returns the recorded stages as a dictionary
+
+        The report holds the total wall and cpu time, the peak
+        resident memory in bytes, the number of retries, and the
+        totals of every stage, over all symbols and per symbol, in the
+        order they were first recorded. Rates are given in rows per
+        wall second.
+
+        :rtype: dict
+        """
+        elapsed = self._elapsed or (time.perf_counter() - self._start[0], time.process_time() - self._start[1])
+        with self._lock:
+            items = list(self._stages.items())
+            retries = dict(self._retries)
+        stages, symbols = {}, {}
+        for (name, symbol), (calls, wall, cpu, rows, nbytes) in items:
+            totals = stages.setdefault(name, {'calls': 0, 'wall': 0., 'cpu': 0., 'rows': 0, 'bytes': 0})
+            for key, value in zip(('calls', 'wall', 'cpu', 'rows', 'bytes'), (calls, wall, cpu, rows, nbytes)):
+                totals[key] += value
+            if symbol is not None:
+                symbols.setdefault(symbol, {})[name] = {'calls': calls, 'wall': wall, 'cpu': cpu, 'rows': rows,
+                                                        'bytes': nbytes}
+        for totals in stages.values():
+            totals['rows_per_sec'] = totals['rows'] / totals['wall'] if totals['wall'] > 0 else None
+        for symbol, count in retries.items():
+            if symbol is not None:
+                symbols.setdefault(symbol, {})['retries'] = count
+        return {'exchange': self._exchange, 'wall': elapsed[0], 'cpu': elapsed[1], 'peak_rss': _peak_rss(),
+                'retries': sum(retries.values()), 'stages': stages, 'symbols': symbols}
+
+    def to_frame(self):
+        """returns the recorded stages as a dataframe with one row per
+        stage and symbol, where the totals of every stage have an
+        empty symbol
+
+        :rtype: pandas.DataFrame
+        """
+        report = self.report()
+        columns = ['stage', 'symbol', 'calls', 'wall', 'cpu', 'rows', 'bytes', 'rows_per_sec']
+        rows = [dict(totals, stage=name, symbol='') for name, totals in report['stages'].items()]
+        for symbol, stages in report['symbols'].items():
+            rows.extend(dict(totals, stage=name, symbol=symbol) for name, totals in stages.items() if name != 'retries')
+        df = pd.DataFrame(rows, columns=columns)
+        df['rows_per_sec'] = df['rows'] / df['wall'].where(df['wall'] > 0)
+        return df
+
+    def to_prometheus(self, prefix='zipline_ingest'):
+        """returns the recorded stages in the text format of prometheus
+
+        :param prefix: the prefix of metric names
+        :type prefix: str
+        :rtype: str
+        """
+        report = self.report()
+        label = 'exchange="{}"'.format(report['exchange'] or '')
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.extend(['# HELP {}_{} {}'.format(prefix, name, help_text), '# TYPE {}_{} {}'.format(prefix, name, kind)])
+            lines.extend('{}_{}{{{}}} {}'.format(prefix, name, labels, value) for labels, value in samples)
+        stages = report['stages'].items()
+        for name, key, help_text in (('stage_seconds', 'wall', 'wall time spent in the stage'),
+                                     ('stage_cpu_seconds', 'cpu', 'cpu time spent in the stage'),
+                                     ('stage_rows_total', 'rows', 'rows processed by the stage'),
+                                     ('stage_bytes_total', 'bytes', 'bytes read by the stage'),
+                                     ('stage_calls_total', 'calls', 'calls of the stage')):
+            metric(name, 'counter', help_text,
+                   [('{},stage="{}"'.format(label, stage), totals[key]) for stage, totals in stages])
+        metric('retries_total', 'counter', 'retried calls', [(label, report['retries'])])
+        metric('duration_seconds', 'gauge', 'wall time of the ingestion', [(label, report['wall'])])
+        metric('cpu_seconds', 'gauge', 'cpu time of the ingestion process', [(label, report['cpu'])])
+        if report['peak_rss'] is not None:
+            metric('peak_rss_bytes', 'gauge', 'peak resident memory', [(label, report['peak_rss'])])
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path):
+        """writes the report to `path`, in the format given by its suffix
+
+        '.json' writes `self.report()`, '.csv' writes `self.to_frame()`
+        and '.prom' or '.txt' writes `self.to_prometheus()`.
+
+        :param path: the path to the report
+        :type path: str
+        :raise: ValueError when the suffix is unknown
+        """
+        suffix = os.path.splitext(path)[1]
+        if suffix == '.json':
+            with open(path, 'w') as f:
+                json.dump(self.report(), f, indent=2)
+        elif suffix == '.csv':
+            self.to_frame().to_csv(path, index=False)
+        elif suffix in ('.prom', '.txt'):
+            with open(path, 'w') as f:
+                f.write(self.to_prometheus())
+        else:
+            raise ValueError("unknown profile format '{}', use '.json', '.csv', '.prom' or '.txt'".format(suffix))
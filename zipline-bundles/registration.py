@@ -0,0 +1,82 @@
+import threading
+import importlib.util
+
+class deferred:
+    """a call that is made only when its result is needed
+
+    It defers the construction of ingesters and downloaders, so that
+    registering a bundle imports neither its modules nor their
+    third-party clients. The callable is given either as an object or
+    by its import path, e.g. 'zipline.data.bundles.yahoo:get_downloader',
+    whose module is imported when the call is made. Arguments that
+    are deferred calls themselves are resolved first.
+    """
+    def __init__(self, func, *args, **kwargs):
+        """defers calling `func` with `args` and `kwargs`
+
+        :param func: the callable, or its import path as '<module>:<name>'
+        :type func: callable or str
+        :raise: ValueError when the import path has no name
+        """
+        if isinstance(func, str) and ':' not in func:
+            raise ValueError("import path '{}' must be of the form '<module>:<name>'".format(func))
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+
+    @staticmethod
+    def _resolve_arg(arg):
+        return arg.resolve() if isinstance(arg, deferred) else arg
+
+    def resolve(self):
+        """imports the callable if needed and calls it
+
+        :return: the result of the call
+        """
+        func = self._func
+        if isinstance(func, str):
+            module, name = func.split(':', 1)
+            func = getattr(importlib.import_module(module), name)
+        return func(*[self._resolve_arg(arg) for arg in self._args],
+                    **{key: self._resolve_arg(arg) for key, arg in self._kwargs.items()})
+
+class lazy_ingester(deferred):
+    """ingest function creating its ingester when the bundle is ingested
+
+    It is registered in place of the ingester, e.g.
+
+        register('yahoo_direct',
+                 lazy_ingester(direct_ingester, 'YAHOO', every_min_bar=False, symbol_list_env='YAHOO_SYM_LST',
+                               downloader=deferred('zipline.data.bundles.yahoo:get_downloader',
+                                                   start_date='2010-01-01', end_date='2020-01-01')),
+                 calendar_name='NYSE')
+
+    so that the `zipline` commands which do not ingest the bundle,
+    e.g. `zipline run`, do not pay for importing its modules. The
+    ingester is created once, at the first ingestion, and reused by
+    the later ones.
+    """
+    def __init__(self, factory, *args, **kwargs):
+        """defers creating an ingester by `factory`
+
+        :param factory: the ingester class or any callable returning
+        an ingest function, or its import path as '<module>:<name>'
+        :param args: the positional arguments of `factory`, which may be `deferred`
+        :param kwargs: the keyword arguments of `factory`, which may be `deferred`
+        :type factory: callable or str
+        """
+        super().__init__(factory, *args, **kwargs)
+        self._ingester = None
+        self._lock = threading.Lock()
+
+    @property
+    def ingester(self):
+        """the ingester, which is created on first access"""
+        with self._lock:
+            if self._ingester is None:
+                self._ingester = self.resolve()
+            return self._ingester
+
+    def __call__(self, *args, **kwargs):
+        """creates the ingester if needed and runs it, see `ingester_base.__call__`"""
+        return self.ingester(*args, **kwargs)
@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import argparse
+import contextlib
+import numpy as np
+import pandas as pd
+#
+from logbook import Logger, StderrHandler
+#
+import zipline.utils.paths as pth
+try:
+    import pyarrow
+except ImportError: # parquet support is optional
+    pyarrow = None
+from zipline.data.bcolz_daily_bars import BcolzDailyBarReader
+from zipline.data.adjustments import SQLiteAdjustmentReader, SQLiteAdjustmentWriter
+from zipline.data.bundles.core import to_bundle_ingest_dirname
+import bcolz
+from .csvio import _arrow_modules
+from .manifest import csv_manifest, ingestion_shard
+from .incremental import ADJ_CLOSE_FILE
+from .export import DATASET_DIR, dataset_exporter
+
+log = Logger(__name__)
+
+def _link_or_copy(source, destination):
+    """hard links `source` to `destination`, or copies it when they are on different file systems"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+def _merge_daily_bars(paths, output_path):
+    """concatenates the daily bar tables at `paths` into the table at `output_path`
+
+    The columns are appended block by block as they are stored, and
+    the first and last rows of every sid are shifted by the rows of
+    the tables before its own.
+    """
+    tables = [bcolz.ctable(rootdir=path, mode='r') for path in paths]
+    names = tables[0].names
+    columns = {name: bcolz.carray(np.array([], dtype=tables[0].cols[name].dtype)) for name in names}
+    first_row, last_row, calendar_offset, first_days = {}, {}, {}, []
+    nrows = 0
+    for table in tables:
+        for name in names:
+            for block in bcolz.iterblocks(table.cols[name]):
+                columns[name].append(block)
+        first_row.update((sid, row + nrows) for sid, row in table.attrs['first_row'].items())
+        last_row.update((sid, row + nrows) for sid, row in table.attrs['last_row'].items())
+        calendar_offset.update(table.attrs['calendar_offset'])
+        if table.attrs['first_trading_day'] != pd.NaT.value:
+            first_days.append(table.attrs['first_trading_day'])
+        nrows += len(table)
+    merged = bcolz.ctable(columns=[columns[name] for name in names], names=names, rootdir=output_path, mode='w')
+    for attr in ('calendar_name', 'start_session_ns', 'end_session_ns'):
+        merged.attrs[attr] = tables[0].attrs[attr]
+    merged.attrs['first_trading_day'] = min(first_days) if first_days else pd.NaT.value
+    merged.attrs['first_row'] = first_row
+    merged.attrs['last_row'] = last_row
+    merged.attrs['calendar_offset'] = calendar_offset
+    merged.flush()
+
+def _merge_minute_bars(paths, output_path):
+    """links the minute bar tables of every sid at `paths` into `output_path` and merges their metadata
+    """
+    metadata = None
+    for path in paths:
+        with open(os.path.join(path, 'metadata.json')) as f:
+            shard_metadata = json.load(f)
+        if metadata is None:
+            metadata = shard_metadata
+        elif shard_metadata.get('ohlc_ratios_per_sid'):
+            metadata['ohlc_ratios_per_sid'] = {**(metadata.get('ohlc_ratios_per_sid') or {}),
+                                               **shard_metadata['ohlc_ratios_per_sid']}
+        for directory, _, file_names in os.walk(path):
+            relative = os.path.relpath(directory, path)
+            if relative == '.':
+                continue
+            os.makedirs(os.path.join(output_path, relative), exist_ok=True)
+            for file_name in file_names:
+                _link_or_copy(os.path.join(directory, file_name), os.path.join(output_path, relative, file_name))
+    os.makedirs(output_path, exist_ok=True)
+    with open(os.path.join(output_path, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f)
+
+def _merge_asset_dbs(paths, output_path):
+    """inserts the rows of the asset dbs at `paths` into a copy of the first one at `output_path`
+
+    The symbol mappings are renumbered, and the rows describing
+    exchanges and future roots are inserted once. The rows keyed by
+    sid must not collide.
+    """
+    shutil.copyfile(paths[0], output_path)
+    with contextlib.closing(sqlite3.connect(output_path)) as db:
+        tables = [name for name, in db.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                               "AND name NOT LIKE 'sqlite_%' AND name != 'version_info'")]
+        for path in paths[1:]:
+            db.execute('ATTACH DATABASE ? AS shard', (path,))
+            for table in tables:
+                info = db.execute('PRAGMA main.table_info("{}")'.format(table)).fetchall()
+                columns = ['"{}"'.format(column[1]) for column in info]
+                keys = [column[1] for column in info if column[5]]
+                values = list(columns)
+                if keys == ['id']:
+                    offset, = db.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM main."{}"'.format(table)).fetchone()
+                    values[columns.index('"id"')] = '"id" + {}'.format(offset)
+                conflict = '' if 'sid' in keys or keys == ['id'] else 'OR IGNORE '
+                db.execute('INSERT {}INTO main."{}" ({}) SELECT {} FROM shard."{}"'.format(
+                    conflict, table, ', '.join(columns), ', '.join(values), table))
+            db.commit()
+            db.execute('DETACH DATABASE shard')
+
+def _merge_adjustments(paths, output_path, daily_bars_path):
+    """writes the adjustments at `paths` into a single adjustment db at `output_path`
+
+    The events are written again, so that the dividend ratios are
+    computed from the merged daily bars at `daily_bars_path`, the
+    same way as by a single ingestion.
+    """
+    frames = {}
+    for path in paths:
+        reader = SQLiteAdjustmentReader(path)
+        try:
+            for table, df in reader.unpack_db_to_component_dfs(convert_dates=True).items():
+                if not df.empty:
+                    frames.setdefault(table, []).append(df)
+        finally:
+            reader.close()
+    def merged(table):
+        return pd.concat(frames[table], ignore_index=True) if table in frames else None
+    with SQLiteAdjustmentWriter(output_path, BcolzDailyBarReader(daily_bars_path), overwrite=True) as writer:
+        writer.write(splits=merged('splits'), mergers=merged('mergers'), dividends=merged('dividend_payouts'),
+                     stock_dividends=merged('stock_dividend_payouts'))
+
+def _merge_datasets(paths, output_path):
+    """merges the datasets exported by the shards at `paths` into the dataset at `output_path`
+
+    The bar partitions, which are per symbol, are hard linked, and
+    the other tables are concatenated in the order of the sids.
+    """
+    for frequency in ('daily', 'minute'):
+        for path in paths:
+            for parent, _, files in os.walk(os.path.join(path, frequency)):
+                destination = os.path.join(output_path, os.path.relpath(parent, path))
+                os.makedirs(destination, exist_ok=True)
+                for name in files:
+                    _link_or_copy(os.path.join(parent, name), os.path.join(destination, name))
+    os.makedirs(output_path, exist_ok=True)
+    _arrow_modules('parquet')
+    for name in dataset_exporter.TABLES:
+        files = [os.path.join(path, name + '.parquet') for path in paths]
+        tables = [pyarrow.parquet.read_table(file_path) for file_path in files if os.path.isfile(file_path)]
+        if tables:
+            table = pyarrow.concat_tables(tables, promote_options='permissive').sort_by('sid')
+            pyarrow.parquet.write_table(table, os.path.join(output_path, name + '.parquet'))
+
+def merge_shards(shard_paths, output_dir, show_progress=False):
+    """merges the ingestions of all the shards of an ingestion into the single ingestion `output_dir`
+
+    The shards hold disjoint sids of the same universe, see
+    `ingester_base`, so they are merged without reading their
+    sources or converting their bars again:
+
+    * the daily bars are concatenated column by column into a single
+      table, whose rows of every sid are shifted accordingly,
+    * the minute bars, which are stored per sid, are hard linked, or
+      copied if linking fails,
+    * the rows of the asset dbs are inserted into a single one,
+    * the splits, mergers and dividends are written again, so that
+      the dividend ratios are computed from the merged daily bars,
+    * the csv manifests, if any, are merged, so that the next
+      incremental ingestion of every shard skips the files left
+      unchanged,
+    * the last adjusted closes, if any, are merged, see `ADJ_CLOSE_FILE`,
+    * the datasets exported by `dataset_exporter`, if every shard
+      has one, are merged.
+
+    The merged ingestion is not a shard, so it is the one the next
+    incremental ingestion of a shard is merged with, see
+    `previous_ingestion.find`.
+
+    :param shard_paths: the ingestion directories of the shards, one per shard
+    :param output_dir: the directory of the merged ingestion, which
+    must not exist or be empty
+    :param show_progress: if `True`, it will be verbose
+    :type shard_paths: iterable of str
+    :type output_dir: str
+    :type show_progress: bool
+    :raise: ValueError when the shards are not all the shards of the
+    same ingestion, or `output_dir` is not empty
+    """
+    shards = []
+    for path in shard_paths:
+        shard = ingestion_shard.load(path)
+        if shard is None:
+            raise ValueError("'{}' is not the ingestion of a shard".format(path))
+        shards.append((shard.index, path, shard))
+    if not shards:
+        raise ValueError('there is no shard to merge')
+    if len({shard.ingestion for _, _, shard in shards}) > 1:
+        raise ValueError('the shards were not ingested from the same universe and sessions')
+    shards.sort(key=lambda item: item[0])
+    indices = [index for index, _, _ in shards]
+    if indices != list(range(shards[0][2].count)):
+        raise ValueError('the shards must be 0 to {} once each, got {}'.format(shards[0][2].count - 1, indices))
+    os.makedirs(output_dir, exist_ok=True)
+    if os.listdir(output_dir):
+        raise ValueError("'{}' is not empty".format(output_dir))
+    paths = [path for _, path, _ in shards]
+    if show_progress:
+        log.info('merging {} shards into \'{}\''.format(len(paths), output_dir))
+
+    daily = os.path.join(output_dir, 'daily_equities.bcolz')
+    _merge_daily_bars([os.path.join(path, 'daily_equities.bcolz') for path in paths], daily)
+    if all(os.path.isdir(os.path.join(path, 'minute_equities.bcolz')) for path in paths):
+        _merge_minute_bars([os.path.join(path, 'minute_equities.bcolz') for path in paths],
+                           os.path.join(output_dir, 'minute_equities.bcolz'))
+    # every version of the asset db written by zipline
+    for name in sorted(os.listdir(paths[0])):
+        if name.startswith('assets-') and name.endswith('.sqlite'):
+            _merge_asset_dbs([os.path.join(path, name) for path in paths], os.path.join(output_dir, name))
+    _merge_adjustments([os.path.join(path, 'adjustments.sqlite') for path in paths],
+                       os.path.join(output_dir, 'adjustments.sqlite'), daily)
+    manifests = [manifest for manifest in map(csv_manifest.load, paths) if manifest is not None]
+    if manifests:
+        merged = csv_manifest(end=manifests[0].end, saved=min(manifest.saved or 0 for manifest in manifests) or None)
+        for manifest in manifests:
+            merged.entries.update(manifest.entries)
+        merged.save(output_dir)
+    adj_closes = {}
+    for path in paths:
+        if os.path.isfile(os.path.join(path, ADJ_CLOSE_FILE)):
+            with open(os.path.join(path, ADJ_CLOSE_FILE)) as f:
+                adj_closes.update(json.load(f))
+    if adj_closes:
+        with open(os.path.join(output_dir, ADJ_CLOSE_FILE), 'w') as f:
+            json.dump(adj_closes, f)
+    if all(os.path.isdir(os.path.join(path, DATASET_DIR)) for path in paths):
+        _merge_datasets([os.path.join(path, DATASET_DIR) for path in paths], os.path.join(output_dir, DATASET_DIR))
+    if show_progress:
+        log.info('shards merged')
+
+def _latest_shard(bundle_path):
+    """returns the latest ingestion of a shard in bundle directory `bundle_path`
+
+    :raise: ValueError when the directory holds no ingestion of a shard
+    """
+    entries = sorted(entry for entry in (os.listdir(bundle_path) if os.path.isdir(bundle_path) else [])
+                     if not entry.startswith('.')
+                     and os.path.isfile(os.path.join(bundle_path, entry, ingestion_shard.FILE_NAME)))
+    if not entries:
+        raise ValueError("'{}' holds no ingestion of a shard".format(bundle_path))
+    return os.path.join(bundle_path, entries[-1])
+
+def merge_bundle_shards(name, shard_paths=None, environ=None, timestamp=None, show_progress=False, shard_roots=None):
+    """merges the shards of bundle `name` into a new ingestion of the bundle, see `merge_shards`
+
+    Shards ingested concurrently on the same host need their own
+    zipline root, because zipline removes the cache directory of a
+    bundle when an ingestion ends, so the shards are given either by
+    their ingestion directories or by their zipline roots.
+
+    :param name: the name of the bundle
+    :param shard_paths: the ingestion directories of the shards
+    :param environ: the environment giving the zipline root of the
+    merged ingestion
+    :param timestamp: the time of the merged ingestion, now by default
+    :param show_progress: if `True`, it will be verbose
+    :param shard_roots: the zipline roots the shards were ingested
+    into, whose latest ingestion of a shard of bundle `name` is merged
+    :type name: str
+    :type shard_paths: iterable of str
+    :type environ: mapping
+    :type timestamp: pandas.Timestamp
+    :type show_progress: bool
+    :type shard_roots: iterable of str
+    :return: the directory of the merged ingestion
+    :rtype: str
+    :raise: ValueError when no shard is given, a zipline root holds
+    no shard, or the shards are incomplete, see `merge_shards`
+    """
+    if shard_paths is None and shard_roots is None:
+        raise ValueError('the shards must be given by their ingestion directories or their zipline roots')
+    shard_paths = list(shard_paths or [])
+    shard_paths.extend(_latest_shard(pth.data_path([name], environ={'ZIPLINE_ROOT': shard_root}))
+                       for shard_root in shard_roots or [])
+    root = pth.data_path([name], environ=environ)
+    dir_name = to_bundle_ingest_dirname(pd.Timestamp.now(tz='UTC') if timestamp is None else timestamp)
+    # the merged ingestion is hidden from zipline until it is complete
+    working = os.path.join(root, '.merging-' + dir_name)
+    try:
+        merge_shards(shard_paths, working, show_progress)
+        os.rename(working, os.path.join(root, dir_name))
+    finally:
+        shutil.rmtree(working, ignore_errors=True)
+    return os.path.join(root, dir_name)
+
+def main(argv=None):
+    """runs the command line of the module, e.g. merging the shards of
+    bundle 'yahoo_direct' ingested by eight processes, each into its
+    own zipline root, with the extension of the default one:
+
+        for i in $(seq 0 7); do
+            ZIPLINE_ROOT=/tmp/shard$i ZIPLINE_SHARD=$i/8 zipline -e ~/.zipline/extension.py ingest -b yahoo_direct &
+        done; wait
+        python -m zipline.data.bundles.sharding merge yahoo_direct --roots /tmp/shard{0..7}
+    """
+    parser = argparse.ArgumentParser(prog='python -m zipline.data.bundles.sharding')
+    commands = parser.add_subparsers(dest='command', required=True)
+    merge = commands.add_parser('merge', help='merges the ingestions of the shards of a bundle, see merge_shards')
+    merge.add_argument('bundle', help='the name of the bundle')
+    merge.add_argument('shards', nargs='*', help='the ingestion directories of the shards')
+    merge.add_argument('--roots', nargs='+', default=[],
+                       help='the zipline roots of the shards, whose latest ingestion of a shard is merged')
+    merge.add_argument('--quiet', action='store_true', help='does not report the progress')
+    args = parser.parse_args(argv)
+    if not args.shards and not args.roots:
+        merge.error('the shards must be given by their ingestion directories or their zipline roots')
+    StderrHandler(level='INFO').push_application()
+    try:
+        path = merge_bundle_shards(args.bundle, args.shards, show_progress=not args.quiet, shard_roots=args.roots)
+    except ValueError as exp:
+        log.error('{}'.format(exp))
+        return 1
+    print(path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import os
+import numpy as np
+import pandas as pd
+#
+from logbook import Logger
+
+log = Logger(__name__)
+
+# the checks of `bar_validator` in the order they run, mapped to their description
+VALIDATION_CHECKS = {
+    'unsorted': 'timestamp earlier than a previous bar, or later than a next one',
+    'duplicate': 'timestamp repeated by a later bar',
+    'missing_price': 'open, high, low or close is nan',
+    'negative_price': 'open, high, low or close is negative',
+    'high_low': 'high lower than low, or open or close outside of them',
+    'negative_volume': 'volume is negative',
+    'zero_volume': 'volume is zero',
+}
+
+# what `bar_validator` does with the bars failing a check
+VALIDATION_POLICIES = ('ignore', 'drop', 'repair', 'fail', 'quarantine')
+
+_PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+
+def _sorted_mask(df, prices):
+    """flags bars whose removal leaves the timestamps sorted
+
+    The bars earlier than a previous bar, i.e. below the running
+    maximum of the timestamps, or the bars later than a next bar,
+    i.e. above the running minimum of the timestamps from the end,
+    are flagged, whichever are fewer. A single bar far out of order,
+    e.g. in the future, is thus flagged alone rather than with all
+    the bars after it.
+    """
+    ts = df.index.asi8
+    mask = np.zeros(len(ts), dtype=bool)
+    if len(ts) < 2 or (ts[1:] >= ts[:-1]).all():
+        return mask
+    early = mask.copy()
+    early[1:] = ts[1:] < np.maximum.accumulate(ts)[:-1]
+    mask[:-1] = ts[:-1] > np.minimum.accumulate(ts[::-1])[::-1][1:]
+    return early if early.sum() <= mask.sum() else mask
+
+def _price_values(df):
+    """returns the price columns of `df` as a 2-dimensional float array"""
+    return df[[column for column in _PRICE_COLUMNS if column in df.columns]].to_numpy(dtype=np.float64)
+
+def _volume_mask(df, compare):
+    """flags the bars whose volume satisfies `compare`"""
+    if 'volume' not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return compare(df['volume'].values)
+
+def _high_low_mask(df, prices):
+    """flags the bars whose high is not the highest price, or whose low is not the lowest"""
+    if 'high' not in df.columns or 'low' not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return (df['high'].values < prices.max(axis=1)) | (df['low'].values > prices.min(axis=1))
+
+def _repair_missing_price(df, mask):
+    """fills missing prices with the previous close, dropping the bars without any
+
+    Without a close column, the bars with a missing price are dropped.
+    """
+    if 'close' not in df.columns:
+        return df[~mask]
+    close = df['close'].ffill().shift()
+    df = df.copy()
+    for column in _PRICE_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].fillna(df['close']).fillna(close)
+    return df[~np.isnan(_price_values(df)).any(axis=1)]
+
+def _repair_high_low(df, mask):
+    """sets high and low to the highest and the lowest of open, high, low and close"""
+    prices = _price_values(df)
+    df = df.copy()
+    df['high'], df['low'] = prices.max(axis=1), prices.min(axis=1)
+    return df
+
+# the checks of `bar_validator`, mapped to the function flagging the
+# failing bars of a dataframe given its prices, and to the function
+# repairing them, which is `None` for the checks whose bars are
+# dropped by 'repair'
+_VALIDATION = {
+    'unsorted': (_sorted_mask, lambda df, mask: df.sort_index(kind='stable')),
+    'duplicate': (lambda df, prices: df.index.duplicated(keep='last'), lambda df, mask: df[~mask]),
+    'missing_price': (lambda df, prices: np.isnan(prices).any(axis=1), _repair_missing_price),
+    'negative_price': (lambda df, prices: (prices < 0).any(axis=1), None),
+    'high_low': (_high_low_mask, _repair_high_low),
+    'negative_volume': (lambda df, prices: _volume_mask(df, lambda volume: volume < 0), None),
+    'zero_volume': (lambda df, prices: _volume_mask(df, lambda volume: volume == 0), None),
+}
+
+class bar_validator:
+    """validates the bars of every symbol while they stream to the bar writer
+
+    Every check in `VALIDATION_CHECKS` flags the failing bars of a
+    dataframe by a few vectorized comparisons, so validating costs
+    far less than parsing or writing the bars. What happens to the
+    flagged bars depends on the policy of the check:
+
+    - 'ignore' keeps them, they are only counted
+    - 'drop' drops them
+    - 'repair' repairs them when the check has a repair and drops
+      them otherwise: unsorted bars are sorted, duplicated timestamps
+      keep their last bar, missing prices are filled with the
+      previous close, and high and low are widened to open and close
+    - 'fail' raises `ValueError` at the first flagged bar
+    - 'quarantine' drops them and appends them to file
+      '<symbol>.csv' in the quarantine directory, with the failed
+      check in column 'check'
+
+    The flagged bars of every check are counted in `self.summary()`.
+    """
+    def __init__(self, policy='drop', policies=None, quarantine_dir=None):
+        """creates a validator
+
+        :param policy: the policy of every check not given in `policies`
+        :param policies: the policy of some checks, keyed by check
+        name. Zero volume bars are ignored unless a policy is given
+        for 'zero_volume' here, since illiquid symbols and filled
+        sessions have them.
+        :param quarantine_dir: the directory of quarantined bars,
+        which is required by the 'quarantine' policy
+
+        :type policy: str
+        :type policies: dict mapping str to str
+        :type quarantine_dir: str
+
+        :raise: ValueError when a check or a policy is unknown, or
+        'quarantine' is given without `quarantine_dir`
+        """
+        policies = {'zero_volume': 'ignore', **(policies or {})}
+        unknown = set(policies) - set(VALIDATION_CHECKS)
+        if unknown:
+            raise ValueError('unknown validation checks {}, they must be in {}'.format(
+                sorted(unknown), tuple(VALIDATION_CHECKS)))
+        self._policies = {check: policies.get(check, policy) for check in VALIDATION_CHECKS}
+        for check, check_policy in self._policies.items():
+            if check_policy not in VALIDATION_POLICIES:
+                raise ValueError("unknown policy '{}' of check '{}', it must be one of {}".format(
+                    check_policy, check, VALIDATION_POLICIES))
+        if 'quarantine' in self._policies.values() and not quarantine_dir:
+            raise ValueError('the quarantine policy requires quarantine_dir')
+        self._quarantine_dir = quarantine_dir
+        self.reset()
+
+    def reset(self):
+        """forgets the counts of the previous ingestion"""
+        self._bars = 0
+        self._symbols = 0
+        self._flagged = {check: [0, 0] for check in VALIDATION_CHECKS}
+
+    def validate(self, df, symbol=None):
+        """runs every check on the bars of a symbol and applies their policies
+
+        :param df: the bars of the symbol
+        :param symbol: the symbol name used in errors and quarantine files
+        :type df: pandas.DataFrame
+        :type symbol: str
+        :return: the valid bars
+        :rtype: pandas.DataFrame
+        :raise: ValueError when a check with policy 'fail' flags a bar
+        """
+        if df is None or df.empty:
+            return df
+        self._bars += len(df)
+        self._symbols += 1
+        quarantined = []
+        prices = _price_values(df)
+        for check, (flag, repair) in _VALIDATION.items():
+            policy = self._policies[check]
+            mask = np.asarray(flag(df, prices))
+            if not mask.any():
+                continue
+            counts = self._flagged[check]
+            counts[0] += int(mask.sum())
+            counts[1] += 1
+            if policy == 'ignore':
+                continue
+            if policy == 'fail':
+                raise ValueError("{}: {} bars failed check '{}' ({}), the first at {}".format(
+                    symbol or 'price data', int(mask.sum()), check, VALIDATION_CHECKS[check], df.index[mask][0]))
+            if policy == 'quarantine':
+                quarantined.append(df[mask].assign(check=check))
+            if policy == 'repair' and repair is not None:
+                df = repair(df, mask)
+            else:
+                df = df[~mask]
+            if df.empty:
+                break
+            prices = _price_values(df)
+        if quarantined:
+            self._quarantine(pd.concat(quarantined), symbol)
+        return df
+
+    def _quarantine(self, df, symbol):
+        """appends the bars of `symbol` that failed a check to its quarantine file"""
+        os.makedirs(self._quarantine_dir, exist_ok=True)
+        file_path = os.path.join(self._quarantine_dir, '{}.csv'.format(symbol or 'unknown'))
+        df.to_csv(file_path, mode='a', header=not os.path.exists(file_path))
+
+    def summary(self):
+        """returns the number of validated bars and symbols, and the
+        number of bars and symbols flagged by every check with its policy
+
+        :rtype: dict
+        """
+        return {'bars': self._bars, 'symbols': self._symbols,
+                'checks': {check: {'bars': bars, 'symbols': symbols, 'policy': self._policies[check]}
+                           for check, (bars, symbols) in self._flagged.items()}}
+
+    def log_summary(self):
+        """logs the checks that flagged bars"""
+        for check, counts in self.summary()['checks'].items():
+            if counts['bars']:
+                log.warning("{} bars of {} symbols failed check '{}' ({}), policy '{}'".format(
+                    counts['bars'], counts['symbols'], check, VALIDATION_CHECKS[check], counts['policy']))
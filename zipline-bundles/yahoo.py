@@ -1,47 +1,132 @@
+import functools
 from yahoofinancials import YahooFinancials
 import pandas as pd
+from .downloads import pooled_session, shared_resource
 
+_PRICE_COLUMNS=['open', 'close', 'low', 'high', 'volume']
+
+def _local_dates(epochs, gmt_offset):
+    """converts epoch seconds into dates in the exchange time zone"""
+    return pd.to_datetime(pd.Index(epochs, dtype='int64') + gmt_offset, unit='s').normalize()
+
+def _events2series(events, value, index, gmt_offset, default):
+    """aligns dividend or split events to the price index
+
+    :param events: the events keyed by date, as given in `eventsData`
+    :param value: the callable computing the event value from the
+    events dataframe
+    :param index: the price index
+    :param gmt_offset: the exchange offset to UTC in seconds
+    :param default: the value on dates without event
+    :rtype: pandas.Series
+    """
+    if not events:
+        return pd.Series(default, index=index, dtype='float64')
+    df=pd.DataFrame.from_records(list(events.values()))
+    series=pd.Series(value(df).values.astype('float64'), index=_local_dates(df['date'], gmt_offset))
+    # several events of the same kind on one day are combined
+    series=series.groupby(level=0).agg('prod' if default == 1 else 'sum')
+    return series.reindex(index, fill_value=default)
+
+def prices2ohlcv(data):
+    """converts the historical price data of a symbol returned by
+    `YahooFinancials.get_historical_price_data` into pandas dataframe
+    complaint with OHLCV
+
+    The price records are converted in one go and their epoch dates
+    are converted in bulk. Dividends and splits are taken from
+    `eventsData` and stored in columns `dividend`, the amount paid per
+    share, and `split`, the number of new shares per old share.
+
+    Yahoo adjusts the prices, volumes and dividends before a split by
+    the split. Zipline adjusts them by the split written to the bundle
+    too, so they are unadjusted here by the splits after them, and
+    zipline does not divide them twice. Splits after the downloaded
+    range are not given in `eventsData`, so the prices are only
+    unadjusted by the splits within it.
+
+    :param data: the price data of a single symbol, i.e. the value of
+    the symbol key in the returned dictionary
+    :type data: dict
+    :rtype: pandas.DataFrame
+    """
+    gmt_offset=(data.get('timeZone') or {}).get('gmtOffset') or 0
+    prices=pd.DataFrame.from_records(data['prices'], columns=['date'] + _PRICE_COLUMNS)
+    df=prices[_PRICE_COLUMNS].set_axis(_local_dates(prices['date'], gmt_offset))
+    events=data.get('eventsData') or {}
+    df['dividend']=_events2series(events.get('dividends'), lambda e: e['amount'], df.index, gmt_offset, 0)
+    df['split']=_events2series(events.get('splits'), lambda e: e['numerator'] / e['denominator'], df.index, gmt_offset, 1)
+    # the cumulative ratio of the splits after every bar
+    factor=df['split'].iloc[::-1].cumprod().iloc[::-1].shift(-1, fill_value=1.)
+    if (factor != 1).any():
+        for column in ('open', 'close', 'low', 'high', 'dividend'):
+            df[column]=df[column] * factor
+        df['volume']=(df['volume'] / factor).round().astype(df['volume'].dtype)
+    return df
 
 def get_downloader(start_date,
                end_date,
-               granularity='daily',):
+               granularity='daily',
+               pool_size=10,):
     """returns a downloader closure for yahoo
+
+    The downloader has `open` and `close` methods, called by
+    `direct_ingester` at the beginning and the end of an ingestion.
+    Between them, all symbols are downloaded through a single HTTP
+    session, whose connections are kept alive. A downloader called
+    before `open` opens the session itself. Its `bind_sessions`
+    method, called by `direct_ingester` too, returns a new downloader
+    whose range is narrowed to the sessions of an ingestion, and
+    leaves this one unchanged.
+
     :param start_date: the first day on which dat are downloaded
     :param end_date: the last day on which data are downloaded
     :param granularity: the frequency of price data, 'D' for daily and 'M1' for 1-minute data
+    :param pool_size: the maximum number of connections kept alive,
+    which should not be less than the number of concurrent downloads
     :type start_date: str in format YYYY-MM-DD
     :type end_date: str in format YYYY-MM-DD
     :type granularity: str
+    :type pool_size: int
     """
+    dt_start, dt_end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    session=shared_resource(functools.partial(pooled_session, pool_size))
+
+    def bind_sessions(start_session, end_session):
+        """returns a downloader of the days from `start_session` to `end_session` within the range of this one"""
+        start, end = dt_start, dt_end
+        if start_session is not None:
+            start = max(start, pd.Timestamp(start_session).tz_localize(None).normalize())
+        if end_session is not None:
+            end = min(end, pd.Timestamp(end_session).tz_localize(None).normalize())
+        return get_downloader(start, end, granularity, pool_size)
 
-    def downloader(symbol):
+    def downloader(symbol, start_date=None):
         """downloads symbol price data using yahoo REST API
         :param symbol: the symbol name
+        :param start_date: the first day on which data are downloaded,
+        it overrides the one given to `get_downloader`
         :type symbol: str
+        :type start_date: str in format YYYY-MM-DD or pandas.Timestamp
         """
-        yf = YahooFinancials(symbol)
+        start, end = dt_start, dt_end
+        if start_date is not None:
+            start = max(start, pd.Timestamp(start_date).tz_localize(None))
+        if start > end:
+            return pd.DataFrame(columns=_PRICE_COLUMNS + ['dividend', 'split'],
+                                index=pd.DatetimeIndex([]))
 
-        res = yf.get_historical_price_data(str(start_date), str(end_date), granularity)
+        yf = YahooFinancials(symbol, session=session.open())
+
+        res = yf.get_historical_price_data(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), granularity)
 
         if not res or symbol not in res or 'prices' not in res[symbol]:
             raise ValueError('Fetching price data for "{}" failed.'.format(symbol))
 
-        prices=res[symbol]['prices']
-        df = pd.DataFrame({'open': [p['open'] for p in prices],
-                           'close': [p['close'] for p in prices],
-                           'low': [p['low'] for p in prices],
-                           'high': [p['high'] for p in prices],
-                           'volume': [p['volume'] for p in prices],}, index=[pd.Timestamp(d['formatted_date']) for d in prices])
-        if 'dividend' in prices:
-            df['dividend'] = [p['dividend'] for p in prices]
-        else:
-            df['dividend'] = 0
-
-        if 'split' in prices:
-            df['split'] = [p['split'] for p in prices]
-        else:
-            df['split'] = 1
-
-        return df
+        return prices2ohlcv(res[symbol])
 
+    downloader.cache_key=('yahoo', dt_start.strftime('%Y-%m-%d'), dt_end.strftime('%Y-%m-%d'), granularity)
+    downloader.open=session.open
+    downloader.bind_sessions=bind_sessions
+    downloader.close=session.close
     return downloader